@@ -1,35 +1,32 @@
 import os
+import sys
 
 from airtable import Airtable
 
-import requests
-from requests.packages.urllib3.util.retry import Retry
-from requests.adapters import HTTPAdapter
+from votesmart import (get_request, fetch_all, fetch_each, iter_records, parse_stream,
+    iter_chunks, get_bios, get_addresses, recording, fetch_workers, election_streams, stream_batch_size,
+    offices_url, states_url, districts_url, elections_state_year_url,
+    candidates_election_url, categories_url, sig_url, ratings_url,
+    candidate_ratings_url)
 
 from xml.etree import ElementTree
 
+import records
+
+from airtable_index import RecordIndex, KeySet
+from airtable_sync import TableSync, field_key
+from airtable_truncate import truncate_tables
+from airtable_writer import BatchWriter
+from checkpoint import Journal
+from districts import DistrictPlanner
+from pipeline import Pipeline
+
 
-vote_key = os.environ['VOTE_SMART_API_KEY']
 air_key = os.environ['AIR_TABLE_API_KEY']
 woman_up = os.environ['AIR_TABLE_WOMANUP']
 year = '2018'
 previous_year = '2017'
 
-# VOTE SMART END POINTS
-
-base_vote_url = 'http://api.votesmart.org'
-offices_url = base_vote_url + '/Office.getOfficesByType?key=' + vote_key
-states_url = base_vote_url + '/State.getStateIDs?key=' + vote_key
-districts_url = base_vote_url + '/District.getByOfficeState?key=' + vote_key
-elections_state_year_url = base_vote_url + '/Election.getElectionByYearState?key=' + vote_key
-candidates_election_url = base_vote_url + '/Candidates.getByElection?key=' + vote_key
-candidate_bio_url = base_vote_url + '/CandidateBio.getBio?key=' + vote_key
-categories_url = base_vote_url + '/Rating.getCategories?key=' + vote_key
-sig_url = base_vote_url + '/Rating.getSig?key=' + vote_key
-ratings_url = base_vote_url + '/Rating.getSigRatings?key=' + vote_key
-candidate_ratings_url = base_vote_url + '/Rating.getCandidateRating?key=' + vote_key
-candidate_address_url = base_vote_url + '/Address.getOfficeWebAddress?key=' + vote_key
-
 # WOMANUP TABLES
 
 states_table = Airtable(woman_up, 'states', air_key)
@@ -45,332 +42,471 @@ ratings_table = Airtable(woman_up, 'ratings', air_key)
 scores_table = Airtable(woman_up, 'scores', air_key)
 rating_categories = Airtable(woman_up, 'rating_categories', air_key)
 
-# GENERIC SESSION REQUEST
+# BATCHED WRITES
+# all inserts are buffered per table and created 10 at a time under one
+# rate limiter for the whole base. every stage flushes the writer when done.
+
+writer = BatchWriter(woman_up, air_key)
+
+# CHECKPOINTS
+# the long stages journal the elections / candidates they finish; after a crash,
+# rerun with --resume to skip them (see checkpoint.py).
+
+journal = Journal('.airtable-seed-journal.jsonl', resume='--resume' in sys.argv, flush=writer.flush,
+                  failures=lambda: len(writer.rejected))
+
+# ID RESOLUTION INDEXES
+# each index downloads its table's natural key -> record id mapping once and is
+# updated on insert, so linked record lookups don't need an Airtable query each.
+
+state_index = RecordIndex(states_table, 'stateId', writer)
+office_index = RecordIndex(offices_table, 'officeId', writer)
+office_type_index = RecordIndex(office_types_table, 'officeTypeId', writer)
+district_index = RecordIndex(districts_table, 'districtId', writer)
+election_index = RecordIndex(elections_table, 'electionId', writer)
+candidate_index = RecordIndex(candidates_table, 'candidateId', writer)
+category_index = RecordIndex(category_table, 'categoryId', writer)
+sig_index = RecordIndex(sigs_table, 'sigId', writer)
+rating_index = RecordIndex(ratings_table, 'ratingId', writer)
+
+indexes = {
+    'states': state_index,
+    'offices': office_index,
+    'office_types': office_type_index,
+    'districts': district_index,
+    'elections': election_index,
+    'candidates': candidate_index,
+    'categories': category_index,
+    'sigs': sig_index,
+    'ratings': rating_index,
+}
+
+def seeded(table_name):
+    ''' whether a table already has records, checked before a first-seed stage inserts them again '''
+    return any(page for page in indexes[table_name].table.get_iter(max_records=1))
+
+# INCREMENTAL SYNC
+# sync_prep() replaces the truncate in regular_update_prep(): the weekly tables
+# are upserted by natural key (only changed records are patched) and
+# sync_finish() deletes the records that are gone from vote smart.
+# listed in the order their leftovers are deleted, dependents first.
+
+sync_tables = [
+    (scores_table, ['candidateId', 'ratingId'], None),
+    (rating_categories, ['ratingId', 'categoryId'], None),
+    (addresses_table, ['candidateId', 'webAddressTypeId', 'webAddress'], None),
+    (candidates_table, ['candidateId', 'electionId'], candidate_index),
+    (ratings_table, ['ratingId'], rating_index),
+    (sigs_table, ['sigId'], sig_index),
+    (elections_table, ['electionId'], election_index),
+]
+
+syncs = {}
+
+def save(table, fields, index=None):
+    ''' insert a record, or upsert it by natural key while the table is being synced '''
+    table_sync = syncs.get(table.table_name)
+    if table_sync is not None:
+        table_sync.upsert(fields)
+    elif index is not None:
+        index.insert(fields)
+    else:
+        writer.insert(table.table_name, fields)
+
+def save_rating_category(rating_id, category_id):
+    ''' link a rating to a category, once per run: vote smart lists some categories of a rating several times '''
+    pair = (rating_id, category_id)
+    if pair in rating_category_pairs:
+        return
+    rating_category_pairs.add(pair)
+    save(rating_categories, {
+        'ratingId' : [ get_rating_id(rating_id) ],
+        'categoryId': [ get_category_id(category_id) ],
+    })
 
-def get_request(url, params=''):
-    s = requests.Session()
-    retries = Retry(total=5,
-                    backoff_factor=0.1,
-                    status_forcelist=[ 500, 502, 503, 504 ])
-    s.mount('http://', HTTPAdapter(max_retries=retries))
-    r = s.get(url, params=params)
-    return r
+def synced_values(table, field):
+    ''' key values upserted so far this sync, or None when the table isn't being synced '''
+    table_sync = syncs.get(table.table_name)
+    if table_sync is None:
+        return None
+    return table_sync.seen(field)
 
 # RETRIEVAL METHODS FOR ITERATORS
 
 def get_state_ids():
-    states = []
-    state_records = states_table.get_all()
-    for state in state_records:
-        state_id = state['fields']['stateId']
-        states.append(state_id)
-    return states
-
-def get_sig_ids():
-    sigs = []
-    sig_records = sigs_table.get_all()
-    for sig in sig_records:
-        sig_id = sig['fields']['sigId']
-        sigs.append(sig_id)
-    return sigs
-
-def get_rating_ids():
-    ratings = []
-    ratings_records = ratings_table.get_all()
-    for rating in ratings_records:
-        rating_id = rating['fields']['ratingId']
-        ratings.append(rating_id)
-    return ratings
+    return state_index.keys()
 
 def get_candidate_ids():
-    candidates = []
-    candidates_records = candidates_table.get_all()
-    for candidate in candidates_records:
-        candidate_id = candidate['fields']['candidateId']
-        candidates.append(candidate_id)
-    return candidates
+    # while syncing, candidates that vanished from vote smart are about to be deleted
+    synced = synced_values(candidates_table, 'candidateId')
+    if synced is not None:
+        return synced
+    return candidate_index.keys()
 
 def get_office_ids():
-    offices = []
-    offices_records = offices_table.get_all()
-    for office in offices_records:
-        office_id = office['fields']['officeId']
-        offices.append(office_id)
-    return offices
+    return office_index.keys()
 
-# ITERATORS
+# SEEDED KEYS
+# loaded from airtable on first use, not at import: a stage that never looks at
+# them doesn't pay for downloading their tables.
 
-states = get_state_ids()
-sigs = get_sig_ids()
-ratings = get_rating_ids()
-offices = get_office_ids()
+sigs = KeySet(sig_index)
+ratings = KeySet(rating_index)
+# (ratingId, categoryId) pairs linked this run
+rating_category_pairs = set()
 
 # AIRTABLE RETRIEVAL METHODS
 
 # METHODS TO COLLECT IDs OF RECORDS
 def get_sig_id(sig_id):
-    return sigs_table.match('sigId', sig_id)['id']
+    return sig_index.get(sig_id)
 
 def get_state_id(state_id):
-    return states_table.match('stateId', state_id)['id']
+    return state_index.get(state_id)
 
 def get_office_id(office_id):
-    return offices_table.match('officeId', office_id)['id']
+    return office_index.get(office_id)
 
 def get_district_id(district_id):
-    return districts_table.match('districtId', district_id)['id']
+    ''' None for a district district_seed didn't find; the candidate is written without the link '''
+    try:
+        return district_index.get(district_id)
+    except KeyError:
+        print('no district record for districtId ' + str(district_id))
+        return None
 
 def get_rating_id(rating_id):
-    return ratings_table.match('ratingId', rating_id)['id']
+    return rating_index.get(rating_id)
 
 def get_category_id(category_id):
-    return category_table.match('categoryId', category_id)['id']
+    return category_index.get(category_id)
 
 def get_candidate_id(candidate_id):
-    return candidates_table.match('candidateId', candidate_id)['id']
+    return candidate_index.get(candidate_id)
 
 def get_election_id(election_id):
-    return elections_table.match('electionId', election_id)['id']
-
-def get_office_id(office_id):
-    return offices_table.match('officeId', office_id)['id']
+    return election_index.get(election_id)
 
 def get_office_type_id(office_type_id):
-    return office_types_table.match('officeTypeId', office_type_id)['id']
+    return office_type_index.get(office_type_id)
 
 # METHODS FOR FIRST SEED (mostly static, only run when setting up)
 
 def office_seed():
     for office_type_id in ['P', 'C', 'G', 'S', 'K', 'L', 'J', 'M', 'N', 'H' ]:
         params = { 'officeTypeId' : office_type_id }
-        r = get_request(offices_url, params)
-        root = ElementTree.fromstring(r.content)
-        for office in root.iter('office'):
-            office_id = office.find('officeId').text
-            office_type_id = office.find('officeTypeId').text
-            office_level_id = office.find('officeLevelId').text
-            office_branch_id = office.find('officeBranchId').text
-            office_name = office.find('name').text
-
-            offices_table.insert({
+        for office in iter_records(offices_url, 'office', params):
+            office_fields = records.office.extract(office)
+            office_id = office_fields['officeId']
+            office_type_id = office_fields['officeTypeId']
+            office_level_id = office_fields['officeLevelId']
+            office_branch_id = office_fields['officeBranchId']
+            office_name = office_fields['name']
+
+            office_index.insert({
                 'officeId' : office_id,
                 'officeTypeId' : office_type_id,
                 'officeLevelId' : office_level_id,
                 'officeBranchId' : office_branch_id,
                 'officeName' : office_name,
             })
-
+    writer.flush()
 
 def state_seed():
-    r = requests.get(states_url)
-    root = ElementTree.fromstring(r.content)
-    for state in root.iter('state'):
-        state_id = state.find('stateId').text
-        name = state.find('name').text
-        states_table.insert({'stateId': state_id, 'name': name})
+    for state in iter_records(states_url, 'state'):
+        state_fields = records.state.extract(state)
+        state_id = state_fields['stateId']
+        name = state_fields['name']
+        state_index.insert({'stateId': state_id, 'name': name})
+    writer.flush()
 
 def category_seed():
-    r = requests.get(categories_url)
-    root = ElementTree.fromstring(r.content)
-    for category in root.iter('category'):
-        category_id = category.find('categoryId').text
-        category_name = category.find('name').text
-        category_table.insert(
+    for category in iter_records(categories_url, 'category'):
+        category_fields = records.category.extract(category)
+        category_id = category_fields['categoryId']
+        category_name = category_fields['name']
+        category_index.insert(
             {'categoryId': category_id,
              'name': category_name,
             })
+    writer.flush()
 
 def district_seed():
-    for state in states:
-        state_id_record = get_state_id(state)
-        for office in offices:
-            office_id_record = get_office_id(office)
-            params = { 'officeId' : office, 'stateId' : state }
-            r = get_request(districts_url, params)
-            root = ElementTree.fromstring(r.content)
-            for district in root.iter('district'):
-                district_id = district.find('districtId').text
-                district_name = district.find('name').text
-                print('inserting record for ' + district_name + ' in ' + state )
-                districts_table.insert({
-                    'districtId' : district_id,
-                    'districtName' : district_name,
-                    'officeId' : [ office_id_record ],
-                    'stateId' : [ state_id_record ],
-                })
+    # office records carry their level and branch, which is all the planner needs
+    office_records = {}
+    for page in offices_table.get_iter(fields=['officeId', 'officeLevelId', 'officeBranchId']):
+        for record in page:
+            office_records[str(record['fields'].get('officeId'))] = record['fields']
+    planner = DistrictPlanner(skip_empty=not recording())
+
+    # query every wanted (state, office) pair concurrently, inserting districts as responses arrive
+    def insert_districts(key, r):
+        state, office = key
+        root = ElementTree.fromstring(r.content)
+        planner.observe(state, office, root)
+        for district in root.iter('district'):
+            district_fields = records.district.extract(district)
+            district_id = district_fields['districtId']
+            district_name = district_fields['name']
+            print('inserting record for ' + district_name + ' in ' + state )
+            district_index.insert({
+                'districtId' : district_id,
+                'districtName' : district_name,
+                'officeId' : [ get_office_id(office) ],
+                'stateId' : [ get_state_id(state) ],
+            })
+
+    states = get_state_ids()
+    offices = get_office_ids()
+    jobs = [((state, office), { 'officeId' : office, 'stateId' : state })
+            for state in states for office in offices
+            if planner.wanted(state, office, office_records.get(office, {}))]
+    fetch_each(districts_url, jobs, insert_districts)
+    writer.flush()
+    planner.save()
+    print('district calls: {0}'.format(planner.report()))
 
 # METHODS FOR REGULAR UPDATING
 
-def sig_seed(sig_id):
-    params = {'sigId': sig_id}
-    r = get_request(sig_url, params)
+def sig_seed(sig_id, r):
     root = ElementTree.fromstring(r.content)
-    sig_id = root.find('sigId').text
-    state_id = root.find('stateId').text
-    name = root.find('name').text
-    description = root.find('description').text
+    sig_fields = records.sig.extract(root)
+    sig_id = sig_fields['sigId']
+    state_id = sig_fields['stateId']
+    name = sig_fields['name']
+    description = sig_fields['description']
     
     print('inserting sig record for ' + sig_id)
-    sigs_table.insert({
+    save(sigs_table, {
         'sigId': sig_id,
         'stateId': [ get_state_id(state_id) ],
         'name': name,
         'description': description,
-    })
+    }, sig_index)
     # update local store so don't repeat seed
-    sigs.append(sig_id)
-
-def rating_seed(sig_id):
-    params = {'sigId': sig_id}
-    r = get_request(ratings_url, params)
-    root = ElementTree.fromstring(r.content)
-    for rating in root.iter('rating'):
-        rating_id = rating.find('ratingId').text
-        time = rating.find('timespan').text
-        name = rating.find('ratingName').text
-        text = rating.find('ratingText').text
+    sigs.add(sig_id)
+
+def rating_seed(sig_id, r):
+    # r is the sig's whole Rating.getSigRatings list; ratings already seeded are skipped
+    for rating in parse_stream([r.content], 'rating'):
+        rating_fields = records.rating.extract(rating)
+        rating_id = rating_fields['ratingId']
+        if rating_id in ratings:
+            continue
+        time = rating_fields['timespan']
+        name = rating_fields['ratingName']
+        text = rating_fields['ratingText']
         if year in time or previous_year in time:
             
             print('inserting rating record for ' + str(rating_id))
-            ratings_table.insert({
+            save(ratings_table, {
                 'ratingId': rating_id,
                 'timespan': time,
                 'ratingName': name,
                 'ratingText': text,
                 'sigId': [ get_sig_id(sig_id) ],
-        })
+        }, rating_index)
         # update local store so don't repeat seed
-        ratings.append(rating_id)
+        ratings.add(rating_id)
 
 def candidate_ratings_seed():
-    candidate_ids = get_candidate_ids()
-    for candidate_id in candidate_ids:
-        candidate_id_record = get_candidate_id(candidate_id)
+    ''' in three phases: gather every candidate's recent ratings, seed the sigs and
+    ratings they name (each sig fetched once), then write the scores '''
+    if journal.finished('candidate_ratings_seed'):
+        return
+
+    # PHASE 1: each candidate's recent ratings, several candidates at once
+
+    # fetch: a candidate's ratings
+    def fetch(candidate_id):
         print('getting ratings for candidateId ' + candidate_id)
         params = {'candidateId': candidate_id}
-        r = get_request(candidate_ratings_url, params)
-        root = ElementTree.fromstring(r.content)
-        parent_ratings = root.findall('rating')
-        if parent_ratings: 
-            for rating in parent_ratings:
-                # return xml has nested 'rating' objects.
-                # so use findall which only finds objects that are direct children of root.
-                    
-                # prepare to seed ratings for the candidate
-                score = rating.find('rating').text
-                name = rating.find('ratingName').text
-                text = rating.find('ratingText').text
-                sig_id = rating.find('sigId').text
-                rating_id = rating.find('ratingId').text
-                time = rating.find('timespan').text
-
-                # seed info for recent ratings / sigs
-                if previous_year in time or year in time:
-                    # if it's a new sig, seed the information
-                    if sig_id not in sigs:
-                        sig_seed(sig_id)
-
-                    # if it's a new rating, seed the information
-                    if rating_id not in ratings:
-                        rating_seed(sig_id)
-                        
-                        # also seed the categories associated with the new rating
-                        # note, there are several duplicate categories for a single rating in the vote smart data
-                        # will have to clean up in our database ... 
-                        categories = rating.find('categories')
-                        for category in categories.iter('category'):
-                            category_id = category.find('categoryId').text
-                            rating_categories.insert({
-                                'ratingId' : [ get_rating_id(rating_id) ],
-                                'categoryId': [ get_category_id(category_id) ],
-                            })
-
-                    # write the candidate's rating info
-                    print('inserting ratings for candidateId ' + candidate_id)
-                    score_data_obj = {
-                        'ratingId': [ get_rating_id(rating_id) ],
-                        'sigId': [ get_sig_id(sig_id) ],
-                        'candidateId': [ candidate_id_record ],
-                        'score': score,
-                        'name': name,
-                        'text': text,
-                    }
+        yield candidate_id, get_request(candidate_ratings_url, params)
+
+    # parse: the recent ratings, with the categories of each
+    def parse(fetched):
+        candidate_id, r = fetched
+        # return xml has nested 'rating' objects.
+        # parse_stream only yields the outermost ones, the direct children of root.
+        for rating in parse_stream([r.content], 'rating'):
+            candidate_rating_fields = records.candidate_rating.extract(rating)
+            time = candidate_rating_fields['timespan']
+            if previous_year in time or year in time:
+                categories = rating.find('categories')
+                category_ids = [] if categories is None else [
+                    records.category.extract(category)['categoryId'] for category in categories.iter('category')
+                ]
+                yield candidate_id, candidate_rating_fields, category_ids
+
+    # gather: keep them until every candidate is in (one thread, no locking)
+    candidate_ratings = {}
+    def gather(parsed):
+        candidate_id, candidate_rating_fields, category_ids = parsed
+        candidate_ratings.setdefault(candidate_id, []).append((candidate_rating_fields, category_ids))
+
+    candidate_ids = [candidate_id for candidate_id in get_candidate_ids()
+                     if not journal.done('candidate_ratings_seed', candidate_id)]
+    pipeline = Pipeline('candidate_ratings_seed')
+    pipeline.stage('fetch', fetch, fetch_workers)
+    pipeline.stage('parse', parse)
+    pipeline.stage('gather', gather)
+    pipeline.run(candidate_ids)
+
+    # PHASE 2: the distinct new sigs, and the ratings of every sig with a new rating
+
+    seeded_sigs = set(sigs)
+    seeded_ratings = set(ratings)
+    all_sig_ids = {}
+    new_sig_ids = {}
+    rating_sig_ids = {}
+    # new rating id -> its category ids, repeats included (save_rating_category drops them)
+    rating_category_ids = {}
+    for rated in candidate_ratings.values():
+        for candidate_rating_fields, category_ids in rated:
+            sig_id = candidate_rating_fields['sigId']
+            rating_id = candidate_rating_fields['ratingId']
+            all_sig_ids[sig_id] = True
+            if sig_id not in seeded_sigs:
+                new_sig_ids[sig_id] = True
+            if rating_id not in seeded_ratings:
+                rating_sig_ids[sig_id] = True
+                rating_category_ids.setdefault(rating_id, []).extend(category_ids)
+
+    new_sig_ids = list(new_sig_ids)
+    rating_sig_ids = list(rating_sig_ids)
+    # a recorded snapshot gets every sig, so it replays into a sink without them
+    fetched_sig_ids = list(all_sig_ids) if recording() else new_sig_ids
+    fetched_rating_sig_ids = list(all_sig_ids) if recording() else rating_sig_ids
+    print('getting {0} new sigs and the ratings of {1} sigs'.format(len(new_sig_ids), len(rating_sig_ids)))
+    sig_responses = dict(zip(fetched_sig_ids, fetch_all(sig_url, [{'sigId': sig_id} for sig_id in fetched_sig_ids])))
+    rating_responses = dict(zip(fetched_rating_sig_ids,
+                                fetch_all(ratings_url, [{'sigId': sig_id} for sig_id in fetched_rating_sig_ids])))
+    for sig_id in new_sig_ids:
+        sig_seed(sig_id, sig_responses[sig_id])
+    for sig_id in rating_sig_ids:
+        rating_seed(sig_id, rating_responses[sig_id])
+
+    # also seed the categories associated with each new rating, once
+    for rating_id, category_ids in rating_category_ids.items():
+        for category_id in category_ids:
+            save_rating_category(rating_id, category_id)
+
+    # PHASE 3: each candidate's scores
+
+    for candidate_id in candidate_ids:
+        print('inserting ratings for candidateId ' + candidate_id)
+        for candidate_rating_fields, _ in candidate_ratings.get(candidate_id, []):
+            rating_id = candidate_rating_fields['ratingId']
+            score_data_obj = {
+                'ratingId': [ get_rating_id(rating_id) ],
+                'sigId': [ get_sig_id(candidate_rating_fields['sigId']) ],
+                'candidateId': [ get_candidate_id(candidate_id) ],
+                'score': candidate_rating_fields['rating'],
+                'name': candidate_rating_fields['ratingName'],
+                'text': candidate_rating_fields['ratingText'],
+            }
 
-                    print('inserting candidate rating score for rating ' + str(rating_id) + ' and candidate: ' + str(candidate_id))
-                    scores_table.insert(score_data_obj)
+            print('inserting candidate rating score for rating ' + str(rating_id) + ' and candidate: ' + str(candidate_id))
+            save(scores_table, score_data_obj)
+        journal.complete('candidate_ratings_seed', candidate_id)
+    writer.flush()
+    journal.finish('candidate_ratings_seed')
 
 def election_seed():
-    for state in states:
-        state_record = get_state_id(state)
-        print('getting elections for state ' + state)
+    # fetch: every state's elections, several states at once
+    def fetch(state):
         params = { 'stateId': state, 'year': year }
-        r = get_request(elections_state_year_url, params)
+        yield state, get_request(elections_state_year_url, params)
+
+    # parse: election records linked to their state and office type
+    def parse(fetched):
+        state, r = fetched
+        state_record = get_state_id(state)
+        print('got elections for state ' + state)
         root = ElementTree.fromstring(r.content)
         for election in root.iter('election'):
-            election_id = election.find('electionId').text
-            election_name = election.find('name').text
-            office_type_id = election.find('officeTypeId').text
-            election_data_obj = {
+            election_fields = records.election.extract(election)
+            election_id = election_fields['electionId']
+            election_name = election_fields['name']
+            office_type_id = election_fields['officeTypeId']
+            yield {
                 'electionId': election_id,
                 'name': election_name,
                 'stateId': [ state_record ],
                 'officeTypeId': [ get_office_type_id(office_type_id) ],
                 }
 
-            print('inserting election record for election: ' + str(election_id))
-            elections_table.insert(election_data_obj)
+    # write
+    def write(election_data_obj):
+        print('inserting election record for election: ' + str(election_data_obj['electionId']))
+        save(elections_table, election_data_obj, election_index)
+
+    pipeline = Pipeline('election_seed')
+    pipeline.stage('fetch', fetch, fetch_workers)
+    pipeline.stage('parse', parse)
+    pipeline.stage('write', write)
+    pipeline.run(get_state_ids())
+    writer.flush()
 
 def candidate_seed():
+    if journal.finished('candidate_seed'):
+        return
     # TODO: refactor into iterator
     elections = elections_table.get_all()
-    # iterate through all current elections
-    for election in elections:
+    synced_elections = synced_values(elections_table, 'electionId')
+    if synced_elections is not None:
+        # skip elections that vanished from vote smart, they are deleted at the end of the sync
+        synced_elections = set(synced_elections)
+        elections = [e for e in elections if str(e['fields'].get('electionId')) in synced_elections]
+
+    # fetch: each election's candidates in chunks as the list streams in, with
+    # every chunk's bios fetched concurrently
+    def fetch(election):
         election_id = election['fields']['electionId']
-        election_id_record = election['id']
         print('getting candidates for electionId ' + election_id)
         params = { 'electionId': election_id }
-        r = get_request(candidates_election_url, params)
-        root = ElementTree.fromstring(r.content)
-        for candidate in root.iter('candidate'):
-
+        candidate_stream = iter_records(candidates_election_url, 'candidate', params)
+        for candidates in iter_chunks(candidate_stream, stream_batch_size):
+            bios = get_bios([candidate.find('candidateId').text for candidate in candidates])
+            yield election, candidates, bios
+
+    # parse: candidate records for the women of a chunk
+    def parse(fetched):
+        election, candidates, bios = fetched
+        election_id_record = election['id']
+        candidate_records = []
+        for candidate, bio_fields in zip(candidates, bios):
             # capture candidate election information
-            candidate_id = candidate.find('candidateId').text
-            election_stage = candidate.find('electionStage').text
-            election_state_id = candidate.find('electionStateId').text
-            election_office_id = candidate.find('electionOfficeId').text
-            election_date = candidate.find('electionDate').text
-            election_parties = candidate.find('electionParties').text
-            election_status = candidate.find('electionStatus').text
-            election_district_id = candidate.find('electionDistrictId').text
-            election_state_id = candidate.find('electionStateId').text
-            office_id = candidate.find('officeId').text # 'State House'
-            office_district_id = candidate.find('officeDistrictId').text # '20496'
-            office_state_id = candidate.find('officeStateId').text
-            office_status = candidate.find('officeStatus').text # 'active'
-            office_parties = candidate.find('officeParties').text
-        
-            # get candidate's detailed bio
-            print('getting candidate detailed bio for candidateId ' + candidate_id)
-            params = { 'candidateId': candidate_id }
-            r = get_request(candidate_bio_url, params)
-            root = ElementTree.fromstring(r.content)
-            
+            candidate_fields = records.candidate.extract(candidate)
+            candidate_id = candidate_fields['candidateId']
+            election_stage = candidate_fields['electionStage']
+            election_state_id = candidate_fields['electionStateId']
+            election_office_id = candidate_fields['electionOfficeId']
+            election_date = candidate_fields['electionDate']
+            election_parties = candidate_fields['electionParties']
+            election_status = candidate_fields['electionStatus']
+            election_district_id = candidate_fields['electionDistrictId']
+            election_state_id = candidate_fields['electionStateId']
+            office_id = candidate_fields['officeId'] # 'State House'
+            office_district_id = candidate_fields['officeDistrictId'] # '20496'
+            office_state_id = candidate_fields['officeStateId']
+            office_status = candidate_fields['officeStatus'] # 'active'
+            office_parties = candidate_fields['officeParties']
+    
             # capture candidate bio data
-            candidate = root.find('candidate')
-            is_female = candidate.find('gender').text == 'Female'
-            photo = candidate.find('photo').text
-            first_name = candidate.find('firstName').text
-            last_name = candidate.find('lastName').text
-
-            # if office data, capture additional office data from bio & write it
-            office = root.find('office')
-            in_office = 'true' if office else ''
-            title = office.find('title').text if in_office else '' # 'Senator'
-            first_elect = office.find('firstElect').text if in_office else ''
-            last_elect = office.find('lastElect').text if in_office else ''
-            next_elect = office.find('nextElect').text if in_office else '' # 2018
-            term_start = office.find('termStart').text if in_office else '' # 11/10/1992
-            term_end = office.find('termEnd').text if in_office else ''
+            is_female = bio_fields['gender'] == 'Female'
+            photo = bio_fields['photo']
+            first_name = bio_fields['firstName']
+            last_name = bio_fields['lastName']
+
+            # if office data, capture additional office data from bio
+            in_office = bio_fields['inOffice']
+            title = bio_fields['title'] # 'Senator'
+            first_elect = bio_fields['firstElect']
+            last_elect = bio_fields['lastElect']
+            next_elect = bio_fields['nextElect'] # 2018
+            term_start = bio_fields['termStart'] # 11/10/1992
+            term_end = bio_fields['termEnd']
 
             # TODO: also grab lastElect
 
@@ -396,81 +532,128 @@ def candidate_seed():
                     }
 
             # inject linked records conditionally (cannot be None)
-            if election_district_id:
-                candidate_record_obj['electionDistrictId'] = [ get_district_id(election_district_id) ]
+            district_record_id = get_district_id(election_district_id) if election_district_id else None
+            if district_record_id:
+                candidate_record_obj['electionDistrictId'] = [ district_record_id ]
             if election_state_id:
                 candidate_record_obj['electionStateId'] =  [ get_state_id(election_state_id) ]
             if election_office_id:
                 candidate_record_obj['electionOfficeId'] = [ get_office_id(election_office_id) ]
             if office_id:
                 candidate_record_obj['officeId'] = [ get_office_id(office_id) ]
-            if office_district_id:
-                candidate_record_obj['officeDistrictId'] = [ get_district_id(office_district_id) ]
+            district_record_id = get_district_id(office_district_id) if office_district_id else None
+            if district_record_id:
+                candidate_record_obj['officeDistrictId'] = [ district_record_id ]
             if office_state_id:
                 candidate_record_obj['officeStateId'] = [ get_state_id(office_state_id) ]
-            
+        
             # if female, write to database
             if is_female:
-                print('inserting candidate record candidate: ' + str(candidate_id))
-                candidates_table.insert(candidate_record_obj)
+                candidate_records.append(candidate_record_obj)
+        return candidate_records
+
+    # write
+    def write(candidate_record_obj):
+        print('inserting candidate record candidate: ' + str(candidate_record_obj['candidateId']))
+        save(candidates_table, candidate_record_obj, candidate_index)
+
+    elections = [election for election in elections
+                 if not journal.done('candidate_seed', election['fields']['electionId'])]
+    pipeline = Pipeline('candidate_seed',
+                        on_unit_done=lambda election: journal.complete('candidate_seed', election['fields']['electionId']))
+    # election_streams elections at a time, each fetching its bios on fetch_workers threads
+    pipeline.stage('fetch', fetch, election_streams)
+    pipeline.stage('parse', parse)
+    pipeline.stage('write', write)
+    pipeline.run(elections)
+    writer.flush()
+    journal.finish('candidate_seed')
 
 
 def candidate_address_seed():
-    candidate_ids = get_candidate_ids()
-    for candidate_id in candidate_ids:
-        candidate_id_record = get_candidate_id(candidate_id)
-        params = { 'candidateId' : candidate_id }
-        r = get_request(candidate_address_url, params)
-        root = ElementTree.fromstring(r.content)
-        for address in root.iter('address'):
-            address_type_id = address.find('webAddressTypeId').text
-            address_type = address.find('webAddressType').text
-            address = address.find('webAddress').text
-            
-            address_data_obj = {
-                'candidateId' : [ candidate_id_record ],
-                'webAddressTypeId' : address_type_id,
-                'webAddressType' : address_type,
-                'webAddress' : address,
-            }
-   
-            print('inserting candidate address record for candidate: ' + str(candidate_id))
-            addresses_table.insert(address_data_obj)
+    if journal.finished('candidate_address_seed'):
+        return
+    candidate_ids = [candidate_id for candidate_id in get_candidate_ids()
+                     if not journal.done('candidate_address_seed', candidate_id)]
+    # fetched a batch at a time, and only once per run (firestore-seed.py asks for them too)
+    for batch in iter_chunks(candidate_ids, stream_batch_size):
+        for candidate_id, addresses in zip(batch, get_addresses(batch)):
+            candidate_id_record = get_candidate_id(candidate_id)
+            for address_fields in addresses:
+                address_type_id = address_fields['webAddressTypeId']
+                address_type = address_fields['webAddressType']
+                address = address_fields['webAddress']
+                
+                address_data_obj = {
+                    'candidateId' : [ candidate_id_record ],
+                    'webAddressTypeId' : address_type_id,
+                    'webAddressType' : address_type,
+                    'webAddress' : address,
+                }
+       
+                print('inserting candidate address record for candidate: ' + str(candidate_id))
+                save(addresses_table, address_data_obj)
+            journal.complete('candidate_address_seed', candidate_id)
+    writer.flush()
+    journal.finish('candidate_address_seed')
 
 # CLEAN UP METHODS
 
 def rating_categories_cleanup():
-    ''' because votesmart provides multiple category / rating associations, run this to clean up rating_categories table '''
-
-    all_rating_categories = rating_categories.get_all()
-    print(all_rating_categories)
-    uniques = dict()
-    for record in all_rating_categories:
-        airtable_id = record['id']
-        record_id = record['fields']['id']
-        rating_id = record['fields']['ratingId'][0]
-        category_id = record['fields']['categoryId'][0]
-        # determine uniqueness of record
-        if rating_id not in uniques:
-            uniques[rating_id] = [ category_id ]
-        elif rating_id in uniques and category_id not in uniques[rating_id]:
-            uniques[rating_id].append(category_id)
-        else:
-            # record not unique, delete from table
-            print('deleting record from rating_categories table')
-            rating_categories.delete(airtable_id)
+    ''' remove repeated category / rating associations from the rating_categories table,
+    e.g. ones written before seeding dropped them; the first record of each pair is kept '''
+    writer.flush()
+    uniques = set()
+    duplicate_ids = []
+    for page in rating_categories.get_iter(fields=['ratingId', 'categoryId']):
+        for record in page:
+            pair = field_key(record['fields'], ['ratingId', 'categoryId'])
+            if pair is None:
+                continue
+            if pair in uniques:
+                duplicate_ids.append(record['id'])
+            else:
+                uniques.add(pair)
+    print('deleting {0} duplicate records from rating_categories table'.format(len(duplicate_ids)))
+    writer.delete(rating_categories.table_name, duplicate_ids)
 
 def regular_update_prep():
+    ''' truncate the weekly tables before reseeding them; sync_prep() is the incremental alternative '''
     tables_to_delete = [elections_table, candidates_table, addresses_table, sigs_table, ratings_table, rating_categories, scores_table]
-    for table in tables_to_delete: 
-    record_ids = []
-        records = table.get_all()
-        for record in records:
-            record_id = record['id']
-            record_ids.append(election_id)
-        table.batch_delete(record_ids)
+    print(truncate_tables(writer, [table.table_name for table in tables_to_delete]))
+    for index in [election_index, candidate_index, sig_index, rating_index]:
+        index.reset()
+    # the sigs and ratings tables are empty again, so reseed them as they come up
+    sigs.clear()
+    ratings.clear()
+    rating_category_pairs.clear()
+
+def sync_prep():
+    ''' sync the weekly tables by natural key instead of truncating them '''
+    for table, key_fields, index in sync_tables:
+        syncs[table.table_name] = TableSync(table, key_fields, writer, index)
+    # check every sig and rating against vote smart again so it counts as current
+    sigs.clear()
+    ratings.clear()
+    rating_category_pairs.clear()
+
+def sync_finish():
+    ''' delete the records vote smart no longer returns and end the sync '''
+    writer.flush()
+    if journal.resumed:
+        # units finished before the crash were not upserted again, so their
+        # records would look vanished; leave deletes to the next full sync
+        print('resumed run, not deleting vanished records')
+        syncs.clear()
+        return
+    for table, _, _ in sync_tables:
+        table_sync = syncs[table.table_name]
+        deleted = table_sync.delete_unseen()
+        print('synced {0}: {1}, {2} deleted'.format(table.table_name, table_sync.report(), deleted))
+    syncs.clear()
 
 # HOW TO SEED A NEW WOMAN UP DATABASE: 
+# (or run 'python seed.py' with the stages you need, see seed.py --help, instead of uncommenting)
 # 1. change year and previous_year variables accordingly.
 # 2. uncomment the below functions, as well as the functions below (for regular updates).
 # 3. run 'python seed.py' in terminal.
@@ -488,8 +671,11 @@ def regular_update_prep():
 # suggest running this script at least once per week to capture new elections and candidate information
 # 1. uncomment the below functions.
 # 2. run 'python seed.py' in terminal.
-# regular_update_prep()
-# print('TABLES CLEARED')
+# if a run dies part way, run 'python seed.py --resume' to carry on where it stopped.
+# records are updated in place; to clear the tables and reseed instead, run
+# regular_update_prep() in place of sync_prep() and skip sync_finish().
+# sync_prep()
+# print('SYNC STARTED')
 # election_seed()
 # print('ELECTION SEED DONE')
 # candidate_seed()
@@ -498,6 +684,8 @@ def regular_update_prep():
 # print('CANDIDATE ADDRESS SEED DONE')
 # candidate_ratings_seed()
 # print('CANDIDATE RATINGS SEED DONE')
+# sync_finish()
+# print('SYNC DONE')
 # rating_categories_cleanup()
 # print('CATEGORIES CLEANUP DONE')
 # print('WOMAN UP SEEDING COMPLETE')
@@ -506,14 +694,7 @@ def regular_update_prep():
 '''
 
 TODO:
-- clearing tables and reseeding for now, but when db is live we will want to update a record if it exists and insert if it doesn't
 - start working with data in Angular from airtable and determine if you need any db structre refinements
 - create table with summary stats (total # women, # running, # lost, # withdrawn, etc. ) and methods to write info as last step of seed.py
 
 '''
-
-
-
-
-
-
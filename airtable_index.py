@@ -0,0 +1,124 @@
+import threading
+
+
+class RecordIndex:
+    ''' natural key -> airtable record id for one table, loaded once and kept current on insert '''
+
+    def __init__(self, table, field, writer=None):
+        self.table = table
+        self.field = field
+        self.writer = writer
+        self.remote_calls = 0
+        self.lookups = 0
+        self._ids = None
+        self._lock = threading.RLock()
+
+    def _load(self):
+        ids = {}
+        # only pull the key field, page by page
+        for page in self.table.get_iter(fields=[self.field]):
+            self.remote_calls += 1
+            for record in page:
+                value = record['fields'].get(self.field)
+                if value is not None:
+                    ids.setdefault(str(value), record['id'])
+        self._ids = ids
+
+    def _ensure_loaded(self):
+        with self._lock:
+            if self._ids is None:
+                self._load()
+
+    def get(self, key):
+        ''' record id for key; raises KeyError if the table has no such record '''
+        self._ensure_loaded()
+        key = str(key)
+        with self._lock:
+            self.lookups += 1
+            if key in self._ids:
+                return self._ids[key]
+        # the record may still be buffered in the batch writer
+        if self.writer is not None and self.writer.pending(self.table.table_name):
+            self.writer.flush(self.table.table_name)
+            with self._lock:
+                if key in self._ids:
+                    return self._ids[key]
+        # inserted since the index was loaded by something other than this index
+        self.remote_calls += 1
+        record_id = self.table.match(self.field, key)['id']
+        with self._lock:
+            self._ids[key] = record_id
+        return record_id
+
+    def __contains__(self, key):
+        self._ensure_loaded()
+        with self._lock:
+            return str(key) in self._ids
+
+    def keys(self):
+        self._ensure_loaded()
+        with self._lock:
+            return list(self._ids)
+
+    def add(self, record):
+        ''' record an inserted airtable record so later lookups resolve locally '''
+        value = record['fields'].get(self.field)
+        if value is None:
+            return
+        with self._lock:
+            if self._ids is not None:
+                self._ids.setdefault(str(value), record['id'])
+
+    def insert(self, fields):
+        ''' insert through the batch writer when there is one; the id is indexed once it is flushed '''
+        if self.writer is not None:
+            self.writer.insert(self.table.table_name, fields, on_insert=self.add)
+            return None
+        record = self.table.insert(fields)
+        self.add(record)
+        return record
+
+    def reset(self):
+        ''' drop the mapping, e.g. after the table was truncated '''
+        with self._lock:
+            self._ids = None
+
+
+def index_stats(indexes):
+    ''' remote calls and local lookups served, per index name '''
+    return {name: {'remote_calls': index.remote_calls, 'lookups': index.lookups}
+            for name, index in indexes.items()}
+
+
+class KeySet:
+    ''' the natural keys of an index's table, e.g. the sigs already seeded; downloaded on first use '''
+
+    def __init__(self, index):
+        self.index = index
+        self._keys = None
+        self._lock = threading.Lock()
+
+    def _get_keys(self):
+        with self._lock:
+            if self._keys is None:
+                self._keys = set(self.index.keys())
+            return self._keys
+
+    def __contains__(self, key):
+        return str(key) in self._get_keys()
+
+    def __iter__(self):
+        return iter(list(self._get_keys()))
+
+    def __len__(self):
+        return len(self._get_keys())
+
+    def add(self, key):
+        self._get_keys()
+        with self._lock:
+            self._keys.add(str(key))
+
+    def clear(self):
+        ''' forget every key without downloading them, e.g. after the table was truncated '''
+        with self._lock:
+            self._keys = set()
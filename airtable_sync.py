@@ -0,0 +1,128 @@
+import hashlib
+import json
+import threading
+
+
+def _normalize(value):
+    # airtable leaves empty fields out of a record and may hand numbers back as
+    # numbers, so compare everything as text and drop what would come back empty
+    if isinstance(value, (list, tuple)):
+        return [str(v) for v in value]
+    return str(value)
+
+def content_hash(fields):
+    ''' hash of the non-empty fields of a record, stable across field order and airtable's typing '''
+    normalized = {k: _normalize(v) for k, v in fields.items() if v not in (None, '', [], False)}
+    return hashlib.sha1(json.dumps(normalized, sort_keys=True).encode('utf-8')).hexdigest()
+
+def field_key(fields, key_fields):
+    ''' natural key of a record; linked record fields contribute their first record id '''
+    key = []
+    for name in key_fields:
+        value = fields.get(name)
+        if isinstance(value, (list, tuple)):
+            value = value[0] if value else None
+        if value is None or value == '':
+            return None
+        key.append(str(value))
+    return tuple(key)
+
+
+class TableSync:
+    ''' upserts one table by natural key instead of truncating and reinserting it.
+
+    the existing records are downloaded once. upsert() skips records whose content
+    hash is unchanged, patches changed ones and inserts new ones through the batch
+    writer; delete_unseen() then removes whatever the run did not upsert.
+    '''
+
+    def __init__(self, table, key_fields, writer, index=None):
+        self.table = table
+        self.key_fields = tuple(key_fields)
+        self.writer = writer
+        self.index = index
+        self.counts = {'inserted': 0, 'updated': 0, 'unchanged': 0, 'duplicate': 0, 'deleted': 0}
+        self._existing = None
+        self._extra_ids = []
+        self._seen = set()
+        self._lock = threading.Lock()
+
+    def _load(self):
+        existing = {}
+        for page in self.table.get_iter():
+            for record in page:
+                key = field_key(record['fields'], self.key_fields)
+                if key is None or key in existing:
+                    # unmatchable or a duplicate of the same natural key; the
+                    # truncate flow would have removed it too
+                    self._extra_ids.append(record['id'])
+                else:
+                    existing[key] = (record['id'], record['fields'])
+        self._existing = existing
+
+    def _ensure_loaded(self):
+        with self._lock:
+            if self._existing is None:
+                self._load()
+
+    def upsert(self, fields):
+        key = field_key(fields, self.key_fields)
+        if key is None:
+            self.writer.insert(self.table.table_name, fields, on_insert=self._on_insert)
+            with self._lock:
+                self.counts['inserted'] += 1
+            return
+        self._ensure_loaded()
+        with self._lock:
+            if key in self._seen:
+                # vote smart repeats some records within a run, the first one wins
+                self.counts['duplicate'] += 1
+                return
+            self._seen.add(key)
+            current = self._existing.get(key)
+            if current is not None:
+                record_id, current_fields = current
+                # only compare the fields this run writes, not airtable's computed ones
+                current_fields = {name: current_fields.get(name) for name in fields}
+                if content_hash(current_fields) == content_hash(fields):
+                    self.counts['unchanged'] += 1
+                    return
+                self.counts['updated'] += 1
+            else:
+                self.counts['inserted'] += 1
+        if current is not None:
+            self.writer.update(self.table.table_name, record_id, fields)
+        else:
+            self.writer.insert(self.table.table_name, fields, on_insert=self._on_insert)
+
+    def _on_insert(self, record):
+        if self.index is not None:
+            self.index.add(record)
+
+    def seen(self, field):
+        ''' values of one key field for every record upserted so far '''
+        position = self.key_fields.index(field)
+        with self._lock:
+            return sorted({key[position] for key in self._seen})
+
+    def delete_unseen(self):
+        ''' delete the records this run did not upsert; nothing is deleted if nothing was upserted '''
+        self._ensure_loaded()
+        with self._lock:
+            if not self._seen:
+                print('nothing synced into {0}, not deleting its records'.format(self.table.table_name))
+                return 0
+            record_ids = [record_id for key, (record_id, _) in self._existing.items() if key not in self._seen]
+            record_ids += self._extra_ids
+            self._extra_ids = []
+        self.writer.flush(self.table.table_name)
+        self.writer.delete(self.table.table_name, record_ids)
+        with self._lock:
+            self.counts['deleted'] += len(record_ids)
+        if self.index is not None:
+            self.index.reset()
+        return len(record_ids)
+
+    def report(self):
+        with self._lock:
+            return dict(self.counts)
@@ -0,0 +1,67 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+# TABLE TRUNCATION
+# a full reseed empties the weekly tables first. every table gets its own thread,
+# which lists a page of record ids and deletes it 10 per request until the table is
+# empty. the calls go through the batch writer, so the tables share the base's
+# rate limit instead of each being emptied in turn.
+
+page_size = 100
+
+
+def truncate_tables(writer, table_names, progress_every=500):
+    ''' empty the tables concurrently; returns each table's deleted / rejected counts and throughput '''
+    table_names = list(table_names)
+    if not table_names:
+        return {}
+    with ThreadPoolExecutor(max_workers=len(table_names)) as executor:
+        reports = executor.map(lambda table_name: truncate_table(writer, table_name, progress_every), table_names)
+        return dict(zip(table_names, reports))
+
+def truncate_table(writer, table_name, progress_every=500):
+    ''' delete every record of one table, a page at a time '''
+    started = time.monotonic()
+    deleted = 0
+    reported = 0
+    requests = 0
+    tried = set()
+    offset = None
+    while True:
+        params = {'pageSize': page_size}
+        if offset:
+            params['offset'] = offset
+        r = writer.request('get', table_name, params=params)
+        r.raise_for_status()
+        requests += 1
+        page = r.json()
+        record_ids = [record['id'] for record in page['records'] if record['id'] not in tried]
+        if record_ids:
+            tried.update(record_ids)
+            deleted += writer.delete(table_name, record_ids)
+            requests += (len(record_ids) + writer.batch_size - 1) // writer.batch_size
+            # deleted records drop off the front, so start over from the first page
+            offset = None
+        else:
+            # the page only holds records airtable refused to delete, step past it
+            offset = page.get('offset')
+            if not offset:
+                break
+        if deleted - reported >= progress_every:
+            reported = deleted
+            print('truncating {0}: {1} deleted, {2} per second'.format(table_name, deleted, _rate(deleted, started)))
+
+    seconds = time.monotonic() - started
+    print('truncated {0}: {1} deleted in {2}s'.format(table_name, deleted, round(seconds, 1)))
+    return {
+        'deleted': deleted,
+        'rejected': len(tried) - deleted,
+        'requests': requests,
+        'seconds': round(seconds, 2),
+        'per_second': _rate(deleted, started),
+    }
+
+def _rate(count, started):
+    elapsed = time.monotonic() - started
+    return round(count / elapsed, 1) if elapsed else 0.0
@@ -0,0 +1,181 @@
+import threading
+import time
+from urllib.parse import quote
+
+import requests
+
+
+airtable_api_url = 'https://api.airtable.com/v0/'
+
+# airtable accepts at most 10 records per create / update / delete request and 5 requests per
+# second per base; going over the latter gets the base locked out for 30 seconds.
+max_batch_size = 10
+base_rate_limit = 5
+lockout_seconds = 30
+
+
+class RateLimiter:
+    ''' token bucket shared by every table of a base '''
+
+    def __init__(self, rate=base_rate_limit, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class BatchWriter:
+    ''' buffers inserts and updates per table and writes them in batches of up to 10 records '''
+
+    def __init__(self, base_key, api_key, limiter=None, batch_size=max_batch_size, max_delay=5.0):
+        self.base_key = base_key
+        self.batch_size = min(batch_size, max_batch_size)
+        self.max_delay = max_delay
+        self.limiter = limiter or RateLimiter()
+        self.session = requests.Session()
+        self.session.headers.update({'Authorization': 'Bearer ' + api_key})
+        self.rejected = []
+        self.counts = {}
+        self._pending = {}
+        self._first_pending = {}
+        self._updates = {}
+        self._lock = threading.RLock()
+
+    def table_url(self, table_name):
+        return airtable_api_url + self.base_key + '/' + quote(table_name)
+
+    def request(self, method, table_name, **kwargs):
+        ''' one rate limited call against a table, waiting out 429 lockouts '''
+        url = self.table_url(table_name)
+        while True:
+            self.limiter.acquire()
+            r = self.session.request(method, url, **kwargs)
+            if r.status_code != 429:
+                return r
+            print('airtable rate limit hit on {0}, waiting {1}s'.format(table_name, lockout_seconds))
+            time.sleep(lockout_seconds)
+
+    def insert(self, table_name, fields, on_insert=None):
+        ''' queue a record; on_insert(record) is called with the created record once it is flushed '''
+        with self._lock:
+            self._pending.setdefault(table_name, []).append((fields, on_insert))
+            self._first_pending.setdefault(table_name, time.monotonic())
+            if len(self._pending[table_name]) >= self.batch_size:
+                self._flush_table(table_name)
+            self._flush_stale()
+
+    def update(self, table_name, record_id, fields):
+        ''' queue a patch of an existing record '''
+        with self._lock:
+            updates = self._updates.setdefault(table_name, [])
+            updates.append({'id': record_id, 'fields': fields})
+            if len(updates) >= self.batch_size:
+                self._flush_updates(table_name)
+
+    def delete(self, table_name, record_ids):
+        ''' delete records right away, 10 per request; returns how many were deleted '''
+        counts = self._counts(table_name)
+        record_ids = list(record_ids)
+        deleted = 0
+        for i in range(0, len(record_ids), self.batch_size):
+            batch = record_ids[i:i + self.batch_size]
+            r = self.request('delete', table_name, params=[('records[]', record_id) for record_id in batch])
+            with self._lock:
+                counts['requests'] += 1
+                if r.ok:
+                    counts['deleted'] += len(batch)
+                    deleted += len(batch)
+                else:
+                    counts['rejected'] += len(batch)
+                    self.rejected.append({'table': table_name, 'delete': batch, 'status': r.status_code, 'error': r.text})
+            if not r.ok:
+                print('airtable rejected delete for {0}: {1} {2}'.format(table_name, r.status_code, r.text))
+        return deleted
+
+    def pending(self, table_name):
+        with self._lock:
+            return len(self._pending.get(table_name, []))
+
+    def flush(self, table_name=None):
+        ''' write everything buffered (for one table, or all of them), e.g. at the end of a stage '''
+        with self._lock:
+            table_names = [table_name] if table_name else list(self._pending)
+            for name in table_names:
+                self._flush_table(name)
+            table_names = [table_name] if table_name else list(self._updates)
+            for name in table_names:
+                self._flush_updates(name)
+
+    def _flush_stale(self):
+        now = time.monotonic()
+        for name, first in list(self._first_pending.items()):
+            if now - first >= self.max_delay:
+                self._flush_table(name)
+
+    def _flush_table(self, table_name):
+        pending = self._pending.pop(table_name, [])
+        self._first_pending.pop(table_name, None)
+        for i in range(0, len(pending), self.batch_size):
+            self._create(table_name, pending[i:i + self.batch_size])
+
+    def _flush_updates(self, table_name):
+        updates = self._updates.pop(table_name, [])
+        for i in range(0, len(updates), self.batch_size):
+            self._patch(table_name, updates[i:i + self.batch_size])
+
+    def _counts(self, table_name):
+        with self._lock:
+            return self.counts.setdefault(table_name, {'inserted': 0, 'updated': 0, 'deleted': 0, 'requests': 0, 'rejected': 0})
+
+    def _create(self, table_name, batch):
+        counts = self._counts(table_name)
+        counts['requests'] += 1
+        r = self.request('post', table_name, json={'records': [{'fields': fields} for fields, _ in batch]})
+        if r.ok:
+            for (_, on_insert), record in zip(batch, r.json()['records']):
+                counts['inserted'] += 1
+                if on_insert is not None:
+                    on_insert(record)
+            return
+        if len(batch) > 1:
+            # airtable rejects the whole request for one bad record, so retry the
+            # records one at a time to keep the good ones
+            for item in batch:
+                self._create(table_name, [item])
+            return
+        fields, _ = batch[0]
+        counts['rejected'] += 1
+        self.rejected.append({'table': table_name, 'fields': fields, 'status': r.status_code, 'error': r.text})
+        print('airtable rejected record for {0}: {1} {2}'.format(table_name, r.status_code, r.text))
+
+    def _patch(self, table_name, batch):
+        counts = self._counts(table_name)
+        counts['requests'] += 1
+        r = self.request('patch', table_name, json={'records': batch})
+        if r.ok:
+            counts['updated'] += len(batch)
+            return
+        if len(batch) > 1:
+            for record in batch:
+                self._patch(table_name, [record])
+            return
+        counts['rejected'] += 1
+        self.rejected.append({'table': table_name, 'id': batch[0]['id'], 'fields': batch[0]['fields'], 'status': r.status_code, 'error': r.text})
+        print('airtable rejected update for {0}: {1} {2}'.format(table_name, r.status_code, r.text))
+
+    def report(self):
+        with self._lock:
+            return {'tables': dict(self.counts), 'rejected': len(self.rejected)}
@@ -0,0 +1,101 @@
+''' per-record extraction cost: the old find().text chains vs the compiled records schemas.
+
+run from the repo root: python benchmarks/records_bench.py
+'''
+import os
+import sys
+import timeit
+from xml.etree import ElementTree
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import records
+
+
+# every child of a Candidates.getByElection <candidate>, in vote smart's order
+candidate_tags = [
+    'candidateId', 'firstName', 'nickName', 'middleName', 'preferredName',
+    'lastName', 'suffix', 'title', 'ballotName', 'electionParties',
+    'electionStatus', 'electionStage', 'electionDistrictId',
+    'electionDistrictName', 'electionOffice', 'electionOfficeId',
+    'electionStateId', 'electionOfficeTypeId', 'electionYear',
+    'electionSpecial', 'electionDate', 'officeParties', 'officeStatus',
+    'officeDistrictId', 'officeDistrictName', 'officeStateId', 'officeId',
+    'officeName', 'officeTypeId', 'runningMateId', 'runningMateName',
+]
+
+bio_candidate_tags = [
+    'candidateId', 'crpId', 'photo', 'firstName', 'nickName', 'middleName',
+    'preferredName', 'lastName', 'suffix', 'birthDate', 'birthPlace',
+    'pronunciation', 'gender', 'family', 'homeCity', 'homeState', 'education',
+    'profession', 'political', 'religion', 'congMembership', 'orgMembership',
+    'specialMsg',
+]
+
+bio_office_tags = [
+    'parties', 'title', 'shortTitle', 'name', 'type', 'status', 'firstElect',
+    'lastElect', 'nextElect', 'termStart', 'termEnd', 'district', 'districtId',
+    'stateId',
+]
+
+def element(tag, child_tags):
+    return '<{0}>{1}</{0}>'.format(tag, ''.join('<{0}>{0} value</{0}>'.format(t) for t in child_tags))
+
+candidate = ElementTree.fromstring(element('candidate', candidate_tags))
+bio_root = ElementTree.fromstring('<bio>{0}{1}</bio>'.format(
+    element('candidate', bio_candidate_tags), element('office', bio_office_tags)))
+
+def find_candidate():
+    # the chain candidate_seed used before records.py
+    return {
+        'candidateId': candidate.find('candidateId').text,
+        'electionStage': candidate.find('electionStage').text,
+        'electionStateId': candidate.find('electionStateId').text,
+        'electionOfficeId': candidate.find('electionOfficeId').text,
+        'electionDate': candidate.find('electionDate').text,
+        'electionParties': candidate.find('electionParties').text,
+        'electionStatus': candidate.find('electionStatus').text,
+        'electionDistrictId': candidate.find('electionDistrictId').text,
+        'officeId': candidate.find('officeId').text,
+        'officeDistrictId': candidate.find('officeDistrictId').text,
+        'officeStateId': candidate.find('officeStateId').text,
+        'officeStatus': candidate.find('officeStatus').text,
+        'officeParties': candidate.find('officeParties').text,
+    }
+
+def schema_candidate():
+    return records.candidate.extract(candidate)
+
+def find_bio():
+    bio = bio_root.find('candidate')
+    office = bio_root.find('office')
+    in_office = 'true' if len(office) else ''
+    return {
+        'gender': bio.find('gender').text,
+        'photo': bio.find('photo').text,
+        'firstName': bio.find('firstName').text,
+        'lastName': bio.find('lastName').text,
+        'title': office.find('title').text if in_office else '',
+        'firstElect': office.find('firstElect').text if in_office else '',
+        'lastElect': office.find('lastElect').text if in_office else '',
+        'nextElect': office.find('nextElect').text if in_office else '',
+        'termStart': office.find('termStart').text if in_office else '',
+        'termEnd': office.find('termEnd').text if in_office else '',
+    }
+
+def schema_bio():
+    office = bio_root.find('office')
+    in_office = 'true' if len(office) else ''
+    fields = records.bio.extract_child(bio_root)
+    fields.update(records.bio_office.extract(office if in_office else None))
+    return fields
+
+def per_record_us(func, number=20000, repeat=7):
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number * 1e6
+
+if __name__ == '__main__':
+    for name, old, new in [('candidate', find_candidate, schema_candidate), ('bio', find_bio, schema_bio)]:
+        old_us = per_record_us(old)
+        new_us = per_record_us(new)
+        print('{0:<10} find chain {1:6.2f} us/record   schema {2:6.2f} us/record   {3:.2f}x'.format(
+            name, old_us, new_us, old_us / new_us))
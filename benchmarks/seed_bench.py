@@ -0,0 +1,101 @@
+''' end to end seeding cost per stage, against the local vote smart stand-in (votesmart_server.py).
+
+each stage runs on its own, in dependency order, with the stand-in's counters
+reset before it: wall time, vote smart requests issued (retries of injected
+errors included), records served and records/second. vote smart never sees a
+request, but the sink does: this needs the sink's environment variables and
+libraries and writes to it, so point them at a scratch base / project.
+the response cache is off and district planning starts empty, so every run
+asks for the same thing.
+
+run from the repo root:
+    python benchmarks/seed_bench.py --sink airtable
+    python benchmarks/seed_bench.py --sink firestore --latency 40 --error-rate 0.02 --scale 3 ratings
+'''
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from votesmart_server import start
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='time each seeding stage against the vote smart stand-in')
+    parser.add_argument('targets', nargs='*', metavar='stage', help='stages to time, and the ones they need (default: all)')
+    parser.add_argument('--sink', default='airtable')
+    parser.add_argument('--only', action='store_true', help="don't also run the stages the targets depend on")
+    parser.add_argument('--latency', type=float, default=0.0, help='mean milliseconds before each response')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of requests answered with a 503')
+    parser.add_argument('--scale', type=float, default=1.0, help='multiplies the length of every list')
+    parser.add_argument('--pad', type=int, default=0, help='bytes of filler added to every record')
+    parser.add_argument('--json', metavar='FILE', help='also write the results to FILE')
+    return parser.parse_args(argv)
+
+def run(seeder, stand_in, names):
+    ''' {stage: {seconds, requests, errors, records, bytes, records_per_second}} '''
+    import seed
+
+    results = {}
+    for name in names:
+        stand_in.reset()
+        print('STAGE {0} STARTED'.format(name))
+        started = time.perf_counter()
+        getattr(seeder, seed.stages[name][0])()
+        seconds = time.perf_counter() - started
+        served = stand_in.reset()
+        result = {'seconds': round(seconds, 3)}
+        for count in ['requests', 'errors', 'records', 'bytes']:
+            result[count] = sum(endpoint[count] for endpoint in served.values())
+        result['records_per_second'] = round(result['records'] / seconds, 1) if seconds else 0.0
+        result['endpoints'] = {endpoint: counts['requests'] for endpoint, counts in served.items()}
+        results[name] = result
+    return results
+
+def report(results):
+    print('{0:<14} {1:>9} {2:>9} {3:>7} {4:>9} {5:>11} {6:>10}'.format(
+        'stage', 'seconds', 'requests', 'errors', 'records', 'records/s', 'kb'))
+    for name, result in results.items():
+        print('{0:<14} {1:>9} {2:>9} {3:>7} {4:>9} {5:>11} {6:>10}'.format(
+            name, result['seconds'], result['requests'], result['errors'], result['records'],
+            result['records_per_second'], result['bytes'] // 1024))
+    seconds = sum(result['seconds'] for result in results.values())
+    records = sum(result['records'] for result in results.values())
+    print('{0:<14} {1:>9} {2:>9} {3:>7} {4:>9} {5:>11}'.format(
+        'total', round(seconds, 3), sum(result['requests'] for result in results.values()),
+        sum(result['errors'] for result in results.values()), records,
+        round(records / seconds, 1) if seconds else 0.0))
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    server, stand_in, url = start(args.scale, args.pad, args.latency / 1000.0, args.error_rate)
+
+    # before votesmart.py is imported, it reads these once
+    os.environ['VOTE_SMART_URL'] = url
+    os.environ.setdefault('VOTE_SMART_API_KEY', 'stand-in')
+    os.environ['VOTE_SMART_NO_CACHE'] = '1'
+    os.environ['DISTRICT_EMPTY_PAIRS'] = os.path.join(tempfile.mkdtemp(), 'district-empty-pairs.json')
+
+    import seed
+
+    seeder = seed.load_seeder(args.sink)
+    available = seed.available_stages(seeder, args.sink)
+    unknown = [name for name in args.targets if name not in available]
+    if unknown:
+        sys.exit('{0} has no {1} stage'.format(args.sink, ', '.join(unknown)))
+    names = seed.select_stages(args.targets or available, available, args.only)
+    print('vote smart stand-in on {0}, seeding {1}: {2}'.format(url, args.sink, ', '.join(names)))
+
+    try:
+        results = run(seeder, stand_in, names)
+    finally:
+        server.shutdown()
+    report(results)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'args': vars(args), 'stages': results}, f, indent=2)
@@ -0,0 +1,96 @@
+''' startup cost of a seeder: seconds until it sends its first http request, and what it imported by then.
+
+every run is a fresh interpreter that loads the seeder and, if a stage is named,
+calls it. the first http request is intercepted instead of sent, so this needs the
+seeder's environment variables and libraries but makes no calls. vote smart's
+response cache is switched off so a cached response doesn't hide the request.
+
+run from the repo root: python benchmarks/startup_bench.py airtable-seed.py election_seed
+'''
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+import time
+
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sink_modules = ['airtable', 'firebase_admin', 'google.cloud']
+
+
+class FirstRequest(Exception):
+    pass
+
+def child(script, stage):
+    started = time.perf_counter()
+    first = {}
+
+    import requests
+    def send(session, request, **kwargs):
+        first.setdefault('seconds', time.perf_counter() - started)
+        first.setdefault('url', request.url.split('?')[0])
+        raise FirstRequest(request.url)
+    requests.Session.send = send
+
+    modules_before = len(sys.modules)
+    sys.path.insert(0, root)
+    spec = importlib.util.spec_from_file_location('seeder', os.path.join(root, script))
+    seeder = importlib.util.module_from_spec(spec)
+    try:
+        spec.loader.exec_module(seeder)
+    except FirstRequest:
+        pass
+    loaded = time.perf_counter() - started
+    during_import = 'seconds' in first
+    modules_loaded = len(sys.modules) - modules_before
+
+    if stage and not during_import:
+        try:
+            getattr(seeder, stage)()
+        except Exception:
+            # the intercepted request, surfacing wherever the stage made it
+            if 'seconds' not in first:
+                raise
+
+    return {
+        'load_seconds': loaded,
+        'first_request_seconds': first.get('seconds'),
+        'first_request_url': first.get('url'),
+        'request_during_import': during_import,
+        'modules_loaded': modules_loaded,
+        'sink_modules': [name for name in sink_modules if name in sys.modules],
+    }
+
+def run(script, stage, runs):
+    env = dict(os.environ, VOTE_SMART_NO_CACHE='1')
+    results = []
+    for _ in range(runs):
+        out = subprocess.check_output([sys.executable, os.path.abspath(__file__), '--child', script, stage or ''],
+                                      cwd=root, env=env, universal_newlines=True)
+        # the seeder may print too, the result is the last line
+        results.append(json.loads(out.strip().splitlines()[-1]))
+    return results
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--child']:
+        print(json.dumps(child(sys.argv[2], sys.argv[3] or None)))
+        sys.exit(0)
+
+    script = sys.argv[1] if len(sys.argv) > 1 else 'airtable-seed.py'
+    stage = sys.argv[2] if len(sys.argv) > 2 else None
+    runs = int(os.environ.get('STARTUP_BENCH_RUNS', 5))
+    results = run(script, stage, runs)
+    load = sorted(result['load_seconds'] for result in results)
+    firsts = sorted(result['first_request_seconds'] for result in results if result['first_request_seconds'] is not None)
+    last = results[-1]
+    print('{0} {1}'.format(script, stage or '(load only)'))
+    print('  load             median {0:.3f}s  min {1:.3f}s'.format(load[len(load) // 2], load[0]))
+    if firsts:
+        print('  first request    median {0:.3f}s  min {1:.3f}s  -> {2}{3}'.format(
+            firsts[len(firsts) // 2], firsts[0], last['first_request_url'],
+            ' (made while loading)' if last['request_during_import'] else ''))
+    else:
+        print('  first request    none')
+    print('  modules loaded   {0}, sink libraries: {1}'.format(
+        last['modules_loaded'], ', '.join(last['sink_modules']) or 'none'))
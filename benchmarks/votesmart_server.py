@@ -0,0 +1,332 @@
+''' local stand-in for the vote smart api: generated fixture xml for the eleven endpoints the seeders call.
+
+responses are made up but consistent (a candidate's ratings name sigs and ratings
+that Rating.getSig / Rating.getSigRatings know, districts exist only for
+legislative offices, ...) and the same request always gets the same response.
+
+    python benchmarks/votesmart_server.py --port 8765 --latency 40 --error-rate 0.01 --scale 2
+    VOTE_SMART_URL=http://localhost:8765 python seed.py --sink airtable
+
+GET /_stats returns requests, records and injected errors per endpoint as json.
+'''
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import urlparse, parse_qsl
+from xml.sax.saxutils import escape
+
+
+office_types = [
+    # officeTypeId, officeLevelId, officeBranchId
+    ('P', 'F', 'E'), ('C', 'F', 'L'), ('G', 'S', 'E'), ('S', 'S', 'E'), ('K', 'S', 'J'),
+    ('L', 'S', 'L'), ('J', 'F', 'J'), ('M', 'L', 'E'), ('N', 'L', 'L'), ('H', 'L', 'J'),
+]
+state_ids = ['AL', 'AK', 'AZ', 'CA', 'CO', 'FL', 'GA', 'NY', 'TX', 'WA', 'OR', 'NV', 'OH', 'MI', 'PA']
+web_address_types = [('1', 'Email'), ('2', 'Website - Campaign'), ('3', 'Webmail'), ('4', 'Website - Personal')]
+
+
+class Fixtures:
+    ''' list sizes grow with scale; pad adds that many bytes of filler to every record '''
+
+    def __init__(self, scale=1.0, pad=0):
+        self.scale = scale
+        self.pad = pad
+
+    def count(self, base):
+        return max(1, int(base * self.scale))
+
+    def states(self):
+        return state_ids[:min(len(state_ids), self.count(10))]
+
+    def offices(self, office_type_id):
+        index = [t[0] for t in office_types].index(office_type_id)
+        return [str(100 + index * 10 + j) for j in range(min(10, self.count(4)))]
+
+    def office(self, office_id):
+        office_type_id, level, branch = office_types[(int(office_id) - 100) // 10]
+        return office_type_id, level, branch
+
+    def districts(self, state_id, office_id):
+        _, _, branch = self.office(office_id)
+        if branch != 'L':
+            return []
+        return ['{0}{1}{2}'.format(state_ids.index(state_id) + 1, office_id, j) for j in range(self.count(3))]
+
+    def elections(self, state_id):
+        return ['{0}{1:03d}'.format(state_ids.index(state_id) + 1, j) for j in range(self.count(4))]
+
+    def candidates(self, election_id):
+        return ['{0}{1:04d}'.format(election_id, j) for j in range(self.count(40))]
+
+    def sig_ids(self):
+        return [str(1000 + j) for j in range(self.count(30))]
+
+    def category_ids(self):
+        return [str(j) for j in range(1, 21)]
+
+    def sig_rating_ids(self, sig_id):
+        # the first half are recent
+        return ['{0}{1:02d}'.format(sig_id, k) for k in range(8)]
+
+    def filler(self):
+        return '<notes>{0}</notes>'.format('x' * self.pad) if self.pad else ''
+
+
+def element(tag, fields, extra=''):
+    return '<{0}>{1}{2}</{0}>'.format(tag, ''.join(
+        '<{0}>{1}</{0}>'.format(name, escape(str(value))) for name, value in fields), extra)
+
+def error(message):
+    return '<error><errorMessage>{0}</errorMessage></error>'.format(escape(message)), 0
+
+
+class StandIn:
+    ''' builds the body for (endpoint, params) and keeps per endpoint counts '''
+
+    def __init__(self, fixtures, latency=0.0, error_rate=0.0, seed=0):
+        self.fixtures = fixtures
+        self.latency = latency
+        self.error_rate = error_rate
+        self.stats = {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.handlers = {
+            'Office.getOfficesByType': self.offices,
+            'State.getStateIDs': self.states,
+            'District.getByOfficeState': self.districts,
+            'Election.getElectionByYearState': self.elections,
+            'Candidates.getByElection': self.candidates,
+            'CandidateBio.getBio': self.bio,
+            'Rating.getCategories': self.categories,
+            'Rating.getSig': self.sig,
+            'Rating.getSigRatings': self.sig_ratings,
+            'Rating.getCandidateRating': self.candidate_ratings,
+            'Address.getOfficeWebAddress': self.addresses,
+        }
+
+    def respond(self, endpoint, params):
+        ''' (status, body); sleeps for the configured latency first '''
+        if self.latency:
+            time.sleep(self.latency * (0.5 + self._random.random()))
+        with self._lock:
+            counts = self.stats.setdefault(endpoint, {'requests': 0, 'records': 0, 'errors': 0, 'bytes': 0})
+            counts['requests'] += 1
+            fail = self._random.random() < self.error_rate
+            if fail:
+                counts['errors'] += 1
+        if fail:
+            return 503, b''
+        handler = self.handlers.get(endpoint)
+        if handler is None:
+            body, records = error('Method not found')
+        else:
+            body, records = handler(params)
+        body = ('<?xml version="1.0" encoding="UTF-8"?>' + body).encode('utf-8')
+        with self._lock:
+            counts['records'] += records
+            counts['bytes'] += len(body)
+        return 200, body
+
+    def counts(self):
+        with self._lock:
+            return {endpoint: dict(counts) for endpoint, counts in self.stats.items()}
+
+    def reset(self):
+        with self._lock:
+            stats, self.stats = self.stats, {}
+        return stats
+
+    def offices(self, params):
+        f = self.fixtures
+        office_type_id = params.get('officeTypeId', 'P')
+        offices = ''.join(element('office', [
+            ('officeId', office_id), ('officeTypeId', office_type_id),
+            ('officeLevelId', f.office(office_id)[1]), ('officeBranchId', f.office(office_id)[2]),
+            ('name', 'Office ' + office_id),
+        ], f.filler()) for office_id in f.offices(office_type_id))
+        return '<offices>{0}</offices>'.format(offices), len(f.offices(office_type_id))
+
+    def states(self, params):
+        f = self.fixtures
+        states = f.states()
+        body = ''.join(element('state', [('stateId', state_id), ('name', 'State ' + state_id)], f.filler())
+                       for state_id in states)
+        return '<stateList><list>{0}</list></stateList>'.format(body), len(states)
+
+    def districts(self, params):
+        f = self.fixtures
+        districts = f.districts(params.get('stateId', 'CA'), params.get('officeId', '100'))
+        if not districts:
+            return error('No districts found for this state and office.')
+        body = ''.join(element('district', [('districtId', district_id), ('name', 'District ' + district_id[-1]),
+                                            ('officeId', params.get('officeId')), ('stateId', params.get('stateId'))],
+                               f.filler()) for district_id in districts)
+        return '<districtList>{0}</districtList>'.format(body), len(districts)
+
+    def elections(self, params):
+        f = self.fixtures
+        elections = f.elections(params.get('stateId', 'CA'))
+        body = ''.join(element('election', [
+            ('electionId', election_id), ('name', 'Election ' + election_id),
+            ('stateId', params.get('stateId')), ('officeTypeId', office_types[int(election_id) % len(office_types)][0]),
+            ('special', 'f'), ('electionYear', params.get('year', '2018')),
+        ], element('stage', [('stageId', 'G'), ('name', 'General')]) + f.filler()) for election_id in elections)
+        return '<elections>{0}</elections>'.format(body), len(elections)
+
+    def candidates(self, params):
+        f = self.fixtures
+        election_id = params.get('electionId', '1000')
+        state_id = state_ids[(int(election_id[:-3]) - 1) % len(state_ids)]
+        office_type_id = office_types[int(election_id) % len(office_types)][0]
+        offices = f.offices(office_type_id)
+        candidates = f.candidates(election_id)
+        body = []
+        for n, candidate_id in enumerate(candidates):
+            office_id = offices[n % len(offices)]
+            districts = f.districts(state_id, office_id)
+            district_id = districts[n % len(districts)] if districts else ''
+            body.append(element('candidate', [
+                ('candidateId', candidate_id), ('firstName', 'First' + candidate_id), ('lastName', 'Last' + candidate_id),
+                ('ballotName', 'Ballot ' + candidate_id), ('electionParties', 'Democratic' if n % 2 else 'Republican'),
+                ('electionStatus', ['Running', 'Won', 'Lost', 'Withdrawn'][n % 4]), ('electionStage', 'General'),
+                ('electionDistrictId', district_id), ('electionOffice', 'Office ' + office_id),
+                ('electionOfficeId', office_id), ('electionStateId', state_id),
+                ('electionOfficeTypeId', office_type_id), ('electionYear', '2018'), ('electionDate', '11/06/2018'),
+                ('officeParties', 'Democratic' if n % 3 else ''), ('officeStatus', 'active' if n % 3 else ''),
+                ('officeDistrictId', district_id if n % 3 else ''), ('officeStateId', state_id if n % 3 else ''),
+                ('officeId', office_id if n % 3 else ''), ('officeName', 'Office ' + office_id if n % 3 else ''),
+            ], f.filler()))
+        return '<candidateList>{0}</candidateList>'.format(''.join(body)), len(candidates)
+
+    def bio(self, params):
+        f = self.fixtures
+        candidate_id = params.get('candidateId', '0')
+        n = int(candidate_id)
+        candidate = element('candidate', [
+            ('candidateId', candidate_id), ('photo', 'https://example.org/{0}.jpg'.format(candidate_id)),
+            ('firstName', 'First' + candidate_id), ('lastName', 'Last' + candidate_id),
+            ('gender', 'Female' if n % 2 else 'Male'), ('birthDate', '01/01/1970'), ('family', 'Family'),
+        ], f.filler())
+        if n % 3:
+            office = element('office', [
+                ('title', 'Senator'), ('firstElect', '2010'), ('lastElect', '2014'), ('nextElect', '2018'),
+                ('termStart', '01/01/2015'), ('termEnd', '01/01/2019'), ('status', 'active'),
+            ])
+        else:
+            office = '<office/>'
+        return '<bio>{0}{1}</bio>'.format(candidate, office), 1
+
+    def categories(self, params):
+        f = self.fixtures
+        category_ids = f.category_ids()
+        body = ''.join(element('category', [('categoryId', category_id), ('name', 'Category ' + category_id)])
+                       for category_id in category_ids)
+        return '<categories>{0}</categories>'.format(body), len(category_ids)
+
+    def sig(self, params):
+        f = self.fixtures
+        sig_id = params.get('sigId', '1000')
+        return element('sig', [
+            ('sigId', sig_id), ('parentId', '-1'), ('stateId', f.states()[int(sig_id) % len(f.states())]),
+            ('name', 'Group ' + sig_id), ('description', 'About group ' + sig_id), ('url', 'https://example.org/' + sig_id),
+        ], f.filler()), 1
+
+    def sig_ratings(self, params):
+        f = self.fixtures
+        sig_id = params.get('sigId', '1000')
+        rating_ids = f.sig_rating_ids(sig_id)
+        body = ''.join(element('rating', [
+            ('ratingId', rating_id), ('timespan', '2017-2018' if k < len(rating_ids) // 2 else '2011-2012'),
+            ('ratingName', 'Rating ' + rating_id), ('ratingText', 'Scored on ' + rating_id),
+        ], f.filler()) for k, rating_id in enumerate(rating_ids))
+        return '<sigRating><sig><sigId>{0}</sigId></sig>{1}</sigRating>'.format(sig_id, body), len(rating_ids)
+
+    def candidate_ratings(self, params):
+        f = self.fixtures
+        candidate_id = params.get('candidateId', '0')
+        rng = random.Random(candidate_id)
+        sig_ids = f.sig_ids()
+        ratings = []
+        for _ in range(f.count(5)):
+            sig_id = rng.choice(sig_ids)
+            rating_ids = f.sig_rating_ids(sig_id)
+            k = rng.randrange(len(rating_ids))
+            categories = ''.join(element('category', [('categoryId', category_id), ('name', 'Category ' + category_id)])
+                                 for category_id in rng.sample(f.category_ids(), 3))
+            ratings.append(element('rating', [
+                ('sigId', sig_id), ('ratingId', rating_ids[k]), ('rating', str(rng.randrange(101))),
+                ('ratingName', 'Rating ' + rating_ids[k]), ('ratingText', 'Scored on ' + rating_ids[k]),
+                ('timespan', '2017-2018' if k < len(rating_ids) // 2 else '2011-2012'),
+            ], '<categories>{0}</categories>'.format(categories) + f.filler()))
+        return '<candidateRating><candidate><candidateId>{0}</candidateId></candidate>{1}</candidateRating>'.format(
+            candidate_id, ''.join(ratings)), len(ratings)
+
+    def addresses(self, params):
+        f = self.fixtures
+        candidate_id = params.get('candidateId', '0')
+        addresses = web_address_types[:1 + int(candidate_id) % len(web_address_types)]
+        body = ''.join(element('address', [
+            ('webAddressTypeId', type_id), ('webAddressType', type_name),
+            ('webAddress', 'https://example.org/{0}/{1}'.format(candidate_id, type_id)),
+        ], f.filler()) for type_id, type_name in addresses)
+        return '<webaddress><candidate><candidateId>{0}</candidateId></candidate>{1}</webaddress>'.format(
+            candidate_id, body), len(addresses)
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def make_server(stand_in, host='127.0.0.1', port=0):
+    ''' an http server for stand_in, not yet started; port 0 picks a free one '''
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            endpoint = url.path.strip('/')
+            if endpoint == '_stats':
+                status, body = 200, json.dumps(stand_in.counts()).encode('utf-8')
+            else:
+                status, body = stand_in.respond(endpoint, dict(parse_qsl(url.query)))
+            self.send_response(status)
+            self.send_header('Content-Type', 'text/xml' if endpoint != '_stats' else 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return ThreadingHTTPServer((host, port), Handler)
+
+def start(scale=1.0, pad=0, latency=0.0, error_rate=0.0, port=0):
+    ''' serve on a background thread; returns (server, stand_in, base url) '''
+    stand_in = StandIn(Fixtures(scale, pad), latency, error_rate)
+    server = make_server(stand_in, port=port)
+    threading.Thread(target=server.serve_forever, name='votesmart-stand-in', daemon=True).start()
+    return server, stand_in, 'http://{0}:{1}'.format(*server.server_address)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='local stand-in for the vote smart api')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.0, help='mean milliseconds before each response')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of requests answered with a 503')
+    parser.add_argument('--scale', type=float, default=1.0, help='multiplies the length of every list')
+    parser.add_argument('--pad', type=int, default=0, help='bytes of filler added to every record')
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    server, _, url = start(args.scale, args.pad, args.latency / 1000.0, args.error_rate, args.port)
+    print('vote smart stand-in on {0}, set VOTE_SMART_URL={0}'.format(url))
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,153 @@
+import json
+import os
+import threading
+
+
+class Journal:
+    ''' append-only record of the work units each stage finished, so a rerun with --resume skips them.
+
+    units are journaled in groups of `every`: the seeder's writer is flushed first
+    (the flush callback), so a unit is only recorded once its writes have landed.
+    each group also saves the stage's state, e.g. a running summary. failures()
+    counts the writes the writer has lost so far: once a group's flush loses
+    any, its stages are no longer journaled, so a resumed run redoes them from
+    there on rather than skipping units whose writes never landed.
+    '''
+
+    def __init__(self, path, resume=False, flush=None, every=20, failures=None):
+        self.path = path
+        self.resumed = resume
+        self.flush_writes = flush
+        self.failures = failures
+        self.every = every
+        self.skipped = 0
+        self.journaled = 0
+        self.held_back = 0
+        self._failures_seen = 0
+        self._failed_stages = set()
+        self._done = {}
+        self._finished = set()
+        self._states = {}
+        self._pending = {}
+        self._pending_count = 0
+        self._file = None
+        self._lock = threading.RLock()
+        if resume:
+            self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path) as journal:
+            for line in journal:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # the last line may have been cut short by the crash
+                    continue
+                stage = entry['stage']
+                self._done.setdefault(stage, set()).update(entry.get('units', []))
+                if 'state' in entry:
+                    self._states[stage] = entry['state']
+                if entry.get('finished'):
+                    self._finished.add(stage)
+
+    def _write(self, entry):
+        if self._file is None:
+            # a fresh run starts a new journal, a resumed one carries on with the old
+            self._file = open(self.path, 'a+' if self.resumed else 'w')
+            if self.resumed and self._file.tell():
+                self._file.seek(self._file.tell() - 1)
+                if self._file.read(1) != '\n':
+                    # end the line the crash cut short so it doesn't swallow the next one
+                    self._file.write('\n')
+        self._file.write(json.dumps(entry) + '\n')
+
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def finished(self, stage):
+        ''' whether an earlier run got through the whole stage '''
+        with self._lock:
+            return stage in self._finished
+
+    def done(self, stage, unit):
+        with self._lock:
+            if str(unit) in self._done.get(stage, ()):
+                self.skipped += 1
+                return True
+            return False
+
+    def state(self, stage, default):
+        ''' the stage's state as last journaled, or default for a fresh stage '''
+        with self._lock:
+            return self._states.get(stage, default)
+
+    def complete(self, stage, unit, state=None):
+        ''' mark a unit done; state is the stage's state after it (saved as of the next checkpoint) '''
+        with self._lock:
+            unit = str(unit)
+            self._done.setdefault(stage, set()).add(unit)
+            units, _ = self._pending.get(stage, ([], None))
+            units.append(unit)
+            self._pending[stage] = (units, state)
+            self._pending_count += 1
+            if self._pending_count >= self.every:
+                self.checkpoint()
+
+    def checkpoint(self):
+        ''' flush the writer, then journal every unit completed since the last checkpoint '''
+        with self._lock:
+            if not self._pending:
+                return
+            if self.flush_writes is not None:
+                self.flush_writes()
+            if self._new_failures():
+                self._failed_stages.update(self._pending)
+            for stage, (units, state) in self._pending.items():
+                if stage in self._failed_stages:
+                    self.held_back += len(units)
+                    continue
+                entry = {'stage': stage, 'units': units}
+                if state is not None:
+                    entry['state'] = state
+                self._write(entry)
+                self.journaled += len(units)
+            self._sync()
+            self._pending = {}
+            self._pending_count = 0
+
+    def _new_failures(self):
+        if self.failures is None:
+            return 0
+        failures = self.failures()
+        new, self._failures_seen = failures - self._failures_seen, failures
+        return new
+
+    def finish(self, stage, state=None):
+        ''' mark the whole stage done so a resumed run skips it, unless it lost writes '''
+        with self._lock:
+            self.checkpoint()
+            if self.flush_writes is not None:
+                self.flush_writes()
+            if self._new_failures():
+                self._failed_stages.add(stage)
+            if stage in self._failed_stages:
+                print('{0} lost writes, not journaled as finished'.format(stage))
+                return
+            entry = {'stage': stage, 'finished': True}
+            if state is not None:
+                entry['state'] = state
+            self._write(entry)
+            self._sync()
+            self._finished.add(stage)
+
+    def report(self):
+        with self._lock:
+            return {
+                'journaled': self.journaled,
+                'skipped': self.skipped,
+                'held_back': self.held_back,
+                'failed_stages': sorted(self._failed_stages),
+            }
@@ -0,0 +1,77 @@
+import json
+import os
+import threading
+import time
+
+
+# DISTRICT DISCOVERY
+# federal executive and judicial offices (president, cabinet, supreme court) are
+# national and never have districts, so they are skipped for every state. any
+# other office is asked about, judged by its own level and branch: state and
+# local boards and courts can be districted. pairs that came back empty in an
+# earlier run are skipped too, until they go stale, except while a snapshot is
+# recorded (skip_empty=False), so the snapshot holds every pair's response.
+
+undistricted_offices = {'F': ['E', 'J']}  # officeLevelId -> officeBranchIds
+empty_pairs_path = os.environ.get('DISTRICT_EMPTY_PAIRS', '.district-empty-pairs.json')
+empty_pair_ttl = float(os.environ.get('DISTRICT_EMPTY_TTL_DAYS', 180)) * 24 * 60 * 60
+
+
+class DistrictPlanner:
+    ''' decides which (state, office) pairs are worth a District.getByOfficeState call '''
+
+    def __init__(self, path=empty_pairs_path, ttl=empty_pair_ttl, skip_empty=True):
+        self.path = path
+        self.ttl = ttl
+        self.skip_empty = skip_empty
+        self.counts = {'issued': 0, 'skipped_level': 0, 'skipped_empty': 0, 'found': 0, 'new_empty': 0}
+        self._lock = threading.Lock()
+        self._empty = self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path) as f:
+            empty = json.load(f)
+        now = time.time()
+        return {pair: seen for pair, seen in empty.items() if now - seen < self.ttl}
+
+    def _pair(self, state_id, office_id):
+        return '{0}|{1}'.format(state_id, office_id)
+
+    def wanted(self, state_id, office_id, office):
+        ''' office: the office's fields (officeLevelId, officeBranchId); an office without them is queried '''
+        branch = office.get('officeBranchId')
+        with self._lock:
+            if branch and branch in undistricted_offices.get(office.get('officeLevelId'), []):
+                self.counts['skipped_level'] += 1
+                return False
+            if self.skip_empty and self._pair(state_id, office_id) in self._empty:
+                self.counts['skipped_empty'] += 1
+                return False
+            self.counts['issued'] += 1
+            return True
+
+    def observe(self, state_id, office_id, root):
+        ''' record what a pair's response held; errors other than 'no districts found' are not remembered '''
+        district_count = sum(1 for _ in root.iter('district'))
+        if not district_count and root.tag == 'error':
+            if 'found' not in (root.findtext('errorMessage') or '').lower():
+                return
+        pair = self._pair(state_id, office_id)
+        with self._lock:
+            if district_count:
+                self.counts['found'] += 1
+                self._empty.pop(pair, None)
+            else:
+                self.counts['new_empty'] += 1
+                self._empty[pair] = time.time()
+
+    def save(self):
+        with self._lock:
+            with open(self.path, 'w') as f:
+                json.dump(self._empty, f)
+
+    def report(self):
+        with self._lock:
+            return dict(self.counts)
@@ -0,0 +1,47 @@
+import firebase_admin
+from firebase_admin import credentials
+from firebase_admin import db
+
+import json
+import os
+import sys
+import time
+
+from rtdb import natural_key_tree
+
+
+fire_base_url = os.environ['FIREBASE_URL']
+
+# FIREBASE APP AND DB
+cred = credentials.Certificate("./serviceAccountKey.json")
+app = firebase_admin.initialize_app(cred, {
+    'databaseURL' : fire_base_url
+})
+db_root = db.reference()
+
+def migrate(dry_run=False):
+    ''' one-shot move of a push key tree to natural keys, after backing the tree up to a local json file '''
+    tree = db_root.get() or {}
+    backup_path = 'rtdb-backup-{0}.json'.format(int(time.time()))
+    with open(backup_path, 'w') as backup:
+        json.dump(tree, backup)
+    print('backed up current tree to {0}'.format(backup_path))
+
+    migrated, counts = natural_key_tree(tree)
+    for collection, (before, after) in counts.items():
+        print('{0}: {1} nodes -> {2} nodes'.format(collection, before, after))
+    if dry_run:
+        print('dry run, nothing written')
+        return
+
+    # every collection is replaced in the same atomic update
+    db_root.update(migrated)
+    print('RTDB MIGRATED TO NATURAL KEYS, seed with RTDB_NATURAL_KEYS=1 from now on')
+
+# HOW TO MIGRATE AN EXISTING WOMAN UP REALTIME DATABASE:
+# 1. run 'python firebase-migrate.py --dry-run' and check the node counts.
+# 2. run 'python firebase-migrate.py'.
+# 3. set RTDB_NATURAL_KEYS=1 for every later run of firebase-seed.py.
+
+if __name__ == '__main__':
+    migrate(dry_run='--dry-run' in sys.argv)
@@ -1,72 +1,92 @@
-import firebase_admin
-from firebase_admin import credentials
-from firebase_admin import db
-
 import os
+import sys
+import threading
 
-import requests
-from requests.packages.urllib3.util.retry import Retry
-from requests.adapters import HTTPAdapter
+from votesmart import (get_request, fetch_each, iter_records, iter_chunks,
+    get_bios, get_addresses, recording, fetch_workers, election_streams, stream_batch_size, offices_url,
+    states_url, districts_url, elections_state_year_url,
+    candidates_election_url, categories_url)
 
 from xml.etree import ElementTree
 
+import records
+
+from lazy import LazyModule, LazyClient
+from rtdb import FanOutWriter, push_key, child_paths
+from checkpoint import Journal
+from districts import DistrictPlanner
+from pipeline import Pipeline
+from summary import new_summary, count_candidate, merge_summary
+
 
-vote_key = os.environ['VOTE_SMART_API_KEY']
 fire_base_url = os.environ['FIREBASE_URL']
+# key nodes by their vote smart ids instead of push keys (see rtdb.py and firebase-migrate.py)
+natural_keys = bool(os.environ.get('RTDB_NATURAL_KEYS'))
 year = '2018'
 previous_year = '2017'
 
-# VOTE SMART END POINTS
-base_vote_url = 'http://api.votesmart.org'
-offices_url = base_vote_url + '/Office.getOfficesByType?key=' + vote_key
-states_url = base_vote_url + '/State.getStateIDs?key=' + vote_key
-districts_url = base_vote_url + '/District.getByOfficeState?key=' + vote_key
-elections_state_year_url = base_vote_url + '/Election.getElectionByYearState?key=' + vote_key
-candidates_election_url = base_vote_url + '/Candidates.getByElection?key=' + vote_key
-candidate_bio_url = base_vote_url + '/CandidateBio.getBio?key=' + vote_key
-categories_url = base_vote_url + '/Rating.getCategories?key=' + vote_key
-sig_url = base_vote_url + '/Rating.getSig?key=' + vote_key
-ratings_url = base_vote_url + '/Rating.getSigRatings?key=' + vote_key
-candidate_ratings_url = base_vote_url + '/Rating.getCandidateRating?key=' + vote_key
-candidate_address_url = base_vote_url + '/Address.getOfficeWebAddress?key=' + vote_key
-
 # FIREBASE APP AND DB
-cred = credentials.Certificate("./serviceAccountKey.json")
-app = firebase_admin.initialize_app(cred, {
-    'databaseURL' : fire_base_url
-})
-db_root = db.reference()
-
-# GENERIC SESSION REQUEST
-
-def get_request(url, params=''):
-    s = requests.Session()
-    retries = Retry(total=5,
-                    backoff_factor=0.1,
-                    status_forcelist=[ 500, 502, 503, 504 ])
-    s.mount('http://', HTTPAdapter(max_retries=retries))
-    r = s.get(url, params=params)
-    return r
+# firebase_admin is imported and the app initialized on the first db_root call (see lazy.py)
+firebase_admin = LazyModule('firebase_admin')
+credentials = LazyModule('firebase_admin.credentials')
+db = LazyModule('firebase_admin.db')
+
+def connect():
+    cred = credentials.Certificate("./serviceAccountKey.json")
+    # a named app, so firestore-seed.py can run in the same process (seed.py)
+    app = firebase_admin.initialize_app(cred, {
+        'databaseURL' : fire_base_url
+    }, name='rtdb')
+    return db.reference(app=app)
+
+db_root = LazyClient(connect)
+
+# FAN-OUT WRITES
+# push keys are generated locally and every entity, with its reverse index
+# entries, goes out in one multi-location update (grouped across entities).
+fan_out = FanOutWriter(db_root)
+
+# CHECKPOINTS
+# candidate_seed journals the elections it finishes and its running summary;
+# after a crash, rerun with --resume to skip them (see checkpoint.py).
+journal = Journal('.firebase-seed-journal.jsonl', resume='--resume' in sys.argv, flush=fan_out.flush)
+
+# NODE KEYS
+
+def node_key(natural_id):
+    ''' key for a new node: its vote smart id with natural keys, otherwise a fresh push key '''
+    return natural_id if natural_keys else push_key()
+
+def record_key(collection, field, natural_id):
+    ''' key of the existing node whose field is natural_id, or None; a query only for push key trees '''
+    if natural_keys:
+        return natural_id
+    snapshot = db_root.child(collection).order_by_child(field).equal_to(natural_id).get()
+    return next(iter(snapshot), None) if snapshot else None
+
+def seeded(collection):
+    ''' whether a collection already has nodes, checked before a first-seed stage pushes them again '''
+    return bool(db_root.child(collection).get(shallow=True))
 
 def office_seed():
     for office_type_id in ['P', 'C', 'G', 'S', 'K', 'L', 'J', 'M', 'N', 'H' ]:
         params = { 'officeTypeId' : office_type_id }
-        r = get_request(offices_url, params)
-        root = ElementTree.fromstring(r.content)
-        for office in root.iter('office'):
-            office_id = office.find('officeId').text
-            office_type_id = office.find('officeTypeId').text
-            office_level_id = office.find('officeLevelId').text
-            office_branch_id = office.find('officeBranchId').text
-            office_name = office.find('name').text
-
-            db_root.child('offices').push({
+        for office in iter_records(offices_url, 'office', params):
+            office_fields = records.office.extract(office)
+            office_id = office_fields['officeId']
+            office_type_id = office_fields['officeTypeId']
+            office_level_id = office_fields['officeLevelId']
+            office_branch_id = office_fields['officeBranchId']
+            office_name = office_fields['name']
+
+            fan_out.set('offices/' + node_key(office_id), {
                 'officeId' : office_id,
                 'officeTypeId' : office_type_id,
                 'officeLevelId' : office_level_id,
                 'officeBranchId' : office_branch_id,
                 'officeName' : office_name,
             })
+    fan_out.flush()
 
 def office_type_seed():
     office_type_rows = [
@@ -82,154 +102,189 @@ def office_type_seed():
         ['H', 'L', 'J', 'Local Judicial'],
     ]
     for row in office_type_rows:
-        db_root.child('office_types').push({
+        fan_out.set('office_types/' + node_key(row[0]), {
             'officeTypeId': row[0],
             'officeLevelId': row[1],
             'officeBranchId': row[2],
             'officeName': row[3],
         })
+    fan_out.flush()
 
 def state_seed():
-    r = requests.get(states_url)
-    root = ElementTree.fromstring(r.content)
-    for state in root.iter('state'):
-        state_id = state.find('stateId').text
-        name = state.find('name').text
-        db_root.child('states').push({'stateId': state_id, 'name': name})
+    for state in iter_records(states_url, 'state'):
+        state_fields = records.state.extract(state)
+        state_id = state_fields['stateId']
+        name = state_fields['name']
+        fan_out.set('states/' + node_key(state_id), {'stateId': state_id, 'name': name})
+    fan_out.flush()
 
 def category_seed():
-    r = requests.get(categories_url)
-    root = ElementTree.fromstring(r.content)
-    for category in root.iter('category'):
-        category_id = category.find('categoryId').text
-        category_name = category.find('name').text
-        db_root.child('categories').push(
+    for category in iter_records(categories_url, 'category'):
+        category_fields = records.category.extract(category)
+        category_id = category_fields['categoryId']
+        category_name = category_fields['name']
+        fan_out.set('categories/' + node_key(category_id),
             {'categoryId': category_id,
              'name': category_name,
             })
+    fan_out.flush()
 
 def district_seed():
-    states_snapshot = db.reference('/states').get()
-    offices_snapshot = db.reference('/offices').get()
-    for state_record, state in states_snapshot.items():
-        for office_record, office in offices_snapshot.items():
-            print('trying to find districts for officeId {0} in {1}'.format(office['officeId'], state['stateId']))
-            params = { 'officeId' : office['officeId'], 'stateId' : state['stateId'] }
-            r = get_request(districts_url, params)
-            root = ElementTree.fromstring(r.content)
-            for district in root.iter('district'):
-                district_id = district.find('districtId').text
-                district_name = district.find('name').text
-                print('inserting record for {0} in state {1}'.format(district_name, state['stateId']))
-                district_record = db_root.child('districts').push({
+    states_snapshot = db_root.child('states').get()
+    offices_snapshot = db_root.child('offices').get()
+    # office nodes carry their level and branch, which is all the planner needs
+    planner = DistrictPlanner(skip_empty=not recording())
+
+    # query every wanted (state, office) pair concurrently, writing districts as responses arrive
+    def insert_districts(key, r):
+        state_record, state, office_record, office = key
+        root = ElementTree.fromstring(r.content)
+        planner.observe(state['stateId'], office['officeId'], root)
+        for district in root.iter('district'):
+            district_fields = records.district.extract(district)
+            district_id = district_fields['districtId']
+            district_name = district_fields['name']
+            print('inserting record for {0} in state {1}'.format(district_name, state['stateId']))
+            district_record = node_key(district_id)
+            fan_out.set_entity({
+                'districts/' + district_record: {
                     'districtId' : district_id,
                     'districtName' : district_name,
                     'offices' :  
                         { office_record: True },
                     'states' : 
                         { state_record: True } ,
-                })
-                district_record = district_record.key
-                db_root.child('states/' + state_record + '/districts').update({
-                    district_record: True
-                })
-                db_root.child('offices/' + office_record + '/districts').update({
-                    district_record: True
-                })
+                },
+                'states/' + state_record + '/districts/' + district_record: True,
+                'offices/' + office_record + '/districts/' + district_record: True,
+            })
 
-def election_seed():
-    states_snapshot = db.reference('/states').get()
+    jobs = []
     for state_record, state in states_snapshot.items():
-        print('getting elections for {0}'.format(state['stateId']))
+        for office_record, office in offices_snapshot.items():
+            if not planner.wanted(state['stateId'], office['officeId'], office):
+                continue
+            params = { 'officeId' : office['officeId'], 'stateId' : state['stateId'] }
+            jobs.append(((state_record, state, office_record, office), params))
+    print('trying to find districts for {0} office / state pairs'.format(len(jobs)))
+    fetch_each(districts_url, jobs, insert_districts)
+    fan_out.flush()
+    planner.save()
+    print('district calls: {0}'.format(planner.report()))
+
+def election_seed():
+    states_snapshot = db_root.child('states').get()
+
+    # fetch: every state's elections, several states at once
+    def fetch(state_item):
+        state_record, state = state_item
         params = { 'stateId': state['stateId'], 'year': year }
-        r = get_request(elections_state_year_url, params)
+        yield state_record, state, get_request(elections_state_year_url, params)
+
+    # parse: the paths of each election and its reverse index entries
+    def parse(fetched):
+        state_record, state, r = fetched
+        print('got elections for {0}'.format(state['stateId']))
         root = ElementTree.fromstring(r.content)
         for election in root.iter('election'):
-            election_id = election.find('electionId').text
-            election_name = election.find('name').text
-            office_type_id = election.find('officeTypeId').text
-            office_type_query = db.reference('office_types').order_by_child('officeTypeId').equal_to(office_type_id)
-            office_type_snapshot = office_type_query.get()
-            office_type_record = list(office_type_snapshot.items())[0][0]
+            election_fields = records.election.extract(election)
+            election_id = election_fields['electionId']
+            election_name = election_fields['name']
+            office_type_id = election_fields['officeTypeId']
+            office_type_record = record_key('office_types', 'officeTypeId', office_type_id)
             print('inserting election record for election: {0}'.format(str(election_id)))
-            election_record = db_root.child('elections').push({
-                'electionId': election_id,
-                'name': election_name,
-                'states': {
-                    state_record: True
+            election_record = node_key(election_id)
+            yield {
+                'elections/' + election_record: {
+                    'electionId': election_id,
+                    'name': election_name,
+                    'states': {
+                        state_record: True
+                    },
+                    'officeTypes': {
+                        office_type_record: True
+                    }
                 },
-                'officeTypes': {
-                    office_type_record: True
-                }
-            })
-            election_record = election_record.key
-            db_root.child('states/' + state_record + '/elections').update({
-                election_record: True
-            })
-            db_root.child('office_types/' + office_type_record + '/elections').update({
-                election_record: True
-            })
+                'states/' + state_record + '/elections/' + election_record: True,
+                'office_types/' + office_type_record + '/elections/' + election_record: True,
+            }
+
+    # write
+    def write(election_paths):
+        fan_out.set_entity(election_paths)
+
+    pipeline = Pipeline('election_seed')
+    pipeline.stage('fetch', fetch, fetch_workers)
+    pipeline.stage('parse', parse)
+    pipeline.stage('write', write)
+    pipeline.run(list(states_snapshot.items()))
+    fan_out.flush()
 
 
 def candidate_seed():
-    candidate_summary = {
-        'total': 0,
-        'female': {
-            'total': 0,
-            'status': {}
-        },
-        'male': {
-            'total': 0,
-            'status': {}
-        }
-    }
-    elections_snapshot = db.reference('/elections').get()
-    # iterate through all 2018 current elections
-    for election_record, election in elections_snapshot.items():
+    if journal.finished('candidate_seed'):
+        return
+    candidate_summary = journal.state('candidate_seed', new_summary())
+    # each election is counted on its own and added to the summary once it is
+    # fully written, so a journaled summary never counts an election twice
+    election_summaries = {}
+    summary_lock = threading.Lock()
+    elections_snapshot = db_root.child('elections').get()
+    # districts district_seed didn't find are left unlinked rather than linked to a node that isn't there
+    district_keys = set(db_root.child('districts').get(shallow=True) or {}) if natural_keys else None
+
+    def district_key(district_id):
+        if natural_keys:
+            return district_id if district_id in district_keys else None
+        return record_key('districts', 'districtId', district_id)
+
+    # fetch: each election's candidates in chunks as the list streams in, with
+    # every chunk's bios fetched concurrently
+    def fetch(election_item):
+        election_record, election = election_item
         election_id = election['electionId']
         print('getting candidates for electionId {0}'.format(election_id))
         params = { 'electionId': election_id }
-        r = get_request(candidates_election_url, params)
-        root = ElementTree.fromstring(r.content)
-        for candidate in root.iter('candidate'):
+        candidate_stream = iter_records(candidates_election_url, 'candidate', params)
+        for candidates in iter_chunks(candidate_stream, stream_batch_size):
+            bios = get_bios([candidate.find('candidateId').text for candidate in candidates])
+            yield election_record, candidates, bios
+
+    # parse: the paths of each candidate and its reverse index entries
+    def parse(fetched):
+        election_record, candidates, bios = fetched
+        for candidate, bio_fields in zip(candidates, bios):
             # capture candidate election information
-            candidate_id = candidate.find('candidateId').text
-            election_stage = candidate.find('electionStage').text
-            election_state_id = candidate.find('electionStateId').text
-            election_office_id = candidate.find('electionOfficeId').text
-            election_date = candidate.find('electionDate').text
-            election_parties = candidate.find('electionParties').text
-            election_status = candidate.find('electionStatus').text
-            election_district_id = candidate.find('electionDistrictId').text
-            election_state_id = candidate.find('electionStateId').text
-            office_id = candidate.find('officeId').text # 'State House'
-            office_district_id = candidate.find('officeDistrictId').text # '20496'
-            office_state_id = candidate.find('officeStateId').text
-            office_status = candidate.find('officeStatus').text # 'active'
-            office_parties = candidate.find('officeParties').text
-        
-            # get candidate's detailed bio
-            print('getting candidate detailed bio for candidateId ' + candidate_id)
-            params = { 'candidateId': candidate_id }
-            r = get_request(candidate_bio_url, params)
-            root = ElementTree.fromstring(r.content)
-            
+            candidate_fields = records.candidate.extract(candidate)
+            candidate_id = candidate_fields['candidateId']
+            election_stage = candidate_fields['electionStage']
+            election_state_id = candidate_fields['electionStateId']
+            election_office_id = candidate_fields['electionOfficeId']
+            election_date = candidate_fields['electionDate']
+            election_parties = candidate_fields['electionParties']
+            election_status = candidate_fields['electionStatus']
+            election_district_id = candidate_fields['electionDistrictId']
+            election_state_id = candidate_fields['electionStateId']
+            office_id = candidate_fields['officeId'] # 'State House'
+            office_district_id = candidate_fields['officeDistrictId'] # '20496'
+            office_state_id = candidate_fields['officeStateId']
+            office_status = candidate_fields['officeStatus'] # 'active'
+            office_parties = candidate_fields['officeParties']
+    
             # capture candidate bio data
-            candidate = root.find('candidate')
-            is_female = candidate.find('gender').text == 'Female'
-            photo = candidate.find('photo').text
-            first_name = candidate.find('firstName').text
-            last_name = candidate.find('lastName').text
+            is_female = bio_fields['gender'] == 'Female'
+            photo = bio_fields['photo']
+            first_name = bio_fields['firstName']
+            last_name = bio_fields['lastName']
 
             # if office data, capture additional office data from bio
-            office = root.find('office')
-            in_office = 'true' if office else ''
-            title = office.find('title').text if in_office else '' # 'Senator'
-            first_elect = office.find('firstElect').text if in_office else ''
-            last_elect = office.find('lastElect').text if in_office else ''
-            next_elect = office.find('nextElect').text if in_office else '' # 2018
-            term_start = office.find('termStart').text if in_office else '' # 11/10/1992
-            term_end = office.find('termEnd').text if in_office else ''
+            in_office = bio_fields['inOffice']
+            title = bio_fields['title'] # 'Senator'
+            first_elect = bio_fields['firstElect']
+            last_elect = bio_fields['lastElect']
+            next_elect = bio_fields['nextElect'] # 2018
+            term_start = bio_fields['termStart'] # 11/10/1992
+            term_end = bio_fields['termEnd']
 
             # prepare to write candidate info
             candidate_record_obj = {
@@ -255,120 +310,112 @@ def candidate_seed():
                     'electedOfficeStatus' : office_status,
                     'isFemale' : is_female,
                     }
-    
-            # increment summary counter
-            candidate_summary['total'] += 1
-            if is_female:
-                candidate_summary['female']['total'] += 1
-                if election_status in candidate_summary['female']['status']:
-                    candidate_summary['female']['status'][election_status] += 1
-                else:
-                    candidate_summary['female'][election_status] = 1
-            else:
-                candidate_summary['male']['total'] += 1
-                if election_status in candidate_summary['male']['status']:
-                    candidate_summary['male']['status'][election_status] += 1
-                else:
-                    candidate_summary['male']['status'][election_status] = 1
-
-            print('inserting candidate record for candidate: ' + str(candidate_id))
-            candidate_record_ref = db_root.child('candidates').push(candidate_record_obj)
-            candidate_record = candidate_record_ref.key
 
-            print('updated candidate summary:')
-            print(candidate_summary)
+            candidate_record = node_key(candidate_id)
+            candidate_paths = {}
 
             # inject linked records conditionally
-            if election_district_id:
-                district_query = db.reference('districts').order_by_child('districtId').equal_to(election_district_id)
-                district_snapshot = district_query.get()
-                district_record = list(district_snapshot.items())[0][0]
+            district_record = district_key(election_district_id) if election_district_id else None
+            if district_record:
                 candidate_record_obj['runningDistricts'] = {
                     district_record: True,
                 }
-                db_root.child('districts/' + district_record + '/runningCandidates').update({
-                    candidate_record: True,
-                 })
+                candidate_paths['districts/' + district_record + '/runningCandidates/' + candidate_record] = True
             if election_state_id:
-                state_query = db.reference('states').order_by_child('stateId').equal_to(election_state_id)
-                state_snapshot = state_query.get()
-                state_record = list(state_snapshot.items())[0][0]
+                state_record = record_key('states', 'stateId', election_state_id)
                 candidate_record_obj['runningStates'] =  { 
                     state_record: True, 
                 }
-                db_root.child('states/' + state_record + '/runningCandidates').update({
-                    candidate_record: True,
-                })
+                candidate_paths['states/' + state_record + '/runningCandidates/' + candidate_record] = True
             if election_office_id:
-                office_query = db.reference('offices').order_by_child('officeId').equal_to(election_office_id)
-                office_snapshot = office_query.get()
-                office_record = list(office_snapshot.items())[0][0]
+                office_record = record_key('offices', 'officeId', election_office_id)
                 candidate_record_obj['runningOffices'] = {
                     office_record: True,
                 }
-                db_root.child('offices/' + office_record + '/runningCandidates').update({
-                    candidate_record: True,
-                })
-            if office_district_id:
-                district_query = db.reference('districts').order_by_child('districtId').equal_to(office_district_id)
-                district_snapshot = district_query.get()
-                district_record = list(district_snapshot.items())[0][0]
+                candidate_paths['offices/' + office_record + '/runningCandidates/' + candidate_record] = True
+            district_record = district_key(office_district_id) if office_district_id else None
+            if district_record:
                 candidate_record_obj['electedDistricts'] = {
                     district_record: True,
                 }
-                db_root.child('districts/' + district_record + '/electedCandidates').update({
-                    candidate_record: True,
-                 })
+                candidate_paths['districts/' + district_record + '/electedCandidates/' + candidate_record] = True
             if office_state_id:
-                state_query = db.reference('states').order_by_child('stateId').equal_to(office_state_id)
-                state_snapshot = state_query.get()
-                state_record = list(state_snapshot.items())[0][0]
+                state_record = record_key('states', 'stateId', office_state_id)
                 candidate_record_obj['electedStates'] =  { 
                     state_record: True, 
                 }
-                db_root.child('states/' + state_record + '/electedCandidates').update({
-                    candidate_record: True,
-                })
+                candidate_paths['states/' + state_record + '/electedCandidates/' + candidate_record] = True
             if office_id:
-                office_query = db.reference('offices').order_by_child('officeId').equal_to(office_id)
-                office_snapshot = office_query.get()
-                office_record = list(office_snapshot.items())[0][0]
+                office_record = record_key('offices', 'officeId', office_id)
                 candidate_record_obj['electedOffices'] = {
                     office_record: True,
                 }
-                db_root.child('offices/' + office_record + '/electedCandidates').update({
-                    candidate_record: True,
-                })
+                candidate_paths['offices/' + office_record + '/electedCandidates/' + candidate_record] = True
 
-            # Update the candidate record with any linked data
-            candidate_record_ref.update(candidate_record_obj)
+            # field by field, so a candidate running in several elections keeps every election's links
+            candidate_paths.update(child_paths('candidates/' + candidate_record, candidate_record_obj))
+            yield election_record, candidate_record_obj, candidate_paths
+
+    # write: count every candidate, then write the candidate record with its
+    # linked data and reverse index entries at once
+    def write(parsed):
+        election_record, candidate_record_obj, candidate_paths = parsed
+        with summary_lock:
+            election_summary = election_summaries.setdefault(election_record, new_summary())
+            count_candidate(election_summary, candidate_record_obj['isFemale'], candidate_record_obj['runningStatus'])
+        print('inserting candidate record for candidate: ' + str(candidate_record_obj['candidateId']))
+        fan_out.set_entity(candidate_paths)
+
+    def election_done(election_item):
+        election_record, election = election_item
+        with summary_lock:
+            merge_summary(candidate_summary, election_summaries.pop(election_record, new_summary()))
+            print('updated candidate summary:')
+            print(candidate_summary)
+            journal.complete('candidate_seed', election['electionId'], candidate_summary)
+
+    # iterate through all 2018 current elections
+    elections = [(election_record, election) for election_record, election in elections_snapshot.items()
+                 if not journal.done('candidate_seed', election['electionId'])]
+    pipeline = Pipeline('candidate_seed', on_unit_done=election_done)
+    # election_streams elections at a time, each fetching its bios on fetch_workers threads
+    pipeline.stage('fetch', fetch, election_streams)
+    pipeline.stage('parse', parse)
+    pipeline.stage('write', write)
+    pipeline.run(elections)
 
     # After the entire function runs, store the summary
     print('Candidate seed finished! Writing summary')
-    db_root.child('summary').push(candidate_summary)        
+    fan_out.set('summary/' + push_key(), candidate_summary)
+    fan_out.flush()        
+    journal.finish('candidate_seed', candidate_summary)
 
 
 def candidate_address_seed():
-    candidate_ids = get_candidate_ids()
-    for candidate_id in candidate_ids:
-        candidate_id_record = get_candidate_id(candidate_id)
-        params = { 'candidateId' : candidate_id }
-        r = get_request(candidate_address_url, params)
-        root = ElementTree.fromstring(r.content)
-        for address in root.iter('address'):
-            address_type_id = address.find('webAddressTypeId').text
-            address_type = address.find('webAddressType').text
-            address = address.find('webAddress').text
-            
-            address_data_obj = {
-                'candidateId' : [ candidate_id_record ],
-                'webAddressTypeId' : address_type_id,
-                'webAddressType' : address_type,
-                'webAddress' : address,
-            }
-   
-            print('inserting candidate address record for candidate: ' + str(candidate_id))
-            addresses_table.insert(address_data_obj)
+    if journal.finished('candidate_address_seed'):
+        return
+    # every candidate node gets its web addresses, fetched a batch at a time and
+    # once per candidate (a candidate may have a node per election)
+    candidates_snapshot = db_root.child('candidates').get() or {}
+    candidate_records = {}
+    for candidate_record, candidate in candidates_snapshot.items():
+        if not journal.done('candidate_address_seed', candidate['candidateId']):
+            candidate_records.setdefault(candidate['candidateId'], []).append(candidate_record)
+    for batch in iter_chunks(candidate_records, stream_batch_size):
+        for candidate_id, addresses in zip(batch, get_addresses(batch)):
+            address_list = [{
+                'webAddressTypeId' : address_fields['webAddressTypeId'],
+                'webAddressType' : address_fields['webAddressType'],
+                'webAddress' : address_fields['webAddress'],
+            } for address_fields in addresses]
+            if address_list:
+                print('inserting candidate addresses for candidate: ' + str(candidate_id))
+                for candidate_record in candidate_records[candidate_id]:
+                    # the whole list, so a rerun replaces it rather than adding to it
+                    fan_out.set('candidates/' + candidate_record + '/addresses', address_list)
+            journal.complete('candidate_address_seed', candidate_id)
+    fan_out.flush()
+    journal.finish('candidate_address_seed')
 
 
 # office_seed()
@@ -378,4 +425,8 @@ def candidate_address_seed():
 # district_seed()
 
 # election_seed()
-# candidate_seed()
\ No newline at end of file
+# candidate_seed()
+# candidate_address_seed()
+
+# if a run dies part way, rerun with 'python firebase-seed.py --resume' to carry on where it stopped.
+# or run the stages you need with 'python seed.py --sink firebase [stage ...]', see seed.py.
\ No newline at end of file
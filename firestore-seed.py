@@ -1,66 +1,128 @@
-import firebase_admin
-from firebase_admin import credentials
-from firebase_admin import firestore
-
 import os
+import sys
+import threading
 
-import requests
-from requests.packages.urllib3.util.retry import Retry
-from requests.adapters import HTTPAdapter
+from votesmart import (get_request, fetch_all, fetch_each, iter_records, parse_stream,
+    iter_chunks, get_bios, get_addresses, recording, fetch_workers, election_streams,
+    stream_batch_size, offices_url, states_url, districts_url,
+    elections_state_year_url, candidates_election_url, categories_url,
+    sig_url, ratings_url, candidate_ratings_url)
 
 from xml.etree import ElementTree
 
-import google.cloud
+import records
+
+from firestore_writer import BatchPipeline
+from lazy import LazyModule, LazyClient
+from checkpoint import Journal
+from districts import DistrictPlanner
+from pipeline import Pipeline
+from staging import StagingStore
+from summary import new_summary, count_candidate, merge_summary
 
 
-vote_key = os.environ['VOTE_SMART_API_KEY']
 fire_store_id = os.environ['FIRESTORE_ID']
 year = '2018'
 previous_year = '2017'
 
-# VOTE SMART END POINTS
-base_vote_url = 'http://api.votesmart.org'
-offices_url = base_vote_url + '/Office.getOfficesByType?key=' + vote_key
-states_url = base_vote_url + '/State.getStateIDs?key=' + vote_key
-districts_url = base_vote_url + '/District.getByOfficeState?key=' + vote_key
-elections_state_year_url = base_vote_url + '/Election.getElectionByYearState?key=' + vote_key
-candidates_election_url = base_vote_url + '/Candidates.getByElection?key=' + vote_key
-candidate_bio_url = base_vote_url + '/CandidateBio.getBio?key=' + vote_key
-categories_url = base_vote_url + '/Rating.getCategories?key=' + vote_key
-sig_url = base_vote_url + '/Rating.getSig?key=' + vote_key
-ratings_url = base_vote_url + '/Rating.getSigRatings?key=' + vote_key
-candidate_ratings_url = base_vote_url + '/Rating.getCandidateRating?key=' + vote_key
-candidate_address_url = base_vote_url + '/Address.getOfficeWebAddress?key=' + vote_key
-
 # FIREBASE APP AND DB
-cred = credentials.Certificate('./serviceAccountKey.json')
-firebase_admin.initialize_app(cred, {
-  'projectId': fire_store_id,
-})
-db = firestore.client()
-
-# GENERIC SESSION REQUEST
-
-def get_request(url, params=''):
-    s = requests.Session()
-    retries = Retry(total=5,
-                    backoff_factor=0.1,
-                    status_forcelist=[ 500, 502, 503, 504 ])
-    s.mount('http://', HTTPAdapter(max_retries=retries))
-    r = s.get(url, params=params)
-    return r
+# firebase_admin is imported and the app initialized on the first db call (see lazy.py)
+firebase_admin = LazyModule('firebase_admin')
+credentials = LazyModule('firebase_admin.credentials')
+firestore = LazyModule('firebase_admin.firestore')
+google_exceptions = LazyModule('google.cloud.exceptions')
+
+def connect():
+    cred = credentials.Certificate('./serviceAccountKey.json')
+    # a named app, so firebase-seed.py can run in the same process (seed.py)
+    app = firebase_admin.initialize_app(cred, {
+      'projectId': fire_store_id,
+    }, name='firestore')
+    return firestore.client(app)
+
+db = LazyClient(connect)
+
+def seeded(collection):
+    ''' whether a collection already has documents, checked before a first-seed stage writes them again '''
+    return bool(db.collection(collection).limit(1).get())
+
+# BATCHED WRITES
+# candidate and rating writes are grouped into WriteBatch commits, see firestore_writer.py
+writes = BatchPipeline(db)
+
+# LOCAL STAGING
+# with FIRESTORE_STAGING set to a file (or seed.py --staging), candidate_seed and
+# candidate_ratings_seed land their documents and reverse links in a local sqlite
+# store (staging.py) and publish them when the stage is done: every document
+# once, and every linked document with all of its links in one merged write,
+# instead of an update per link.
+
+staging = None
+
+def use_staging(path):
+    global staging
+    staging = StagingStore(path)
+    if not journal.resumed:
+        # a resumed run still needs what the journaled units staged
+        staging.clear()
+
+def flush_writes():
+    ''' queued writes land and staged documents are saved, e.g. before the journal records units '''
+    writes.flush()
+    if staging is not None:
+        staging.commit()
+
+def set_document(stage, collection, document_id, doc):
+    if staging is not None:
+        staging.put(stage, collection, document_id, doc)
+    else:
+        writes.set(db.collection(collection).document(document_id), doc)
+
+def add_link(stage, collection, document_id, field, member):
+    ''' collection/document_id gets field.member = True, now or when the stage publishes '''
+    if staging is not None:
+        staging.link(stage, collection, document_id, field, member)
+    else:
+        writes.update(db.collection(collection).document(document_id), {
+            '{0}.{1}'.format(field, member): True,
+        })
+
+def publish_staged(stage):
+    ''' write a stage's staged documents, then each document it linked to, once '''
+    print('publishing staged {0}: {1}'.format(stage, staging.stats(stage)))
+    for collection, document_id, doc in staging.documents(stage):
+        writes.set(db.collection(collection).document(document_id), doc)
+    known_categories = None
+    for collection, document_id, maps in staging.linked(stage):
+        if collection == 'categories':
+            # a rating may name a category Rating.getCategories doesn't list
+            if known_categories is None:
+                known_categories = {snapshot.id for snapshot in db.collection('categories').get()}
+            if document_id not in known_categories:
+                maps['notInVoteSmart'] = True
+        # merged, so links already on the document are kept
+        writes.set(db.collection(collection).document(document_id), maps, merge=True)
+    writes.flush()
+
+# CHECKPOINTS
+# the long stages journal the elections / candidates they finish and their running
+# summaries; after a crash, rerun with --resume to skip them (see checkpoint.py).
+journal = Journal('.firestore-seed-journal.jsonl', resume='--resume' in sys.argv, flush=flush_writes,
+                  failures=lambda: len(writes.failed))
+
+if os.environ.get('FIRESTORE_STAGING'):
+    use_staging(os.environ['FIRESTORE_STAGING'])
 
 def office_seed():
     for office_type_id in ['P', 'C', 'G', 'S', 'K', 'L', 'J', 'M', 'N', 'H' ]:
         params = { 'officeTypeId' : office_type_id }
-        r = get_request(offices_url, params)
-        root = ElementTree.fromstring(r.content)
-        for office in root.iter('office'):
-            office_id = office.find('officeId').text
-            office_type_id = office.find('officeTypeId').text
-            office_level_id = office.find('officeLevelId').text
-            office_branch_id = office.find('officeBranchId').text
-            office_name = office.find('name').text
+        for office in iter_records(offices_url, 'office', params):
+            office_fields = records.office.extract(office)
+            office_id = office_fields['officeId']
+            office_type_id = office_fields['officeTypeId']
+            office_level_id = office_fields['officeLevelId']
+            office_branch_id = office_fields['officeBranchId']
+            office_name = office_fields['name']
             print('inserting office: {0}'.format(office_id))
             db.collection('offices').document(office_id).set({
                 'officeTypeId' : office_type_id,
@@ -91,20 +153,18 @@ def office_type_seed():
         })
 
 def state_seed():
-    r = requests.get(states_url)
-    root = ElementTree.fromstring(r.content)
-    for state in root.iter('state'):
-        state_id = state.find('stateId').text
-        name = state.find('name').text
+    for state in iter_records(states_url, 'state'):
+        state_fields = records.state.extract(state)
+        state_id = state_fields['stateId']
+        name = state_fields['name']
         print('inserting state: {0}'.format(state_id))
         db.collection('states').document(state_id).set({'name': name})
 
 def category_seed():
-    r = requests.get(categories_url)
-    root = ElementTree.fromstring(r.content)
-    for category in root.iter('category'):
-        category_id = category.find('categoryId').text
-        category_name = category.find('name').text
+    for category in iter_records(categories_url, 'category'):
+        category_fields = records.category.extract(category)
+        category_id = category_fields['categoryId']
+        category_name = category_fields['name']
         db.collection('categories').document(category_id).set(
             {
              'name': category_name,
@@ -112,139 +172,172 @@ def category_seed():
 
 def district_seed():
     states = [snapshot.reference for snapshot in db.collection(u'states').get()]
-    offices = [snapshot.reference for snapshot in db.collection(u'offices').get()]
+    # office documents carry their level and branch, which is all the planner needs
+    offices = {snapshot.id: snapshot.to_dict() for snapshot in db.collection(u'offices').get()}
+    planner = DistrictPlanner(skip_empty=not recording())
     # use caches for associated data to save on writes when seeding
     state_district_cache = {}
     office_district_cache = {}
-    for state in states:
-        state_id = state.id
-        for office in offices:
-            office_id = office.id
-            print('trying to find districts for officeId {0} in {1}'.format(office_id, state_id))
-            params = { 'officeId' : office_id, 'stateId' : state_id }
-            r = get_request(districts_url, params)
-            root = ElementTree.fromstring(r.content)
-            for district in root.iter('district'):
-                print('found districts to insert')
-                district_id = district.find('districtId').text
-                district_name = district.find('name').text
-                print('inserting record for {0} in state {1}'.format(district_id, state_id))
-                db.collection('districts').document(district_id).set({
-                    'districtName' : district_name,
-                    'offices' :  
-                        { office_id: True },
-                    'states' : 
-                        { state_id: True } ,
-                })
-                # populate the caches
-                if state_id not in state_district_cache:
-                    state_district_cache[state_id] = {}
-                if district_id not in state_district_cache[state_id]:
-                    state_district_cache[state_id][district_id] = True
-                if office_id not in office_district_cache:
-                    office_district_cache[office_id] = {}
-                if district_id not in office_district_cache[office_id]:
-                    office_district_cache[office_id][district_id] = True
-    # write related data from caches
+
+    # query every wanted (state, office) pair concurrently, writing districts as responses arrive
+    def insert_districts(key, r):
+        state_id, office_id = key
+        root = ElementTree.fromstring(r.content)
+        planner.observe(state_id, office_id, root)
+        for district in root.iter('district'):
+            print('found districts to insert')
+            district_fields = records.district.extract(district)
+            district_id = district_fields['districtId']
+            district_name = district_fields['name']
+            print('inserting record for {0} in state {1}'.format(district_id, state_id))
+            db.collection('districts').document(district_id).set({
+                'districtName' : district_name,
+                'offices' :  
+                    { office_id: True },
+                'states' : 
+                    { state_id: True } ,
+            })
+            # populate the caches
+            if state_id not in state_district_cache:
+                state_district_cache[state_id] = {}
+            if district_id not in state_district_cache[state_id]:
+                state_district_cache[state_id][district_id] = True
+            if office_id not in office_district_cache:
+                office_district_cache[office_id] = {}
+            if district_id not in office_district_cache[office_id]:
+                office_district_cache[office_id][district_id] = True
+
+    jobs = [((state.id, office_id), { 'officeId' : office_id, 'stateId' : state.id })
+            for state in states for office_id, office in offices.items()
+            if planner.wanted(state.id, office_id, office)]
+    print('trying to find districts for {0} office / state pairs'.format(len(jobs)))
+    fetch_each(districts_url, jobs, insert_districts)
+    planner.save()
+    print('district calls: {0}'.format(planner.report()))
+
+    # write related data from caches, merged so the other fields (elections.* above all) stay
     for state, districts in state_district_cache.items():
         print('iterating through cache: state {0} and districts {1}'.format(state, districts))
         db.collection('states').document(state).set({
             'districts': districts
-        })
+        }, merge=True)
     for office, districts in office_district_cache.items():
         print('iterating through cache: office {0} and districts {1}'.format(office, districts))
         db.collection('offices').document(office).set({
             'districts': districts
-        })
+        }, merge=True)
 
 def election_seed():
     states = [snapshot.reference for snapshot in db.collection('states').get()]
-    for state in states:
-        state_id = state.id
-        print('getting elections for {0}'.format(state_id))
+
+    # fetch: every state's elections, several states at once
+    def fetch(state_id):
         params = { 'stateId': state_id, 'year': year }
-        r = get_request(elections_state_year_url, params)
+        yield state_id, get_request(elections_state_year_url, params)
+
+    # parse: each election with the state it was found for
+    def parse(fetched):
+        state_id, r = fetched
+        print('got elections for {0}'.format(state_id))
         root = ElementTree.fromstring(r.content)
         for election in root.iter('election'):
-            election_id = election.find('electionId').text
-            election_name = election.find('name').text
-            office_type_id = election.find('officeTypeId').text
-            print('inserting election record for election: {0}'.format(str(election_id)))
-            db.collection('elections').document(election_id).set({
-                'name': election_name,
-                'states': {
-                    state_id: True
-                },
-                'officeTypes': {
-                    office_type_id: True
-                }
-            })
-            db.collection('states').document(state_id).update({
-                'elections.{0}'.format(election_id): True
-            })
-            db.collection('office_types').document(office_type_id).update({
-                'elections.{0}'.format(election_id): True
-            })
+            yield state_id, records.election.extract(election)
+
+    # write: the election and its state / office type links
+    def write(parsed):
+        state_id, election_fields = parsed
+        election_id = election_fields['electionId']
+        election_name = election_fields['name']
+        office_type_id = election_fields['officeTypeId']
+        print('inserting election record for election: {0}'.format(str(election_id)))
+        db.collection('elections').document(election_id).set({
+            'name': election_name,
+            'states': {
+                state_id: True
+            },
+            'officeTypes': {
+                office_type_id: True
+            }
+        })
+        db.collection('states').document(state_id).update({
+            'elections.{0}'.format(election_id): True
+        })
+        db.collection('office_types').document(office_type_id).update({
+            'elections.{0}'.format(election_id): True
+        })
+
+    pipeline = Pipeline('election_seed')
+    pipeline.stage('fetch', fetch, fetch_workers)
+    pipeline.stage('parse', parse)
+    pipeline.stage('write', write)
+    pipeline.run([state.id for state in states])
 
 def candidate_seed():
-    candidate_summary = {
-        'total': 0,
-        'female': {
-            'total': 0,
-            'status': {}
-        },
-        'male': {
-            'total': 0,
-            'status': {}
-        }
-    }
-    elections = [snapshot.reference for snapshot in db.collection('elections').get()]
+    if journal.finished('candidate_seed'):
+        return
+    candidate_summary = journal.state('candidate_seed', new_summary())
+    # each election is counted on its own and added to the summary once it is
+    # fully written, so a journaled summary never counts an election twice
+    election_summaries = {}
+    summary_lock = threading.Lock()
     # iterate through all 2018 current elections
-    for election in elections:
-        election_id = election.id
+    elections = [snapshot.reference for snapshot in db.collection('elections').get()]
+    # districts district_seed didn't find are left unlinked, an update() on them would fail
+    district_ids = {snapshot.id for snapshot in db.collection('districts').select([]).get()}
+
+    # fetch: each election's candidates in chunks as the list streams in, with every
+    # chunk's bios, then the web addresses of its women, fetched concurrently
+    def fetch(election_id):
         print('getting candidates for electionId {0}'.format(election_id))
         params = { 'electionId': election_id }
-        r = get_request(candidates_election_url, params)
-        root = ElementTree.fromstring(r.content)
-        for candidate in root.iter('candidate'):
+        candidate_stream = iter_records(candidates_election_url, 'candidate', params)
+        for candidates in iter_chunks(candidate_stream, stream_batch_size):
+            candidate_ids = [candidate.find('candidateId').text for candidate in candidates]
+            bios = get_bios(candidate_ids)
+            # only for the candidates that get written
+            female_ids = [
+                candidate_id for candidate_id, bio_fields in zip(candidate_ids, bios)
+                if bio_fields['gender'] == 'Female'
+            ]
+            candidate_addresses = dict(zip(female_ids, get_addresses(female_ids)))
+            yield election_id, candidates, bios, candidate_addresses
+
+    # parse: one candidate document per candidate, with the reverse links and web
+    # addresses to write for the women
+    def parse(fetched):
+        election_id, candidates, bios, candidate_addresses = fetched
+        for candidate, bio_fields in zip(candidates, bios):
             # capture candidate election information
-            candidate_id = candidate.find('candidateId').text
-            election_stage = candidate.find('electionStage').text
-            election_state_id = candidate.find('electionStateId').text
-            election_office_id = candidate.find('electionOfficeId').text
-            election_date = candidate.find('electionDate').text
-            election_parties = candidate.find('electionParties').text
-            election_status = candidate.find('electionStatus').text
-            election_district_id = candidate.find('electionDistrictId').text
-            election_state_id = candidate.find('electionStateId').text
-            office_id = candidate.find('officeId').text # 'State House'
-            office_district_id = candidate.find('officeDistrictId').text # '20496'
-            office_state_id = candidate.find('officeStateId').text
-            office_status = candidate.find('officeStatus').text # 'active'
-            office_parties = candidate.find('officeParties').text
-        
-            # get candidate's detailed bio
-            print('getting candidate detailed bio for candidateId ' + candidate_id)
-            params = { 'candidateId': candidate_id }
-            r = get_request(candidate_bio_url, params)
-            root = ElementTree.fromstring(r.content)
-            
+            candidate_fields = records.candidate.extract(candidate)
+            candidate_id = candidate_fields['candidateId']
+            election_stage = candidate_fields['electionStage']
+            election_state_id = candidate_fields['electionStateId']
+            election_office_id = candidate_fields['electionOfficeId']
+            election_date = candidate_fields['electionDate']
+            election_parties = candidate_fields['electionParties']
+            election_status = candidate_fields['electionStatus']
+            election_district_id = candidate_fields['electionDistrictId']
+            election_state_id = candidate_fields['electionStateId']
+            office_id = candidate_fields['officeId'] # 'State House'
+            office_district_id = candidate_fields['officeDistrictId'] # '20496'
+            office_state_id = candidate_fields['officeStateId']
+            office_status = candidate_fields['officeStatus'] # 'active'
+            office_parties = candidate_fields['officeParties']
+    
             # capture candidate bio data
-            candidate = root.find('candidate')
-            is_female = candidate.find('gender').text == 'Female'
-            photo = candidate.find('photo').text
-            first_name = candidate.find('firstName').text
-            last_name = candidate.find('lastName').text
+            is_female = bio_fields['gender'] == 'Female'
+            photo = bio_fields['photo']
+            first_name = bio_fields['firstName']
+            last_name = bio_fields['lastName']
 
             # if office data, capture additional office data from bio
-            office = root.find('office')
-            in_office = 'true' if office else ''
-            title = office.find('title').text if in_office else '' # 'Senator'
-            first_elect = office.find('firstElect').text if in_office else ''
-            last_elect = office.find('lastElect').text if in_office else ''
-            next_elect = office.find('nextElect').text if in_office else '' # 2018
-            term_start = office.find('termStart').text if in_office else '' # 11/10/1992
-            term_end = office.find('termEnd').text if in_office else ''
+            in_office = bio_fields['inOffice']
+            title = bio_fields['title'] # 'Senator'
+            first_elect = bio_fields['firstElect']
+            last_elect = bio_fields['lastElect']
+            next_elect = bio_fields['nextElect'] # 2018
+            term_start = bio_fields['termStart'] # 11/10/1992
+            term_end = bio_fields['termEnd']
 
             # prepare to write candidate info
             candidate_record_obj = {
@@ -270,111 +363,115 @@ def candidate_seed():
                     'electedOfficeStatus' : office_status,
                     'isFemale' : is_female,
                     }
-    
-            # increment summary counter
-            candidate_summary['total'] += 1
-            if is_female:
-                candidate_summary['female']['total'] += 1
-                if election_status in candidate_summary['female']['status']:
-                    candidate_summary['female']['status'][election_status] += 1
-                else:
-                    candidate_summary['female']['status'][election_status] = 1
-            else:
-                candidate_summary['male']['total'] += 1
-                if election_status in candidate_summary['male']['status']:
-                    candidate_summary['male']['status'][election_status] += 1
-                else:
-                    candidate_summary['male']['status'][election_status] = 1
 
+            # (collection, document, link map) of every reverse link to the candidate
+            links = []
+            addresses = {'addresses': []}
             if is_female:
-                print('inserting candidate record for candidate: {0}'.format(candidate_id))
-                db.collection('candidates').document(candidate_id).set(candidate_record_obj)
-
-                print('updated candidate summary:')
-                print(candidate_summary)
-
                 # inject linked records conditionally
-                if election_district_id:
+                if election_district_id in district_ids:
                     candidate_record_obj['runningDistricts'] = {
                         election_district_id: True,
                     }
-                    db.collection('districts').document(election_district_id).update({
-                        'runningCandidates.{0}'.format(candidate_id): True,
-                    })
+                    links.append(('districts', election_district_id, 'runningCandidates'))
                 if election_state_id:
                     candidate_record_obj['runningStates'] =  { 
                         election_state_id: True, 
                     }
-                    db.collection('states').document(election_state_id).update({
-                        'runningCandidates.{0}'.format(candidate_id): True,
-                    })
+                    links.append(('states', election_state_id, 'runningCandidates'))
                 if election_office_id:
                     candidate_record_obj['runningOffices'] = {
                         election_office_id: True,
                     }
-                    db.collection('offices').document(election_office_id).update({
-                        'runningCandidates.{0}'.format(candidate_id): True,
-                    })
-                if office_district_id:
+                    links.append(('offices', election_office_id, 'runningCandidates'))
+                if office_district_id in district_ids:
                     candidate_record_obj['electedDistricts'] = {
                         office_district_id: True,
                     }
-                    db.collection('districts').document(office_district_id).update({
-                        'electedCandidates.{0}'.format(candidate_id): True,
-                    })
+                    links.append(('districts', office_district_id, 'electedCandidates'))
                 if office_state_id:
                     candidate_record_obj['electedStates'] =  { 
                         office_state_id: True, 
                     }
-                    db.collection('states').document(office_state_id).update({
-                        'electedCandidates.{0}'.format(candidate_id): True,
-                    })
+                    links.append(('states', office_state_id, 'electedCandidates'))
                 if office_id:
                     candidate_record_obj['electedOffices'] = {
                         office_id: True,
                     }
-                    db.collection('offices').document(office_id).update({
-                        'electedCandidates.{0}'.format(candidate_id): True,
-                    })
-
-                # update the candidate record with any linked data
-                db.collection('candidates').document(candidate_id).update(candidate_record_obj)
+                    links.append(('offices', office_id, 'electedCandidates'))
 
                 # get the web addresses info for candidate to store in addresses
-                params = { 'candidateId' : candidate_id }
-                r = get_request(candidate_address_url, params)
-                root = ElementTree.fromstring(r.content)
-                addresses = {'addresses': []}
-                for address in root.iter('address'):
-                    address_type_id = address.find('webAddressTypeId').text
-                    address_type = address.find('webAddressType').text
-                    address = address.find('webAddress').text
-                    
+                for address_fields in candidate_addresses[candidate_id]:
+                    address_type_id = address_fields['webAddressTypeId']
+                    address_type = address_fields['webAddressType']
+                    address = address_fields['webAddress']
+                
                     addresses['addresses'].append({
                         'webAddressTypeId' : address_type_id,
                         'webAddressType' : address_type,
                         'webAddress' : address,
                     })
-        
-                    print('inserting candidate address record for candidate: {0}'.format(candidate_id))
-                    db.collection('candidates').document(candidate_id).update(addresses)
+
+            yield election_id, candidate_record_obj, links, addresses
+
+    # write: count every candidate and write the women with their links and addresses
+    def write(parsed):
+        election_id, candidate_record_obj, links, addresses = parsed
+        candidate_id = candidate_record_obj['candidateId']
+        is_female = candidate_record_obj['isFemale']
+
+        # increment summary counter
+        with summary_lock:
+            election_summary = election_summaries.setdefault(election_id, new_summary())
+            count_candidate(election_summary, is_female, candidate_record_obj['runningStatus'])
+
+        if is_female:
+
+            for collection, document_id, link_field in links:
+                add_link('candidate_seed', collection, document_id, link_field, candidate_id)
+
+            # write the candidate record with its linked data and addresses in one go
+            print('inserting candidate record for candidate: {0}'.format(candidate_id))
+            if addresses['addresses']:
+                candidate_record_obj['addresses'] = addresses['addresses']
+            set_document('candidate_seed', 'candidates', candidate_id, candidate_record_obj)
+
+    def election_done(election_id):
+        with summary_lock:
+            merge_summary(candidate_summary, election_summaries.pop(election_id, new_summary()))
+            print('updated candidate summary:')
+            print(candidate_summary)
+            journal.complete('candidate_seed', election_id, candidate_summary)
+
+    election_ids = [election.id for election in elections
+                    if not journal.done('candidate_seed', election.id)]
+    pipeline = Pipeline('candidate_seed', on_unit_done=election_done)
+    # election_streams elections at a time, each fetching its bios and addresses on fetch_workers threads
+    pipeline.stage('fetch', fetch, election_streams)
+    pipeline.stage('parse', parse)
+    pipeline.stage('write', write)
+    pipeline.run(election_ids)
+
+    if staging is not None:
+        publish_staged('candidate_seed')
+    writes.flush()
 
     # After the entire function runs, store the summary
     print('Candidate seed finished! Writing summary')
     db.collection('stats').document('candidates').set(candidate_summary)        
+    journal.finish('candidate_seed', candidate_summary)
 
-def sig_seed(sig_id):
-    params = {'sigId': sig_id}
-    r = get_request(sig_url, params)
+def sig_seed(sig_id, r):
     root = ElementTree.fromstring(r.content)
-    sig_id = root.find('sigId').text
-    state_id = root.find('stateId').text
-    name = root.find('name').text
-    description = root.find('description').text
-    url = root.find('url').text
+    sig_fields = records.sig.extract(root)
+    sig_id = sig_fields['sigId']
+    state_id = sig_fields['stateId']
+    name = sig_fields['name']
+    description = sig_fields['description']
+    url = sig_fields['url']
     
     print('inserting sig record for ' + sig_id)
-    db.collection('sigs').document(sig_id).set({
+    set_document('candidate_ratings_seed', 'sigs', sig_id, {
         'states': {
             state_id: True
         },
@@ -382,23 +479,22 @@ def sig_seed(sig_id):
         'description': description,
         'url': url,
     })
-    db.collection('states').document(state_id).update({
-        'sigs.{0}'.format(sig_id): True
-    })
-
-def rating_seed(sig_id):
-    params = {'sigId': sig_id}
-    r = get_request(ratings_url, params)
-    root = ElementTree.fromstring(r.content)
-    for rating in root.iter('rating'):
-        rating_id = rating.find('ratingId').text
-        time = rating.find('timespan').text
-        name = rating.find('ratingName').text
-        text = rating.find('ratingText').text
-        if year in time or previous_year in time:
+    add_link('candidate_ratings_seed', 'states', state_id, 'sigs', sig_id)
+
+def rating_seed(sig_id, r, ratings):
+    # r is the sig's whole Rating.getSigRatings list; ratings already seeded are
+    # skipped, a set() would wipe the categories / scores written onto them
+    for rating in parse_stream([r.content], 'rating'):
+        rating_fields = records.rating.extract(rating)
+        rating_id = rating_fields['ratingId']
+        time = rating_fields['timespan']
+        name = rating_fields['ratingName']
+        text = rating_fields['ratingText']
+        if rating_id not in ratings and (year in time or previous_year in time):
+            ratings[rating_id] = True
             
             print('inserting rating record for {0}'.format(rating_id))
-            db.collection('ratings').document(rating_id).set({
+            set_document('candidate_ratings_seed', 'ratings', rating_id, {
                 'timespan': time,
                 'ratingName': name,
                 'ratingText': text,
@@ -406,99 +502,154 @@ def rating_seed(sig_id):
                     sig_id: True,
                 }
             })
-            db.collection('sigs').document(sig_id).update({
-                'ratings.{0}'.format(rating_id): True
-            })
+            add_link('candidate_ratings_seed', 'sigs', sig_id, 'ratings', rating_id)
         
 def candidate_ratings_seed():
+    ''' in three phases: gather every candidate's recent ratings, seed the sigs and
+    ratings they name (each sig fetched once), then write the scores '''
+    if journal.finished('candidate_ratings_seed'):
+        return
     candidates = [snapshot.reference for snapshot in db.collection('candidates').get()]
     # local sigs and ratings caches so don't continue to write data for unique sigs / ratings
-    sigs = {}
-    ratings = {}
-    for candidate in candidates:
-        candidate_id = candidate.id
-        print('getting ratings for candidate: {0}'.format(candidate_id))
+    seeded = journal.state('candidate_ratings_seed', {'sigs': {}, 'ratings': {}})
+    sigs = seeded['sigs']
+    ratings = seeded['ratings']
+
+    # PHASE 1: each candidate's recent ratings, several candidates at once
+
+    # fetch: a candidate's ratings
+    def fetch(candidate_id):
         print('getting ratings for candidateId ' + candidate_id)
         params = {'candidateId': candidate_id}
-        r = get_request(candidate_ratings_url, params)
-        root = ElementTree.fromstring(r.content)
-        parent_ratings = root.findall('rating')
-        if parent_ratings: 
-            for rating in parent_ratings:
-                # return xml has nested 'rating' objects.
-                # so use findall which only finds objects that are direct children of root.
-                # prepare to seed ratings for the candidate
-                score = rating.find('rating').text
-                name = rating.find('ratingName').text
-                text = rating.find('ratingText').text
-                sig_id = rating.find('sigId').text
-                rating_id = rating.find('ratingId').text
-                time = rating.find('timespan').text
-
-                # seed info for recent ratings / sigs
-                # update local stores so don't repeat seeding
-                if previous_year in time or year in time:
-                    # if it's a new sig, seed the information
-                    if sig_id not in sigs:
-                        sigs[sig_id] = True
-                        sig_seed(sig_id)
-
-                    # if it's a new rating, seed the information
-                    if rating_id not in ratings:
-                        ratings[rating_id] = True
-                        rating_seed(sig_id)
-                        
-                        # also seed the categories associated with the new rating
-                        # note, there are several duplicate categories for a single rating in the vote smart data
-                        # will have to clean up in our database ... 
-                        categories = rating.find('categories')
-                        for category in categories.iter('category'):
-                            category_id = category.find('categoryId').text
-                            try:
-                                db.collection('categories').document(category_id).update({
-                                    'sigs.{0}'.format(sig_id): True,
-                                    'ratings.{0}'.format(rating_id): True,
-                                })
-                            except google.cloud.exceptions.NotFound:
-                                db.collection('categories').document(category_id).set({
-                                    'notInVoteSmart': True,
-                                    'sigs.{0}'.format(sig_id): True,
-                                    'ratings.{0}'.format(rating_id): True,
-                                })
-                            db.collection('sigs').document(sig_id).update({
-                                'categories.{0}'.format(category_id): True,
-                            })
-                            db.collection('ratings').document(rating_id).update({
-                                'categories.{0}'.format(category_id): True,
-                            })
-                        
-                    print('inserting candidate rating score for rating: {0} and candidate: {1}'.format(rating_id, candidate_id))
-                    # write the candidate's rating info to scores table
-                    score_id = candidate_id + rating_id
-                    score_ref = db.collection('scores').document(score_id).set({
-                        'ratings': {
-                            rating_id: True
-                        },
-                        'sigs': {
-                            sig_id: True
-                        },
-                        'candidates': {
-                            candidate_id: True
-                        },
-                        'score': score,
-                        'name': name,
-                        'text': text,
-                    })
-
-                    db.collection('ratings').document(rating_id).update({
-                        'scores.{0}'.format(score_id): True
-                    })
-                    db.collection('sigs').document(sig_id).update({
-                        'scores.{0}'.format(score_id): True
+        yield candidate_id, get_request(candidate_ratings_url, params)
+
+    # parse: the recent ratings, with the categories of each
+    def parse(fetched):
+        candidate_id, r = fetched
+        # return xml has nested 'rating' objects.
+        # parse_stream only yields the outermost ones, the direct children of root.
+        for rating in parse_stream([r.content], 'rating'):
+            candidate_rating_fields = records.candidate_rating.extract(rating)
+            time = candidate_rating_fields['timespan']
+            if previous_year in time or year in time:
+                categories = rating.find('categories')
+                category_ids = [] if categories is None else [
+                    records.category.extract(category)['categoryId'] for category in categories.iter('category')
+                ]
+                yield candidate_id, candidate_rating_fields, category_ids
+
+    # gather: keep them until every candidate is in (one thread, no locking)
+    candidate_ratings = {}
+    def gather(parsed):
+        candidate_id, candidate_rating_fields, category_ids = parsed
+        candidate_ratings.setdefault(candidate_id, []).append((candidate_rating_fields, category_ids))
+
+    candidate_ids = [candidate.id for candidate in candidates
+                     if not journal.done('candidate_ratings_seed', candidate.id)]
+    pipeline = Pipeline('candidate_ratings_seed')
+    pipeline.stage('fetch', fetch, fetch_workers)
+    pipeline.stage('parse', parse)
+    pipeline.stage('gather', gather)
+    pipeline.run(candidate_ids)
+
+    # PHASE 2: the distinct new sigs, and the ratings of every sig with a new rating
+
+    all_sig_ids = {}
+    new_sig_ids = {}
+    rating_sig_ids = {}
+    # new rating id -> (its sig, its category ids, in order, as dict keys).
+    # note, there are several duplicate categories for a single rating in the vote smart data
+    rating_category_ids = {}
+    for rated in candidate_ratings.values():
+        for candidate_rating_fields, category_ids in rated:
+            sig_id = candidate_rating_fields['sigId']
+            rating_id = candidate_rating_fields['ratingId']
+            all_sig_ids[sig_id] = True
+            if sig_id not in sigs:
+                new_sig_ids[sig_id] = True
+            if rating_id not in ratings:
+                rating_sig_ids[sig_id] = True
+                rating_category_ids.setdefault(rating_id, (sig_id, {}))[1].update(dict.fromkeys(category_ids, True))
+
+    new_sig_ids = list(new_sig_ids)
+    rating_sig_ids = list(rating_sig_ids)
+    # a recorded snapshot gets every sig, so it replays into a sink without them
+    fetched_sig_ids = list(all_sig_ids) if recording() else new_sig_ids
+    fetched_rating_sig_ids = list(all_sig_ids) if recording() else rating_sig_ids
+    print('getting {0} new sigs and the ratings of {1} sigs'.format(len(new_sig_ids), len(rating_sig_ids)))
+    sig_responses = dict(zip(fetched_sig_ids, fetch_all(sig_url, [{'sigId': sig_id} for sig_id in fetched_sig_ids])))
+    rating_responses = dict(zip(fetched_rating_sig_ids,
+                                fetch_all(ratings_url, [{'sigId': sig_id} for sig_id in fetched_rating_sig_ids])))
+    for sig_id in new_sig_ids:
+        sig_seed(sig_id, sig_responses[sig_id])
+        sigs[sig_id] = True
+    for sig_id in rating_sig_ids:
+        rating_seed(sig_id, rating_responses[sig_id], ratings)
+
+    # also seed the categories associated with each new rating, once
+    for rating_id, (sig_id, category_ids) in rating_category_ids.items():
+        # a rating the sig no longer lists as recent still gets its scores
+        ratings[rating_id] = True
+        for category_id in category_ids:
+            if staging is not None:
+                # publish_staged flags categories vote smart doesn't list
+                staging.link('candidate_ratings_seed', 'categories', category_id, 'sigs', sig_id)
+                staging.link('candidate_ratings_seed', 'categories', category_id, 'ratings', rating_id)
+            else:
+                # written directly: whether the category exists decides the write
+                try:
+                    db.collection('categories').document(category_id).update({
+                        'sigs.{0}'.format(sig_id): True,
+                        'ratings.{0}'.format(rating_id): True,
                     })
-                    db.collection('candidates').document(candidate_id).update({
-                        'scores.{0}'.format(score_id): True
+                except google_exceptions.NotFound:
+                    db.collection('categories').document(category_id).set({
+                        'notInVoteSmart': True,
+                        'sigs.{0}'.format(sig_id): True,
+                        'ratings.{0}'.format(rating_id): True,
                     })
+            add_link('candidate_ratings_seed', 'sigs', sig_id, 'categories', category_id)
+            add_link('candidate_ratings_seed', 'ratings', rating_id, 'categories', category_id)
+
+    # PHASE 3: each candidate's scores
+
+    for candidate_id in candidate_ids:
+        for candidate_rating_fields, _ in candidate_ratings.get(candidate_id, []):
+            write_score(candidate_id, candidate_rating_fields)
+        journal.complete('candidate_ratings_seed', candidate_id, seeded)
+    if staging is not None:
+        publish_staged('candidate_ratings_seed')
+    writes.flush()
+    journal.finish('candidate_ratings_seed')
+
+def write_score(candidate_id, candidate_rating_fields):
+    score = candidate_rating_fields['rating']
+    name = candidate_rating_fields['ratingName']
+    text = candidate_rating_fields['ratingText']
+    sig_id = candidate_rating_fields['sigId']
+    rating_id = candidate_rating_fields['ratingId']
+
+    print('inserting candidate rating score for rating: {0} and candidate: {1}'.format(rating_id, candidate_id))
+    # write the candidate's rating info to scores table
+    score_id = candidate_id + rating_id
+    set_document('candidate_ratings_seed', 'scores', score_id, {
+        'ratings': {
+            rating_id: True
+        },
+        'sigs': {
+            sig_id: True
+        },
+        'candidates': {
+            candidate_id: True
+        },
+        'score': score,
+        'name': name,
+        'text': text,
+    })
+
+    add_link('candidate_ratings_seed', 'ratings', rating_id, 'scores', score_id)
+    add_link('candidate_ratings_seed', 'sigs', sig_id, 'scores', score_id)
+    add_link('candidate_ratings_seed', 'candidates', candidate_id, 'scores', score_id)
 
 # office_type_seed()
 # state_seed()
@@ -511,4 +662,8 @@ def candidate_ratings_seed():
 # category_seed()
 # candidate_ratings_seed()
 
-print('WOMANUP DB SEEDING COMPLETE!')
\ No newline at end of file
+# if a run dies part way, rerun with 'python firestore-seed.py --resume' to carry on where it stopped.
+# or run the stages you need with 'python seed.py --sink firestore [stage ...]', see seed.py.
+
+if __name__ == '__main__':
+    print('WOMANUP DB SEEDING COMPLETE!')
\ No newline at end of file
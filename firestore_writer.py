@@ -0,0 +1,97 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+
+# firestore rejects a WriteBatch with more than 500 writes
+max_batch_writes = 500
+
+
+class BatchPipeline:
+    ''' collects set / update calls into WriteBatch commits of up to 500 writes, committed concurrently.
+
+    batches that touch a document still being written by an earlier batch wait for
+    it, so writes to any one document land in the order they were made.
+    '''
+
+    def __init__(self, client, max_writes=max_batch_writes, workers=4, retries=3):
+        self.client = client
+        self.max_writes = min(max_writes, max_batch_writes)
+        self.retries = retries
+        self.failed = []
+        self.commits = 0
+        self.writes = 0
+        self._ops = []
+        self._paths = set()
+        self._in_flight = []
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._lock = threading.Lock()
+
+    def set(self, ref, data, merge=False):
+        self._add(('set', ref, data, merge))
+
+    def update(self, ref, data):
+        self._add(('update', ref, data, None))
+
+    def _add(self, op):
+        with self._lock:
+            self._ops.append(op)
+            self._paths.add(op[1].path)
+            if len(self._ops) >= self.max_writes:
+                self._submit()
+
+    def _submit(self):
+        if not self._ops:
+            return
+        ops, paths = self._ops, self._paths
+        self._ops, self._paths = [], set()
+        self._in_flight = [(p, f) for p, f in self._in_flight if not f.done()]
+        depends_on = [f for p, f in self._in_flight if p & paths]
+        future = self._executor.submit(self._commit, ops, depends_on)
+        self._in_flight.append((paths, future))
+
+    def _commit(self, ops, depends_on):
+        # earlier batches were queued first, so they are already running or done
+        wait(depends_on)
+        for attempt in range(self.retries):
+            try:
+                self._batch(ops).commit()
+                with self._lock:
+                    self.commits += 1
+                    self.writes += len(ops)
+                return
+            except Exception as e:
+                error = e
+                time.sleep(0.5 * 2 ** attempt)
+        print('firestore batch of {0} writes failed ({1}), writing one at a time'.format(len(ops), error))
+        for op in ops:
+            try:
+                self._batch([op]).commit()
+                with self._lock:
+                    self.commits += 1
+                    self.writes += 1
+            except Exception as e:
+                print('firestore write to {0} failed: {1}'.format(op[1].path, e))
+                with self._lock:
+                    self.failed.append({'op': op[0], 'path': op[1].path, 'data': op[2], 'error': str(e)})
+
+    def _batch(self, ops):
+        batch = self.client.batch()
+        for kind, ref, data, merge in ops:
+            if kind == 'set':
+                batch.set(ref, data, merge=merge)
+            else:
+                batch.update(ref, data)
+        return batch
+
+    def flush(self):
+        ''' commit whatever is buffered and wait for every batch in flight '''
+        with self._lock:
+            self._submit()
+            futures = [f for _, f in self._in_flight]
+            self._in_flight = []
+        wait(futures)
+
+    def report(self):
+        with self._lock:
+            return {'commits': self.commits, 'writes': self.writes, 'failed': len(self.failed)}
@@ -0,0 +1,44 @@
+import importlib
+import threading
+
+
+# LAZY IMPORTS AND CLIENTS
+# the firebase seeders import firebase_admin / google.cloud and connect on first
+# use instead of at import, so loading a seeder (e.g. to run one of its stages)
+# does no I/O and doesn't pay for libraries the run never touches.
+
+
+class LazyModule:
+    ''' a module imported on first attribute access '''
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def _get_module(self):
+        with self._lock:
+            if self._module is None:
+                self._module = importlib.import_module(self._name)
+            return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._get_module(), attr)
+
+
+class LazyClient:
+    ''' stands in for whatever create() returns, which is called once, on first attribute access '''
+
+    def __init__(self, create):
+        self._create = create
+        self._client = None
+        self._lock = threading.Lock()
+
+    def _get_client(self):
+        with self._lock:
+            if self._client is None:
+                self._client = self._create()
+            return self._client
+
+    def __getattr__(self, attr):
+        return getattr(self._get_client(), attr)
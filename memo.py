@@ -0,0 +1,48 @@
+import threading
+from concurrent.futures import Future
+
+
+class Memo:
+    ''' results keyed by id, computed at most once per run even when several threads ask at once '''
+
+    def __init__(self, name):
+        self.name = name
+        self.computed = 0
+        self.saved = 0
+        self._results = {}
+        self._lock = threading.Lock()
+
+    def get_many(self, keys, compute):
+        ''' results for keys, in order; compute(keys) is only called with the keys never asked for before '''
+        futures = []
+        missing = []
+        with self._lock:
+            for key in keys:
+                future = self._results.get(key)
+                if future is None:
+                    future = self._results[key] = Future()
+                    missing.append((key, future))
+                else:
+                    self.saved += 1
+                futures.append(future)
+        if missing:
+            try:
+                results = compute([key for key, _ in missing])
+            except Exception as e:
+                # forget the keys so a later call can try them again
+                with self._lock:
+                    for key, _ in missing:
+                        del self._results[key]
+                for _, future in missing:
+                    future.set_exception(e)
+                raise
+            for (_, future), result in zip(missing, results):
+                future.set_result(result)
+            with self._lock:
+                self.computed += len(missing)
+        # a key another thread is computing is waited for here
+        return [future.result() for future in futures]
+
+    def stats(self):
+        with self._lock:
+            return {'computed': self.computed, 'saved': self.saved}
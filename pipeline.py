@@ -0,0 +1,154 @@
+import os
+import queue
+import threading
+import time
+
+
+# PIPELINE SETTINGS
+# each stage reads from a bounded queue; when a queue is full the stage feeding
+# it blocks, so a slow sink holds back fetching instead of piling up responses.
+
+queue_size = int(os.environ.get('PIPELINE_QUEUE_SIZE', 32))
+
+_done = object()
+
+
+class Stage:
+
+    def __init__(self, name, func, workers, size):
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.queue = queue.Queue(size)
+        self.items_in = 0
+        self.items_out = 0
+        self.busy = 0.0
+        self.blocked = 0.0
+        self.running = workers
+
+
+class Pipeline:
+    ''' stages connected by bounded queues, each stage run by its own worker threads.
+
+    a stage's func takes one item and returns (or yields) the items for the next
+    stage; whatever the last stage returns is dropped. every item fed in is a
+    work unit: on_unit_done(item) is called once everything derived from it has
+    left the last stage, whatever order the stages finished its parts in.
+    '''
+
+    def __init__(self, name, on_unit_done=None):
+        self.name = name
+        self.on_unit_done = on_unit_done
+        self.stages = []
+        self.elapsed = 0.0
+        self._units = {}
+        self._outstanding = {}
+        self._error = None
+        self._failed = threading.Event()
+        self._lock = threading.Lock()
+
+    def stage(self, name, func, workers=1, size=None):
+        self.stages.append(Stage(name, func, workers, size or queue_size))
+        return self
+
+    def run(self, items):
+        ''' feed items through every stage and wait for the last one; re-raises the first stage error '''
+        started = time.monotonic()
+        threads = []
+        for i, stage in enumerate(self.stages):
+            following = self.stages[i + 1] if i + 1 < len(self.stages) else None
+            for n in range(stage.workers):
+                thread = threading.Thread(target=self._work, args=(stage, following),
+                                          name='{0}-{1}-{2}'.format(self.name, stage.name, n), daemon=True)
+                thread.start()
+                threads.append(thread)
+
+        first = self.stages[0]
+        for unit_id, item in enumerate(items):
+            if self._failed.is_set():
+                break
+            with self._lock:
+                self._units[unit_id] = item
+                self._outstanding[unit_id] = 1
+            first.queue.put((unit_id, item))
+        for _ in range(first.workers):
+            first.queue.put(_done)
+        for thread in threads:
+            thread.join()
+        self.elapsed = time.monotonic() - started
+        if self._error is not None:
+            raise self._error
+
+    def _work(self, stage, following):
+        while True:
+            entry = stage.queue.get()
+            if entry is _done:
+                break
+            if self._failed.is_set():
+                # drain so the stages feeding this one don't block forever
+                continue
+            unit_id, item = entry
+            started = time.monotonic()
+            blocked = 0.0
+            try:
+                results = stage.func(item)
+                if following is None and results is not None:
+                    # a sink may still be a generator, run it through
+                    for _ in results:
+                        pass
+                elif results is not None:
+                    for result in results:
+                        with self._lock:
+                            self._outstanding[unit_id] += 1
+                            stage.items_out += 1
+                        put_started = time.monotonic()
+                        following.queue.put((unit_id, result))
+                        blocked += time.monotonic() - put_started
+            except Exception as e:
+                self._fail(stage, e)
+                continue
+            with self._lock:
+                stage.items_in += 1
+                stage.busy += time.monotonic() - started - blocked
+                stage.blocked += blocked
+                self._outstanding[unit_id] -= 1
+                unit_done = self._outstanding[unit_id] == 0
+                if unit_done:
+                    del self._outstanding[unit_id]
+                    unit = self._units.pop(unit_id)
+            if unit_done and self.on_unit_done is not None:
+                try:
+                    self.on_unit_done(unit)
+                except Exception as e:
+                    self._fail(stage, e)
+
+        # the last worker out of a stage tells the next stage's workers to stop
+        with self._lock:
+            stage.running -= 1
+            last = stage.running == 0
+        if last and following is not None:
+            for _ in range(following.workers):
+                following.queue.put(_done)
+
+    def _fail(self, stage, error):
+        with self._lock:
+            if self._error is None:
+                self._error = error
+                print('pipeline {0} failed in stage {1}: {2}'.format(self.name, stage.name, error))
+        self._failed.set()
+
+    def report(self):
+        ''' per stage items in / out and seconds spent working vs blocked on a full queue '''
+        with self._lock:
+            return {
+                'elapsed': round(self.elapsed, 2),
+                'stages': {
+                    stage.name: {
+                        'workers': stage.workers,
+                        'in': stage.items_in,
+                        'out': stage.items_out,
+                        'busy': round(stage.busy, 2),
+                        'blocked': round(stage.blocked, 2),
+                    } for stage in self.stages
+                },
+            }
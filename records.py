@@ -0,0 +1,118 @@
+# VOTE SMART RECORD SCHEMAS
+# each entity lists the child elements the seeders read, once. a schema compiles
+# an extractor for the child layout of the first element it sees (vote smart
+# always sends children in the same order): every field is read by position,
+# checked against its tag, and only looked up with find() when the layout
+# differs. a missing element (or a missing record) comes back as the schema's
+# default rather than raising on .text.
+
+
+class RecordSchema:
+    ''' the fields of one vote smart entity; extract() returns {field: text} '''
+
+    def __init__(self, tag, fields, default=None):
+        self.tag = tag
+        self.fields = tuple(fields)
+        self.default = default
+        self._empty = dict.fromkeys(self.fields, default)
+        self._extract = None
+
+    def extract(self, elem):
+        if elem is None:
+            return self._empty.copy()
+        if self._extract is None:
+            self._extract = self._compile(elem)
+        return self._extract(elem)
+
+    def extract_child(self, root):
+        ''' extract the first <tag> child of root, e.g. the <candidate> of a bio response '''
+        return self.extract(root.find(self.tag))
+
+    def _compile(self, sample):
+        positions = {}
+        for i, child in enumerate(sample):
+            positions.setdefault(child.tag, i)
+        lines = ['def extract(elem):', '    n = len(elem)']
+        values = []
+        for k, field in enumerate(self.fields):
+            child = 'c{0}'.format(k)
+            i = positions.get(field)
+            if i is None:
+                lines.append('    {0} = elem.find({1!r})'.format(child, field))
+            else:
+                lines.append('    {0} = elem[{1}] if {1} < n else None'.format(child, i))
+                lines.append('    if {0} is None or {0}.tag != {1!r}:'.format(child, field))
+                lines.append('        {0} = elem.find({1!r})'.format(child, field))
+            values.append('{0!r}: default if {1} is None else {1}.text'.format(field, child))
+        lines.append('    return {{{0}}}'.format(', '.join(values)))
+        namespace = {'default': self.default}
+        exec('\n'.join(lines), namespace)
+        return namespace['extract']
+
+
+office = RecordSchema('office', [
+    'officeId', 'officeTypeId', 'officeLevelId', 'officeBranchId', 'name',
+])
+
+state = RecordSchema('state', [
+    'stateId', 'name',
+])
+
+category = RecordSchema('category', [
+    'categoryId', 'name',
+])
+
+district = RecordSchema('district', [
+    'districtId', 'name',
+])
+
+election = RecordSchema('election', [
+    'electionId', 'name', 'officeTypeId',
+])
+
+# a <candidate> of Candidates.getByElection
+candidate = RecordSchema('candidate', [
+    'candidateId', 'electionStage', 'electionStateId', 'electionOfficeId',
+    'electionDate', 'electionParties', 'electionStatus', 'electionDistrictId',
+    'officeId', 'officeDistrictId', 'officeStateId', 'officeStatus',
+    'officeParties',
+])
+
+# the <candidate> and <office> of CandidateBio.getBio; office fields are ''
+# when the candidate holds no office
+bio = RecordSchema('candidate', [
+    'candidateId', 'gender', 'photo', 'firstName', 'lastName',
+])
+
+bio_office = RecordSchema('office', [
+    'title', 'firstElect', 'lastElect', 'nextElect', 'termStart', 'termEnd',
+], default='')
+
+# Rating.getSig answers with the sig fields directly under the root
+sig = RecordSchema('sig', [
+    'sigId', 'stateId', 'name', 'description', 'url',
+])
+
+# a <rating> of Rating.getSigRatings
+rating = RecordSchema('rating', [
+    'ratingId', 'timespan', 'ratingName', 'ratingText',
+])
+
+# an outer <rating> of Rating.getCandidateRating; 'rating' is the score
+candidate_rating = RecordSchema('rating', [
+    'rating', 'ratingName', 'ratingText', 'sigId', 'ratingId', 'timespan',
+])
+
+address = RecordSchema('address', [
+    'webAddressTypeId', 'webAddressType', 'webAddress',
+])
+
+
+def extract_bio(root):
+    ''' the <candidate> fields of a CandidateBio.getBio response, its <office> fields and inOffice ('true' or '') '''
+    office = root.find('office')
+    in_office = 'true' if office is not None and len(office) else ''
+    fields = bio.extract_child(root)
+    fields.update(bio_office.extract(office if in_office else None))
+    fields['inOffice'] = in_office
+    return fields
@@ -0,0 +1,211 @@
+import random
+import threading
+import time
+
+
+# PUSH KEYS
+# same layout as the firebase clients' push ids: 8 characters of millisecond
+# timestamp then 12 random characters, incremented when two keys share a
+# millisecond, so keys generated here sort chronologically like server pushes.
+
+push_chars = '-0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ_abcdefghijklmnopqrstuvwxyz'
+
+_last_push_time = 0
+_last_rand_chars = []
+_push_lock = threading.Lock()
+
+def push_key():
+    ''' a new push key, generated locally instead of with a push() round trip '''
+    global _last_push_time, _last_rand_chars
+    with _push_lock:
+        now = int(time.time() * 1000)
+        duplicate_time = now == _last_push_time
+        _last_push_time = now
+
+        time_chars = []
+        for _ in range(8):
+            time_chars.append(push_chars[now % 64])
+            now //= 64
+        key = ''.join(reversed(time_chars))
+
+        if not duplicate_time:
+            _last_rand_chars = [random.randrange(64) for _ in range(12)]
+        else:
+            i = 11
+            while i >= 0 and _last_rand_chars[i] == 63:
+                _last_rand_chars[i] = 0
+                i -= 1
+            _last_rand_chars[i] += 1
+        return key + ''.join(push_chars[c] for c in _last_rand_chars)
+
+
+# MULTI-LOCATION UPDATES
+
+class FanOutWriter:
+    ''' collects path -> value writes and sends them as atomic multi-location updates '''
+
+    def __init__(self, root, max_paths=500):
+        self.root = root
+        self.max_paths = max_paths
+        self.updates = 0
+        self.paths_written = 0
+        self._pending = {}
+        self._ancestors = set()
+        self._lock = threading.Lock()
+
+    def set(self, path, value):
+        path = path.strip('/')
+        with self._lock:
+            # one update may not contain a path and one of its descendants
+            if self._overlaps(path):
+                self._flush()
+            self._add(path, value)
+            if len(self._pending) >= self.max_paths:
+                self._flush()
+
+    def set_entity(self, paths):
+        ''' write every path of one entity in the same update, never split across two '''
+        paths = {path.strip('/'): value for path, value in paths.items()}
+        with self._lock:
+            if (len(self._pending) + len(paths) > self.max_paths
+                    or any(self._overlaps(path) for path in paths)):
+                self._flush()
+            for path, value in paths.items():
+                self._add(path, value)
+            if len(self._pending) >= self.max_paths:
+                self._flush()
+
+    def _add(self, path, value):
+        self._pending[path] = value
+        parts = path.split('/')
+        for i in range(1, len(parts)):
+            self._ancestors.add('/'.join(parts[:i]))
+
+    def _overlaps(self, path):
+        if path in self._ancestors:
+            return True
+        parts = path.split('/')
+        return any('/'.join(parts[:i]) in self._pending for i in range(1, len(parts)))
+
+    def _flush(self):
+        if not self._pending:
+            return
+        self.root.update(self._pending)
+        self.updates += 1
+        self.paths_written += len(self._pending)
+        self._pending = {}
+        self._ancestors = set()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def report(self):
+        with self._lock:
+            return {'updates': self.updates, 'paths': self.paths_written}
+
+
+def child_paths(path, node):
+    ''' a path per field of node and per member of its link maps, so writing them merges node into what is at path '''
+    paths = {}
+    for field, value in node.items():
+        if isinstance(value, dict):
+            for member, member_value in value.items():
+                paths['{0}/{1}/{2}'.format(path, field, member)] = member_value
+        else:
+            paths['{0}/{1}'.format(path, field)] = value
+    return paths
+
+
+# NATURAL KEYS
+# with natural keys every node is stored under its vote smart id (like the
+# firestore documents), so links are direct paths instead of order_by_child queries.
+
+natural_id_fields = {
+    'states': 'stateId',
+    'offices': 'officeId',
+    'office_types': 'officeTypeId',
+    'districts': 'districtId',
+    'elections': 'electionId',
+    'candidates': 'candidateId',
+    'categories': 'categoryId',
+}
+
+# link maps ({node key: True}) held by each collection, and the collection they point to
+link_fields = {
+    'states': {
+        'districts': 'districts',
+        'elections': 'elections',
+        'runningCandidates': 'candidates',
+        'electedCandidates': 'candidates',
+    },
+    'offices': {
+        'districts': 'districts',
+        'runningCandidates': 'candidates',
+        'electedCandidates': 'candidates',
+    },
+    'office_types': {
+        'elections': 'elections',
+    },
+    'districts': {
+        'offices': 'offices',
+        'states': 'states',
+        'runningCandidates': 'candidates',
+        'electedCandidates': 'candidates',
+    },
+    'elections': {
+        'states': 'states',
+        'officeTypes': 'office_types',
+    },
+    'candidates': {
+        'elections': 'elections',
+        'runningDistricts': 'districts',
+        'runningStates': 'states',
+        'runningOffices': 'offices',
+        'electedDistricts': 'districts',
+        'electedStates': 'states',
+        'electedOffices': 'offices',
+    },
+}
+
+def natural_key_tree(tree):
+    ''' re-key a push key tree by natural ids, rewriting every link map to match.
+
+    nodes that share a natural id (a candidate pushed once per election) are
+    merged: their link maps are combined and the last node's other fields win.
+    returns the new collections and a count of nodes per collection before / after.
+    '''
+    key_maps = {}
+    for collection, field in natural_id_fields.items():
+        key_maps[collection] = {
+            key: str(node[field])
+            for key, node in (tree.get(collection) or {}).items()
+            if isinstance(node, dict) and node.get(field) is not None
+        }
+
+    migrated = {}
+    counts = {}
+    for collection, key_map in key_maps.items():
+        nodes = tree.get(collection)
+        if not nodes:
+            continue
+        new_nodes = {}
+        for key, node in nodes.items():
+            new_key = key_map.get(key, key)
+            new_node = dict(node) if isinstance(node, dict) else node
+            if isinstance(new_node, dict):
+                for field, target in link_fields.get(collection, {}).items():
+                    if isinstance(new_node.get(field), dict):
+                        target_map = key_maps[target]
+                        new_node[field] = {target_map.get(k, k): v for k, v in new_node[field].items()}
+            if isinstance(new_nodes.get(new_key), dict) and isinstance(new_node, dict):
+                merged = new_nodes[new_key]
+                for field in link_fields.get(collection, {}):
+                    if isinstance(merged.get(field), dict) and isinstance(new_node.get(field), dict):
+                        new_node[field] = dict(merged[field], **new_node[field])
+                    elif field in merged and field not in new_node:
+                        new_node[field] = merged[field]
+            new_nodes[new_key] = new_node
+        migrated[collection] = new_nodes
+        counts[collection] = (len(nodes), len(new_nodes))
+    return migrated, counts
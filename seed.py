@@ -0,0 +1,299 @@
+''' seed woman up databases from vote smart, running the stages a target needs.
+
+    python seed.py --sink airtable                      every stage, into an empty base
+    python seed.py --sink firestore candidates          elections and candidates
+    python seed.py --sink airtable --update sync weekly
+    python seed.py --sink airtable --sink firestore weekly
+    python seed.py --sink firestore --replay latest     rebuild from the last --snapshot run
+    python seed.py --list
+
+stages whose dependencies are done run at the same time, e.g. office types,
+states, offices and categories all start together. a target brings in the
+stages it depends on, except the first-seed ones (office types, states, offices,
+categories, districts): those insert rather than update, so they only run when
+named or when no stage is, and not into a sink that already has their records
+unless --reseed says so. with several sinks, each
+stage runs on all of them at once and every vote smart response is fetched
+once for all of them (see votesmart_share.py). --resume is passed on to the
+seeders, see checkpoint.py. --snapshot keeps the run's vote smart responses, and
+--replay loads the sinks from such a snapshot without the network (see
+votesmart_snapshot.py).
+'''
+import argparse
+import importlib.util
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import votesmart
+from airtable_index import index_stats
+from votesmart_snapshot import latest_snapshot, snapshot_dir
+
+
+# SINKS
+# each sink's seeder script is only loaded when that sink is picked, so the
+# other sinks' libraries are never imported. the scripts share vote smart
+# fetching and parsing (votesmart.py, records.py) and each exposes the stage
+# functions below, writing the results its own way.
+
+sink_scripts = {
+    'airtable': 'airtable-seed.py',
+    'firestore': 'firestore-seed.py',
+    'firebase': 'firebase-seed.py',
+}
+
+# STAGES
+# stage name -> (seeder function, stages whose records it links to or reads).
+# a sink without a stage's function (airtable has no office_type_seed) leaves
+# that stage out, and whatever depends on it just runs without it.
+
+stages = {
+    'office_types': ('office_type_seed', []),
+    'states': ('state_seed', []),
+    'offices': ('office_seed', []),
+    'categories': ('category_seed', []),
+    'districts': ('district_seed', ['states', 'offices']),
+    # after districts, as before seed.py: firestore's district_seed ends writing the states and offices
+    'elections': ('election_seed', ['states', 'office_types', 'districts']),
+    'candidates': ('candidate_seed', ['elections', 'districts', 'states', 'offices']),
+    'addresses': ('candidate_address_seed', ['candidates']),
+    'ratings': ('candidate_ratings_seed', ['candidates', 'categories']),
+    'cleanup': ('rating_categories_cleanup', ['ratings']),
+}
+
+# first-seed stages and the collection / table each fills. they insert blindly,
+# so depending on one only orders the stages; it is not run unless named.
+base_stages = {
+    'office_types': 'office_types',
+    'states': 'states',
+    'offices': 'offices',
+    'categories': 'categories',
+    'districts': 'districts',
+}
+
+# each sink's writer; its report() counts the writes the sink rejected or that failed
+sink_writers = {
+    'airtable': 'writer',
+    'firestore': 'writes',
+    'firebase': 'fan_out',
+}
+
+# the weekly update, once the base tables are seeded
+weekly_stages = ['elections', 'candidates', 'addresses', 'ratings']
+
+
+def load_seeder(sink):
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), sink_scripts[sink])
+    spec = importlib.util.spec_from_file_location(sink + '_seed', path)
+    seeder = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(seeder)
+    return seeder
+
+def available_stages(seeder, sink):
+    return [name for name, (func, _) in stages.items() if hasattr(seeder, func)]
+
+def select_stages(targets, available, only=False):
+    ''' the targets plus, unless only, every stage they depend on apart from the first-seed ones '''
+    selected = set()
+    pending = list(targets)
+    while pending:
+        name = pending.pop()
+        if name in selected or name not in available:
+            continue
+        selected.add(name)
+        if not only:
+            pending.extend(dep for dep in stages[name][1] if dep not in base_stages)
+    return [name for name in available if name in selected]
+
+def run_stages(seeders, available, names, workers=None):
+    ''' run the stages, each as soon as the ones it depends on are done; returns timings and failures.
+
+    a stage runs on every sink that has it at the same time and is done when all of them are.
+    '''
+    waiting_on = {name: {dep for dep in stages[name][1] if dep in names} for name in names}
+    timings = {}
+    failed = []
+    running = {}
+    started = time.monotonic()
+
+    def run_on(sink, name):
+        sink_started = time.monotonic()
+        getattr(seeders[sink], stages[name][0])()
+        return round(time.monotonic() - sink_started, 2)
+
+    def run_stage(name):
+        stage_started = time.monotonic()
+        print('STAGE {0} STARTED'.format(name))
+        sinks = [sink for sink in seeders if name in available[sink]]
+        with ThreadPoolExecutor(max_workers=len(sinks)) as sink_executor:
+            futures = [(sink, sink_executor.submit(run_on, sink, name)) for sink in sinks]
+        sink_seconds = {}
+        errors = []
+        for sink, future in futures:
+            try:
+                sink_seconds[sink] = future.result()
+            except Exception as e:
+                errors.append('{0}: {1!r}'.format(sink, e))
+        if errors:
+            raise RuntimeError('; '.join(errors))
+        timings[name] = {
+            'started': round(stage_started - started, 2),
+            'seconds': round(time.monotonic() - stage_started, 2),
+            'sinks': sink_seconds,
+        }
+        print('STAGE {0} DONE in {1}s'.format(name, timings[name]['seconds']))
+
+    with ThreadPoolExecutor(max_workers=workers or len(names) or 1) as executor:
+        while True:
+            if not failed:
+                for name in [name for name, deps in waiting_on.items() if not deps]:
+                    del waiting_on[name]
+                    running[executor.submit(run_stage, name)] = name
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    future.result()
+                except Exception as e:
+                    # stages already running finish, nothing new starts
+                    print('STAGE {0} FAILED: {1}'.format(name, e))
+                    failed.append(name)
+                    continue
+                for deps in waiting_on.values():
+                    deps.discard(name)
+    skipped = list(waiting_on)
+    return timings, failed, skipped
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description='seed a woman up database from vote smart')
+    parser.add_argument('targets', nargs='*', metavar='stage',
+                        help='stages to seed (default: all); weekly is ' + ' '.join(weekly_stages))
+    parser.add_argument('--sink', dest='sinks', action='append', choices=sorted(sink_scripts),
+                        help='repeat to seed several sinks from one fetch pass (default: airtable)')
+    parser.add_argument('--only', action='store_true', help="don't also run the stages the targets depend on")
+    parser.add_argument('--update', choices=['sync', 'truncate'],
+                        help='airtable weekly tables: upsert them (sync) or empty them first (truncate)')
+    parser.add_argument('--workers', type=int, help='stages run at once (default: as many as are ready)')
+    parser.add_argument('--resume', action='store_true', help='skip work journaled by an interrupted run')
+    parser.add_argument('--reseed', action='store_true',
+                        help='run first-seed stages even on a sink that already has their records')
+    parser.add_argument('--list', action='store_true', help='print the stages and what they depend on')
+    parser.add_argument('--staging', metavar='FILE',
+                        help='firestore: stage documents and links in this sqlite file and publish them per stage')
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--snapshot', action='store_true', help="keep the run's vote smart responses in a new snapshot")
+    source.add_argument('--replay', metavar='SNAPSHOT',
+                        help="take vote smart responses from a snapshot file ('latest' for the newest) instead of the network")
+    args = parser.parse_args(argv)
+    args.sinks = list(dict.fromkeys(args.sinks or ['airtable']))
+    unknown = [name for name in args.targets if name not in stages and name != 'weekly']
+    if unknown:
+        parser.error('unknown stages: ' + ', '.join(unknown))
+    return args
+
+def main(argv):
+    args = parse_args(argv)
+    if args.list:
+        for name, (func, deps) in stages.items():
+            print('{0:<14} {1:<28} needs: {2}'.format(name, func, ', '.join(deps) or '-'))
+        return 0
+
+    seeders = {sink: load_seeder(sink) for sink in args.sinks}
+    available = {sink: available_stages(seeder, sink) for sink, seeder in seeders.items()}
+    any_sink = [name for name in stages if any(name in names for names in available.values())]
+    targets = []
+    for name in args.targets or any_sink:
+        targets.extend(weekly_stages if name == 'weekly' else [name])
+    missing = [name for name in targets if name not in any_sink]
+    if missing:
+        print('{0} has no {1} stage'.format(', '.join(args.sinks), ', '.join(missing)))
+        return 2
+    if args.staging:
+        staged = [seeder for seeder in seeders.values() if hasattr(seeder, 'use_staging')]
+        if not staged:
+            print('--staging is only for the firestore sink')
+            return 2
+        for seeder in staged:
+            seeder.use_staging(args.staging)
+    updated = [seeder for seeder in seeders.values() if hasattr(seeder, 'sync_prep')]
+    if args.update and not updated:
+        print('--update is only for the airtable sink')
+        return 2
+    names = select_stages(targets, any_sink, args.only)
+    for sink in args.sinks:
+        print('seeding {0}: {1}'.format(sink, ', '.join(name for name in names if name in available[sink])))
+    reseeded = ['{0} {1}'.format(sink, name) for sink, seeder in seeders.items()
+                for name in names if name in base_stages and name in available[sink]
+                and seeder.seeded(base_stages[name])]
+    if reseeded:
+        print('{0} already seeded, run again with --reseed to insert them a second time'.format(', '.join(reseeded)))
+        if not args.reseed:
+            return 2
+
+    if args.replay:
+        path = latest_snapshot() if args.replay == 'latest' else args.replay
+        if path is None:
+            print('no snapshots in ' + snapshot_dir)
+            return 2
+        votesmart.replay_snapshot(path)
+        print('replaying ' + path)
+    elif args.snapshot:
+        print('recording snapshot ' + votesmart.record_snapshot())
+
+    votesmart.share_responses(len(seeders))
+    try:
+        for seeder in updated:
+            if args.update == 'sync':
+                seeder.sync_prep()
+            elif args.update == 'truncate':
+                seeder.regular_update_prep()
+
+        timings, failed, skipped = run_stages(seeders, available, names, args.workers)
+
+        if args.update == 'sync' and not failed:
+            for seeder in updated:
+                seeder.sync_finish()
+    finally:
+        snapshot_stats = votesmart.close_snapshot()
+
+    for name in names:
+        if name in timings:
+            print('{0:<14} started at {1:>8}s  took {2:>8}s  {3}'.format(
+                name, timings[name]['started'], timings[name]['seconds'],
+                ' '.join('{0} {1}s'.format(sink, seconds) for sink, seconds in timings[name]['sinks'].items())))
+        elif name in failed:
+            print('{0:<14} failed'.format(name))
+        else:
+            print('{0:<14} not run'.format(name))
+    lost_writes = 0
+    for sink, seeder in seeders.items():
+        writer = getattr(seeder, sink_writers[sink], None)
+        if writer is not None:
+            writer_report = writer.report()
+            lost_writes += writer_report.get('rejected', 0) + writer_report.get('failed', 0)
+            print('{0} writes: {1}'.format(sink, writer_report))
+        if hasattr(seeder, 'journal'):
+            print('{0} journal: {1}'.format(sink, seeder.journal.report()))
+        if hasattr(seeder, 'indexes'):
+            print('{0} record indexes: {1}'.format(sink, index_stats(seeder.indexes)))
+    print('vote smart memos: {0}'.format(votesmart.memo_stats()))
+    if votesmart.use_cache:
+        print('vote smart cache: {0}'.format(votesmart.cache_stats()))
+    if len(seeders) > 1:
+        print('vote smart responses: {0}'.format(votesmart.share_stats()))
+    if snapshot_stats is not None:
+        print('snapshot: {0}'.format(snapshot_stats))
+    if failed:
+        print('SEEDING FAILED in {0}, not run: {1}'.format(', '.join(failed), ', '.join(skipped) or '-'))
+        return 1
+    if lost_writes:
+        print('SEEDING FAILED: {0} writes rejected or failed, rerun with --resume to redo their units'.format(lost_writes))
+        return 1
+    print('WOMAN UP SEEDING COMPLETE')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
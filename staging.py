@@ -0,0 +1,107 @@
+import itertools
+import json
+import sqlite3
+import threading
+
+
+class StagingStore:
+    ''' local sqlite store a stage writes its documents and reverse links into before publishing them.
+
+    documents are keyed on (stage, collection, vote smart id) and links on
+    (stage, collection, id, field, member), so a link seen twice is stored once.
+    publishing reads every document back and then, for every linked document,
+    all of its links grouped into one map per field.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.duplicate_links = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS documents (
+                stage TEXT NOT NULL,
+                collection TEXT NOT NULL,
+                id TEXT NOT NULL,
+                doc TEXT NOT NULL,
+                PRIMARY KEY (stage, collection, id)
+            )''')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS links (
+                stage TEXT NOT NULL,
+                collection TEXT NOT NULL,
+                id TEXT NOT NULL,
+                field TEXT NOT NULL,
+                member TEXT NOT NULL,
+                PRIMARY KEY (stage, collection, id, field, member)
+            ) WITHOUT ROWID''')
+        self._conn.commit()
+
+    def put(self, stage, collection, document_id, doc):
+        ''' stage a whole document; a later put of the same document replaces it '''
+        with self._lock:
+            self._conn.execute('INSERT OR REPLACE INTO documents VALUES (?, ?, ?, ?)',
+                               (stage, collection, document_id, json.dumps(doc)))
+
+    def link(self, stage, collection, document_id, field, member):
+        ''' stage collection/document_id getting field.member = True '''
+        with self._lock:
+            cursor = self._conn.execute('INSERT OR IGNORE INTO links VALUES (?, ?, ?, ?, ?)',
+                                        (stage, collection, document_id, field, member))
+            if not cursor.rowcount:
+                self.duplicate_links += 1
+
+    def commit(self):
+        with self._lock:
+            self._conn.commit()
+
+    def clear(self, stage=None):
+        with self._lock:
+            if stage is None:
+                self._conn.execute('DELETE FROM documents')
+                self._conn.execute('DELETE FROM links')
+            else:
+                self._conn.execute('DELETE FROM documents WHERE stage = ?', (stage,))
+                self._conn.execute('DELETE FROM links WHERE stage = ?', (stage,))
+            self._conn.commit()
+
+    def documents(self, stage):
+        ''' yield (collection, id, doc) for every document the stage staged '''
+        rows = self._rows('SELECT collection, id, doc FROM documents WHERE stage = ? ORDER BY collection, id', (stage,))
+        for collection, document_id, doc in rows:
+            yield collection, document_id, json.loads(doc)
+
+    def linked(self, stage):
+        ''' yield (collection, id, {field: {member: True}}) once per document the stage linked to '''
+        rows = self._rows('SELECT collection, id, field, member FROM links WHERE stage = ? '
+                          'ORDER BY collection, id, field', (stage,))
+        for (collection, document_id), document_rows in itertools.groupby(rows, key=lambda row: row[:2]):
+            maps = {}
+            for _, _, field, member in document_rows:
+                maps.setdefault(field, {})[member] = True
+            yield collection, document_id, maps
+
+    def _rows(self, sql, params, size=1000):
+        # the cursor is read in slices so other threads can use the connection between them
+        with self._lock:
+            cursor = self._conn.cursor()
+            cursor.execute(sql, params)
+        while True:
+            with self._lock:
+                rows = cursor.fetchmany(size)
+            if not rows:
+                return
+            for row in rows:
+                yield row
+
+    def stats(self, stage=None):
+        where, params = ('WHERE stage = ?', (stage,)) if stage else ('', ())
+        with self._lock:
+            documents = self._conn.execute('SELECT COUNT(*) FROM documents ' + where, params).fetchone()[0]
+            links = self._conn.execute('SELECT COUNT(*) FROM links ' + where, params).fetchone()[0]
+        return {'documents': documents, 'links': links, 'duplicate_links': self.duplicate_links}
+
+    def close(self):
+        with self._lock:
+            self._conn.commit()
+            self._conn.close()
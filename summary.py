@@ -0,0 +1,31 @@
+# CANDIDATE SUMMARY
+# the totals candidate_seed writes to the stats document / summary node:
+# every candidate counted, split by gender and then by election status.
+
+
+def new_summary():
+    return {
+        'total': 0,
+        'female': {
+            'total': 0,
+            'status': {}
+        },
+        'male': {
+            'total': 0,
+            'status': {}
+        }
+    }
+
+def count_candidate(summary, is_female, election_status):
+    summary['total'] += 1
+    gender = summary['female'] if is_female else summary['male']
+    gender['total'] += 1
+    gender['status'][election_status] = gender['status'].get(election_status, 0) + 1
+
+def merge_summary(summary, other):
+    ''' add the counts of other into summary '''
+    summary['total'] += other['total']
+    for gender in ['female', 'male']:
+        summary[gender]['total'] += other[gender]['total']
+        for status, count in other[gender]['status'].items():
+            summary[gender]['status'][status] = summary[gender]['status'].get(status, 0) + count
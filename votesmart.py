@@ -0,0 +1,383 @@
+import asyncio
+import itertools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+from xml.etree import ElementTree
+
+import requests
+from requests.packages.urllib3.util.retry import Retry
+from requests.adapters import HTTPAdapter
+
+import records
+from memo import Memo
+from votesmart_cache import ResponseCache, cache_key
+from votesmart_share import ResponseShare
+from votesmart_snapshot import Snapshot, new_snapshot_path
+
+
+vote_key = os.environ['VOTE_SMART_API_KEY']
+
+# VOTE SMART END POINTS
+# VOTE_SMART_URL points the seeders at another server, e.g. benchmarks/votesmart_server.py
+
+base_vote_url = os.environ.get('VOTE_SMART_URL', 'http://api.votesmart.org').rstrip('/')
+offices_url = base_vote_url + '/Office.getOfficesByType?key=' + vote_key
+states_url = base_vote_url + '/State.getStateIDs?key=' + vote_key
+districts_url = base_vote_url + '/District.getByOfficeState?key=' + vote_key
+elections_state_year_url = base_vote_url + '/Election.getElectionByYearState?key=' + vote_key
+candidates_election_url = base_vote_url + '/Candidates.getByElection?key=' + vote_key
+candidate_bio_url = base_vote_url + '/CandidateBio.getBio?key=' + vote_key
+categories_url = base_vote_url + '/Rating.getCategories?key=' + vote_key
+sig_url = base_vote_url + '/Rating.getSig?key=' + vote_key
+ratings_url = base_vote_url + '/Rating.getSigRatings?key=' + vote_key
+candidate_ratings_url = base_vote_url + '/Rating.getCandidateRating?key=' + vote_key
+candidate_address_url = base_vote_url + '/Address.getOfficeWebAddress?key=' + vote_key
+
+# CONNECTION POOL SETTINGS
+# the pool should hold at least the number of requests made at once, otherwise
+# threads wait for a connection or urllib3 discards the extra ones instead of
+# keeping them alive. unless VOTE_SMART_POOL_SIZE sets it, it follows the other
+# settings: candidate_seed keeps election_streams candidate lists open while
+# each of them fetches bios on fetch_workers threads (as do the addresses and
+# ratings stages, which seed.py runs side by side), and fetch_each keeps
+# max_in_flight requests going.
+
+pool_size = int(os.environ['VOTE_SMART_POOL_SIZE']) if os.environ.get('VOTE_SMART_POOL_SIZE') else None
+request_timeout = float(os.environ.get('VOTE_SMART_TIMEOUT', 30))
+fetch_workers = int(os.environ.get('VOTE_SMART_WORKERS', 8))
+max_in_flight = int(os.environ.get('VOTE_SMART_IN_FLIGHT', 16))
+election_streams = 2
+stream_chunk_size = 16 * 1024
+stream_batch_size = int(os.environ.get('VOTE_SMART_STREAM_BATCH', 50))
+
+# RESPONSE CACHE SETTINGS
+# slow-changing endpoints are served from a local sqlite cache, see votesmart_cache.py.
+# set VOTE_SMART_NO_CACHE (or configure(cache=False)) to always hit the network.
+
+cache_path = os.environ.get('VOTE_SMART_CACHE', '.votesmart_cache.sqlite')
+cache_max_bytes = int(os.environ.get('VOTE_SMART_CACHE_MAX_BYTES', 200 * 1024 * 1024))
+use_cache = not os.environ.get('VOTE_SMART_NO_CACHE')
+
+# SHARED RESPONSES
+# when seed.py seeds several sinks in one run, every response is fetched once and
+# handed to each of them, see votesmart_share.py and share_responses().
+
+share_max_bytes = int(os.environ.get('VOTE_SMART_SHARE_MAX_BYTES', 64 * 1024 * 1024))
+# bios and web addresses already come from one fetch per run (get_bios, get_addresses)
+unshared_endpoints = {'CandidateBio.getBio', 'Address.getOfficeWebAddress'}
+
+_session = None
+_session_lock = threading.Lock()
+_cache = None
+_cache_lock = threading.Lock()
+_share = None
+_snapshot = None
+
+# PER-RUN MEMOS
+# a candidate often runs in several elections (primary, runoff, general); their
+# bio and web addresses are fetched and parsed once per run, see memo.py.
+
+bio_memo = Memo('bios')
+address_memo = Memo('addresses')
+
+# SHARED SESSION REQUEST
+
+def configure(size=None, timeout=None, workers=None, in_flight=None, cache=None):
+    ''' change pool settings; the next request builds a new session with them '''
+    global pool_size, request_timeout, fetch_workers, max_in_flight, use_cache, _session
+    if size is not None:
+        pool_size = size
+    if timeout is not None:
+        request_timeout = timeout
+    if workers is not None:
+        fetch_workers = workers
+    if in_flight is not None:
+        max_in_flight = in_flight
+    if cache is not None:
+        use_cache = cache
+    if _session is not None:
+        _session.close()
+        _session = None
+
+def connection_pool_size():
+    if pool_size is not None:
+        return pool_size
+    return max(max_in_flight, election_streams + election_streams * fetch_workers)
+
+def get_session():
+    ''' returns the long-lived session shared by every seeder, creating it on first use '''
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = _build_session()
+    return _session
+
+def _build_session():
+    s = requests.Session()
+    retries = Retry(total=5,
+                    backoff_factor=0.1,
+                    status_forcelist=[ 500, 502, 503, 504 ])
+    size = connection_pool_size()
+    adapter = HTTPAdapter(pool_connections=size,
+                          pool_maxsize=size,
+                          max_retries=retries)
+    s.mount('http://', adapter)
+    s.mount('https://', adapter)
+    return s
+
+def get_request(url, params=''):
+    share = _share
+    endpoint = urlparse(url).path.strip('/')
+    if share is not None and endpoint not in unshared_endpoints:
+        return share.get(cache_key(endpoint, params), lambda: _get_request(url, params))
+    return _get_request(url, params)
+
+def _get_request(url, params):
+    endpoint = urlparse(url).path.strip('/')
+    key = cache_key(endpoint, params)
+    if _snapshot is not None and _snapshot.replay:
+        return _cached_response(url, _snapshot.get(key))
+    cache = _cache_for(endpoint)
+    if cache is None:
+        r = get_session().get(url, params=params, timeout=request_timeout)
+        _record(endpoint, key, r.status_code, r.content)
+        return r
+
+    body = cache.get(endpoint, key)
+    if body is not None:
+        _record(endpoint, key, 200, body)
+        return _cached_response(url, body)
+    r = get_session().get(url, params=params, timeout=request_timeout)
+    if r.status_code == 200 and _cacheable_body(r.content):
+        cache.put(endpoint, key, r.content)
+    _record(endpoint, key, r.status_code, r.content)
+    return r
+
+# STREAMING XML
+# big list responses (Candidates.getByElection above all) are parsed as they
+# download instead of being read whole and handed to ElementTree.fromstring.
+
+def iter_records(url, tag, params=''):
+    ''' yield each outermost <tag> element of the response as soon as it is parsed.
+
+    an element is detached from the tree once the caller asks for the next one,
+    so memory stays flat however long the response is.
+    '''
+    return parse_stream(_iter_body(url, params), tag)
+
+def parse_stream(chunks, tag):
+    parser = ElementTree.XMLPullParser(events=('start', 'end'))
+    stack = []
+    depth = 0
+    # a None after the last chunk closes the parser, which may release final events
+    for chunk in itertools.chain(chunks, [None]):
+        if chunk is None:
+            parser.close()
+        else:
+            parser.feed(chunk)
+        for event, elem in parser.read_events():
+            if event == 'start':
+                stack.append(elem)
+                if elem.tag == tag:
+                    depth += 1
+                continue
+            stack.pop()
+            if elem.tag != tag:
+                continue
+            depth -= 1
+            if depth == 0:
+                yield elem
+                if stack:
+                    stack[-1].remove(elem)
+
+def iter_chunks(items, size):
+    ''' group a stream into lists of up to size items '''
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def _iter_body(url, params):
+    if _share is not None:
+        # a shared response is held whole for the other sinks anyway
+        yield get_request(url, params).content
+        return
+    endpoint = urlparse(url).path.strip('/')
+    key = cache_key(endpoint, params)
+    if _snapshot is not None and _snapshot.replay:
+        yield _snapshot.get(key)
+        return
+    cache = _cache_for(endpoint)
+    if cache is not None:
+        body = cache.get(endpoint, key)
+        if body is not None:
+            _record(endpoint, key, 200, body)
+            yield body
+            return
+    r = get_session().get(url, params=params, timeout=request_timeout, stream=True)
+    try:
+        # only keep the chunks when the whole body is going into the cache or a snapshot
+        chunks = [] if cache is not None or _snapshot is not None else None
+        for chunk in r.iter_content(stream_chunk_size):
+            if chunks is not None:
+                chunks.append(chunk)
+            yield chunk
+        if chunks is not None and r.status_code == 200:
+            body = b''.join(chunks)
+            if cache is not None and _cacheable_body(body):
+                cache.put(endpoint, key, body)
+            _record(endpoint, key, r.status_code, body)
+    finally:
+        r.close()
+
+# RESPONSE SHARING
+
+def share_responses(consumers):
+    ''' hand every response to this many sinks, fetching it once; 1 (or None) turns sharing off '''
+    global _share
+    _share = ResponseShare(consumers, share_max_bytes) if consumers and consumers > 1 else None
+
+def share_stats():
+    ''' responses fetched and handed on to another sink, or None when not sharing '''
+    return _share.stats() if _share is not None else None
+
+# SNAPSHOTS
+
+def record_snapshot(path=None):
+    ''' keep every response from here on in a new snapshot (see votesmart_snapshot.py); returns its path '''
+    global _snapshot
+    _snapshot = Snapshot(path or new_snapshot_path())
+    return _snapshot.path
+
+def recording():
+    ''' whether a snapshot is being recorded '''
+    # seeders then ask for everything, not just what their sink lacks (learned empty
+    # district pairs, sigs already seeded), so the snapshot replays into a sink in any state
+    return _snapshot is not None and not _snapshot.replay
+
+def replay_snapshot(path):
+    ''' answer every request from a recorded snapshot instead of the network '''
+    global _snapshot
+    _snapshot = Snapshot(path, replay=True)
+
+def close_snapshot():
+    ''' stop recording / replaying; returns the snapshot's stats '''
+    global _snapshot
+    if _snapshot is None:
+        return None
+    snapshot, _snapshot = _snapshot, None
+    stats = snapshot.stats()
+    snapshot.close()
+    return stats
+
+def _record(endpoint, key, status_code, body):
+    if _snapshot is not None and status_code == 200:
+        _snapshot.put(endpoint, key, body)
+
+# RESPONSE CACHE
+
+def get_cache():
+    ''' returns the on-disk response cache, opening it on first use '''
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache(cache_path, cache_max_bytes)
+    return _cache
+
+def cache_stats():
+    return get_cache().stats()
+
+def _cache_for(endpoint):
+    if not use_cache:
+        return None
+    cache = get_cache()
+    return cache if cache.cacheable(endpoint) else None
+
+def _cached_response(url, body):
+    r = requests.models.Response()
+    r.status_code = 200
+    r.url = url
+    r._content = body
+    return r
+
+def _cacheable_body(body):
+    # vote smart answers empty queries with an <error> 'no ... found' body, which is
+    # worth caching (most district pairs are empty), but other errors such as a bad
+    # api key must not be kept around for the endpoint's whole ttl
+    if b'<error>' not in body:
+        return True
+    return b'found' in body.lower()
+
+# CONCURRENT REQUESTS
+
+def fetch_all(url, params_list, workers=None):
+    ''' get url once per params dict on a bounded thread pool, responses come back in input order '''
+    params_list = list(params_list)
+    if not params_list:
+        return []
+    workers = min(workers or fetch_workers, len(params_list))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(lambda params: get_request(url, params), params_list))
+
+# CANDIDATE BIOS AND ADDRESSES
+
+def get_bios(candidate_ids):
+    ''' the bio fields of each candidate (see records.extract_bio), in order, fetched once per run '''
+    return bio_memo.get_many(candidate_ids, _fetch_bios)
+
+def get_addresses(candidate_ids):
+    ''' the web address fields of each candidate, in order, fetched once per run '''
+    return address_memo.get_many(candidate_ids, _fetch_addresses)
+
+def memo_stats():
+    ''' bios / addresses fetched, and requests saved by asking for a candidate again '''
+    return {memo.name: memo.stats() for memo in [bio_memo, address_memo]}
+
+def _fetch_bios(candidate_ids):
+    responses = fetch_all(candidate_bio_url, [{ 'candidateId': candidate_id } for candidate_id in candidate_ids])
+    return [records.extract_bio(ElementTree.fromstring(r.content)) for r in responses]
+
+def _fetch_addresses(candidate_ids):
+    responses = fetch_all(candidate_address_url, [{ 'candidateId': candidate_id } for candidate_id in candidate_ids])
+    return [[records.address.extract(address) for address in ElementTree.fromstring(r.content).iter('address')]
+            for r in responses]
+
+# ASYNCIO FETCH ENGINE
+# requests is blocking, so the engine runs each call on an executor thread and
+# uses a semaphore to cap how many are in flight. handle() runs on the calling
+# thread, one response at a time, so the seeders' write logic needs no locking.
+
+def fetch_each(url, jobs, handle, limit=None):
+    ''' get url for every (key, params) job, calling handle(key, response) as each completes '''
+    asyncio.run(_fetch_each(url, list(jobs), handle, limit or max_in_flight))
+
+async def _fetch_each(url, jobs, handle, limit):
+    if not jobs:
+        return
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(limit)
+    executor = ThreadPoolExecutor(max_workers=limit)
+
+    async def fetch(key, params):
+        async with semaphore:
+            response = await loop.run_in_executor(executor, get_request, url, params)
+        return key, response
+
+    tasks = [loop.create_task(fetch(key, params)) for key, params in jobs]
+    try:
+        for task in asyncio.as_completed(tasks):
+            key, response = await task
+            handle(key, response)
+    finally:
+        # after a failure, the jobs not yet sent are dropped and the ones in flight
+        # are waited for, so none of them is left pending with its exception unread
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        executor.shutdown(wait=True)
@@ -0,0 +1,143 @@
+import os
+import sqlite3
+import threading
+import time
+
+
+DAY = 24 * 60 * 60
+
+# how long a cached response stays fresh, per Vote Smart endpoint.
+# endpoints missing from this table (candidates, candidate ratings, elections,
+# and by default bios and addresses) are volatile and always go to the network.
+endpoint_ttls = {
+    'State.getStateIDs': 30 * DAY,
+    'Office.getOfficesByType': 30 * DAY,
+    'Rating.getCategories': 30 * DAY,
+    'District.getByOfficeState': 30 * DAY,
+    'Rating.getSig': 7 * DAY,
+    'Rating.getSigRatings': 7 * DAY,
+}
+
+# bios and web addresses are fetched once per run anyway (votesmart.get_bios);
+# set VOTE_SMART_BIO_TTL_HOURS to also keep them between runs for that long.
+bio_ttl = float(os.environ.get('VOTE_SMART_BIO_TTL_HOURS', 0)) * 60 * 60
+if bio_ttl:
+    endpoint_ttls['CandidateBio.getBio'] = bio_ttl
+    endpoint_ttls['Address.getOfficeWebAddress'] = bio_ttl
+
+
+# a hit's last_used is kept in memory and written with the next put (or once this
+# many hits are waiting), so reads don't each wait on a commit. eviction order
+# only needs to be about right.
+touch_batch_size = 500
+
+
+class ResponseCache:
+    ''' sqlite backed store of Vote Smart response bodies, evicting least recently used past max_bytes '''
+
+    def __init__(self, path, max_bytes, ttls=None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttls = endpoint_ttls if ttls is None else ttls
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._used = {}
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                endpoint TEXT NOT NULL,
+                body BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                fetched_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            )''')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)')
+        self._conn.commit()
+
+    def cacheable(self, endpoint):
+        return self.ttls.get(endpoint, 0) > 0
+
+    def get(self, endpoint, key):
+        ''' returns the cached body, or None if missing or older than the endpoint's ttl '''
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT body, fetched_at FROM responses WHERE key = ?', (key,)).fetchone()
+            if row is None or now - row[1] > self.ttls.get(endpoint, 0):
+                if row is not None:
+                    # committed with the next put
+                    self._conn.execute('DELETE FROM responses WHERE key = ?', (key,))
+                self.misses += 1
+                return None
+            self._used[key] = now
+            if len(self._used) >= touch_batch_size:
+                self._write_used()
+                self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def _write_used(self):
+        if self._used:
+            self._conn.executemany('UPDATE responses SET last_used = ? WHERE key = ?',
+                                   [(used, key) for key, used in self._used.items()])
+            self._used = {}
+
+    def put(self, endpoint, key, body):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)',
+                (key, endpoint, body, len(body), now, now))
+            self._used.pop(key, None)
+            self._write_used()
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        total = self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        stale = []
+        for key, size in self._conn.execute('SELECT key, size FROM responses ORDER BY last_used'):
+            if total <= self.max_bytes:
+                break
+            stale.append((key,))
+            total -= size
+        self._conn.executemany('DELETE FROM responses WHERE key = ?', stale)
+        self.evictions += len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._used = {}
+            self._conn.execute('DELETE FROM responses')
+            self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            self._write_used()
+            self._conn.commit()
+            entries, size = self._conn.execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses').fetchone()
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'entries': entries,
+            'bytes': size,
+        }
+
+    def close(self):
+        with self._lock:
+            self._write_used()
+            self._conn.commit()
+            self._conn.close()
+
+
+def cache_key(endpoint, params):
+    ''' endpoint plus sorted params, so the same query always maps to the same entry '''
+    if not params:
+        return endpoint
+    return endpoint + '?' + '&'.join('{0}={1}'.format(k, params[k]) for k in sorted(params))
@@ -0,0 +1,85 @@
+import collections
+import threading
+from concurrent.futures import Future
+
+
+class ResponseShare:
+    ''' hands each vote smart response to every sink seeded in the run, fetching it once.
+
+    the first sink to ask for a request fetches it; the others get the same
+    response, waiting for it if it is still in flight, or fetch it themselves if
+    that fetch failed. a response is dropped once all `consumers` sinks have
+    had it. responses a sink never asks for are dropped oldest first past
+    max_bytes, so a stage only one sink runs can't pile up a run's worth of
+    responses.
+    '''
+
+    def __init__(self, consumers, max_bytes):
+        self.consumers = consumers
+        self.max_bytes = max_bytes
+        self.fetched = 0
+        self.shared = 0
+        self.dropped = 0
+        self._entries = collections.OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, fetch):
+        ''' the response for key; fetch() is called by whichever sink asks first '''
+        with self._lock:
+            entry = self._entries.get(key)
+            owner = entry is None
+            if owner:
+                # [future, sinks still to take it, body size once fetched]
+                entry = self._entries[key] = [Future(), self.consumers, 0]
+                self.fetched += 1
+            else:
+                self.shared += 1
+            entry[1] -= 1
+            if entry[1] <= 0:
+                self._forget(key, entry)
+        if not owner:
+            try:
+                return entry[0].result()
+            except Exception:
+                # the owner's fetch failed, so this sink makes its own
+                return fetch()
+
+        try:
+            response = fetch()
+        except Exception as e:
+            # dropped, so later sinks fetch again; the waiting ones fall back to their own fetch
+            with self._lock:
+                self._forget(key, entry)
+            entry[0].set_exception(e)
+            raise
+        entry[0].set_result(response)
+        with self._lock:
+            if self._entries.get(key) is entry:
+                entry[2] = len(response.content)
+                self._bytes += entry[2]
+                self._trim()
+        return response
+
+    def _forget(self, key, entry):
+        if self._entries.get(key) is entry:
+            del self._entries[key]
+            self._bytes -= entry[2]
+
+    def _trim(self):
+        for key, entry in list(self._entries.items()):
+            if self._bytes <= self.max_bytes:
+                return
+            if entry[0].done():
+                self._forget(key, entry)
+                self.dropped += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'fetched': self.fetched,
+                'shared': self.shared,
+                'dropped': self.dropped,
+                'held': len(self._entries),
+                'held_bytes': self._bytes,
+            }
@@ -0,0 +1,122 @@
+import glob
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+
+# SNAPSHOTS
+# a snapshot keeps every vote smart response of one crawl, zlib compressed and
+# keyed like the response cache. replaying it hands the seeders the very same
+# responses without the network, so any sink can be rebuilt from it, and a
+# slow crawl can be written out later (seed.py --snapshot / --replay).
+
+snapshot_version = 1
+snapshot_dir = os.environ.get('VOTE_SMART_SNAPSHOTS', 'snapshots')
+commit_every = 200
+
+
+class SnapshotMiss(KeyError):
+    ''' the replayed crawl never made this request '''
+
+
+class Snapshot:
+    ''' sqlite file of compressed response bodies; recording, or read only for replay '''
+
+    def __init__(self, path, replay=False):
+        self.path = path
+        self.replay = replay
+        self.hits = 0
+        self.misses = 0
+        self.recorded = 0
+        self.raw_bytes = 0
+        self.stored_bytes = 0
+        self._uncommitted = 0
+        self._lock = threading.Lock()
+        if replay:
+            if not os.path.exists(path):
+                raise FileNotFoundError(path)
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._check_version()
+            return
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('''
+            CREATE TABLE responses (
+                key TEXT PRIMARY KEY,
+                endpoint TEXT NOT NULL,
+                body BLOB NOT NULL
+            )''')
+        self._conn.execute('CREATE TABLE meta (name TEXT PRIMARY KEY, value TEXT)')
+        self._set_meta('version', snapshot_version)
+        self._set_meta('started_at', time.strftime('%Y-%m-%dT%H:%M:%S'))
+        self._conn.commit()
+
+    def _set_meta(self, name, value):
+        self._conn.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)', (name, str(value)))
+
+    def meta(self):
+        with self._lock:
+            return dict(self._conn.execute('SELECT name, value FROM meta'))
+
+    def _check_version(self):
+        version = dict(self._conn.execute('SELECT name, value FROM meta')).get('version')
+        if version != str(snapshot_version):
+            raise ValueError('{0} is a version {1} snapshot, this code reads version {2}'.format(
+                self.path, version, snapshot_version))
+
+    def put(self, endpoint, key, body):
+        ''' record a response; the first body recorded for a request is kept '''
+        compressed = zlib.compress(body)
+        with self._lock:
+            cursor = self._conn.execute('INSERT OR IGNORE INTO responses VALUES (?, ?, ?)',
+                                        (key, endpoint, compressed))
+            if cursor.rowcount:
+                self.recorded += 1
+                self.raw_bytes += len(body)
+                self.stored_bytes += len(compressed)
+                self._uncommitted += 1
+                if self._uncommitted >= commit_every:
+                    self._conn.commit()
+                    self._uncommitted = 0
+
+    def get(self, key):
+        ''' the recorded body; raises SnapshotMiss for a request the crawl didn't make '''
+        with self._lock:
+            row = self._conn.execute('SELECT body FROM responses WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                raise SnapshotMiss(key)
+            self.hits += 1
+        return zlib.decompress(row[0])
+
+    def stats(self):
+        with self._lock:
+            if self.replay:
+                return {'path': self.path, 'hits': self.hits, 'misses': self.misses}
+            return {
+                'path': self.path,
+                'recorded': self.recorded,
+                'raw_bytes': self.raw_bytes,
+                'stored_bytes': self.stored_bytes,
+            }
+
+    def close(self):
+        ''' a recorded snapshot is only marked finished here, so one cut short by a crash says so '''
+        with self._lock:
+            if not self.replay:
+                self._set_meta('finished_at', time.strftime('%Y-%m-%dT%H:%M:%S'))
+                self._set_meta('responses', self._conn.execute('SELECT COUNT(*) FROM responses').fetchone()[0])
+                self._conn.commit()
+            self._conn.close()
+
+
+def new_snapshot_path():
+    return os.path.join(snapshot_dir, 'votesmart-{0}.sqlite'.format(time.strftime('%Y%m%d-%H%M%S')))
+
+def latest_snapshot():
+    ''' path of the newest snapshot in snapshot_dir, or None '''
+    paths = sorted(glob.glob(os.path.join(snapshot_dir, 'votesmart-*.sqlite')))
+    return paths[-1] if paths else None